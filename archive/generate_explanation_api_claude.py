@@ -1,13 +1,22 @@
-def process_folder_batch(input_dir, output_dir, api_key, model="claude-3-7-sonnet-20250219"):
+def process_folder_batch(input_dir, output_dir, api_key, model="claude-3-7-sonnet-20250219", use_batch=False,
+                         version="V1"):
+    """
+    Enrichit tous les CSV de `input_dir`.
+
+    `version` (clé de pipeline.PROMPT_BUILDERS) choisit le prompt du mode Message Batches ;
+    le mode appel par appel garde son prompt historique (équivalent de V1).
+    """
     import csv
     import pandas as pd
     import anthropic
     import logging
-    import time
     from tqdm import tqdm
     from pathlib import Path
+    from rate_limiter import AdaptiveRateLimiter, call_with_retries
 
-    client = anthropic.Anthropic(api_key=api_key)
+    # Relances laissées au limiteur (call_with_retries), pas au SDK
+    client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+    limiter = AdaptiveRateLimiter()
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -82,12 +91,26 @@ def process_folder_batch(input_dir, output_dir, api_key, model="claude-3-7-sonne
             return "INVALID"
 
 
+    # === Mode Message Batches : tous les fichiers en un seul batch ===
+    if use_batch:
+        from batch_backend import run_batch_enrichment
+        files = [(csv_file.name, csv_file.read_bytes()) for csv_file in sorted(input_dir.glob("*.csv"))]
+        logging.info(f"📨 Soumission d'un batch pour {len(files)} fichier(s), prompt {version}")
+        outputs = run_batch_enrichment(
+            files, client, version, output_dir=output_dir,
+            on_poll=lambda batch: logging.info(f"Batch {batch.id} : {batch.processing_status}")
+        )
+        for _, csv_path, json_path in outputs:
+            logging.info(f"✅ Exporté : {csv_path} / {json_path}")
+        print("🎉 Traitement batch terminé.")
+        return
+
     # === Liste des modèles disponibles avec la clé API ===
     try:
         available_models = client.models.list()
         logging.info("Modèles disponibles :")
-        for model in available_models.data:
-            logging.info(f"- {model}")
+        for info in available_models.data:
+            logging.info(f"- {info}")
 
     except Exception as e:
         logging.error(f"Erreur lors de la récupération des modèles disponibles : {e}")
@@ -114,13 +137,18 @@ def process_folder_batch(input_dir, output_dir, api_key, model="claude-3-7-sonne
             try:
                 logging.info(f"Traitement de la ligne {idx+1}/{len(df)} : {row['Question'][:60]}...")
                 
-                # Appel à l'API Claude
-                message = client.messages.create(
-                    model="claude-3-7-sonnet-20250219",
-                    max_tokens=256,
-                    temperature=0.3,
-                    messages=[{"role": "user", "content": prompt}]
-                )
+                # Appel à l'API Claude (débit adapté aux en-têtes, relances sur 429/529)
+                def call(lim):
+                    raw = client.messages.with_raw_response.create(
+                        model=model,
+                        max_tokens=256,
+                        temperature=0.3,
+                        messages=[{"role": "user", "content": prompt}]
+                    )
+                    lim.update_from_headers(raw.headers)
+                    return raw.parse()
+
+                message = call_with_retries(call, limiter)
                 explanation = message.content[0].text.strip().replace("\n", " ")
                 df.at[idx, "explanation"] = explanation
                 logging.info(f"Ligne {idx+1} : OK")
@@ -129,8 +157,6 @@ def process_folder_batch(input_dir, output_dir, api_key, model="claude-3-7-sonne
                 logging.error(f"Ligne {idx+1} : erreur API {e}")
                 df.at[idx, "explanation"] = "[ERREUR - API]"
 
-            time.sleep(0.5)
-
         # Sauvegarde du fichier enrichi
         output_file = output_dir / csv_file.name.replace(".csv", "_with_explanations.csv")
         df.to_csv(output_file, sep="$", index=False, header=False, encoding="utf-8")
@@ -0,0 +1,211 @@
+import json
+import time
+from pathlib import Path
+
+from client_pool import ShardedClient, with_sdk_retries
+from explanation_cache import cache_key
+from generation_engine import (MAX_TOKENS, MODEL, TEMPERATURE, build_message_params, existing_explanation,
+                               is_error_explanation, message_text)
+from pipeline import OUTPUT_DIR, generate_prompt, load_question_rows, save_enriched
+from question_index import remember_explanation, reuse_known_explanations
+from run_journal import atomic_write_text, file_hash
+
+
+# Intervalle entre deux interrogations de l'état du batch (secondes)
+DEFAULT_POLL_INTERVAL = 60
+# Nombre maximal de requêtes acceptées dans un Message Batch
+MAX_BATCH_REQUESTS = 100_000
+
+
+def batch_journal_path(output_dir, filename):
+    """Journal <base>.batch.json des batches soumis pour un fichier, à côté de ses sorties."""
+    return Path(output_dir) / f"{Path(filename).stem}.batch.json"
+
+
+def load_batch_journal(path, source_hash, version):
+    """(numéro de fichier des custom_id, identifiants des batches) d'un run interrompu, None si rien à reprendre."""
+    try:
+        record = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    if record.get("source_hash") != source_hash or record.get("version") != version or not record.get("batch_ids"):
+        return None
+    return record["file_no"], record["batch_ids"]
+
+
+def make_custom_id(file_no, idx):
+    """Identifiant d'une requête du batch (format imposé : [a-zA-Z0-9_-]{1,64})."""
+    return f"f{file_no}-r{idx}"
+
+
+def batches_api(client):
+    """Message Batches avec les relances du SDK : ces appels ne passent pas par `call_with_retries`."""
+    if isinstance(client, ShardedClient):
+        # Ses batches passent par la première clé, déjà avec les relances du SDK
+        return client.messages.batches
+    return with_sdk_retries(client).messages.batches
+
+
+def submit_batch(client, prompts_by_id):
+    """Soumet un Message Batch à partir de {custom_id: prompt} et renvoie son identifiant."""
+    batch = batches_api(client).create(
+        requests=[
+            {"custom_id": custom_id, "params": build_message_params(prompt)}
+            for custom_id, prompt in prompts_by_id.items()
+        ]
+    )
+    return batch.id
+
+
+def wait_for_batch(client, batch_id, poll_interval=DEFAULT_POLL_INTERVAL, on_poll=None):
+    """Interroge le batch jusqu'à la fin du traitement ; `on_poll(batch)` reçoit chaque état."""
+    while True:
+        batch = batches_api(client).retrieve(batch_id)
+        if on_poll:
+            on_poll(batch)
+        if batch.processing_status == "ended":
+            return batch
+        time.sleep(poll_interval)
+
+
+def collect_results(client, batch_id, metrics=None):
+    """Renvoie {custom_id: explication ou marqueur d'erreur} pour un batch terminé."""
+    results = {}
+    for entry in batches_api(client).results(batch_id):
+        result = entry.result
+        if metrics is not None:
+            metrics.record_call(None, getattr(getattr(result, "message", None), "usage", None),
+                                outcome="batch" if result.type == "succeeded" else "error")
+        if result.type == "succeeded":
+            results[entry.custom_id] = message_text(result.message)
+        elif result.type == "errored":
+            results[entry.custom_id] = f"[ERREUR - batch : {getattr(result, 'error', 'erreur inconnue')}]"
+        else:
+            # canceled / expired
+            results[entry.custom_id] = f"[ERREUR - batch : requête {result.type}]"
+    return results
+
+
+def run_batch_enrichment(files, client, version, output_dir=OUTPUT_DIR, cache=None,
+                         poll_interval=DEFAULT_POLL_INTERVAL, on_poll=None, metrics=None, question_index=None,
+                         incremental=True):
+    """
+    Enrichit plusieurs fichiers CSV en un seul Message Batch.
+
+    Les identifiants des batches soumis sont écrits dans <base>.batch.json à côté des sorties
+    avant l'attente, et ce journal est supprimé une fois les sorties écrites. Si le processus
+    redémarre pendant l'attente (jusqu'à 24 h), un nouveau run sur le même fichier et le même
+    prompt relit ces batches (`retrieve` / `results`) au lieu de les soumettre et payer à nouveau.
+
+    Args:
+        files (list): Liste de (nom_de_fichier, contenu en bytes)
+        client: Client Anthropic
+        version (str): Version du prompt ("V1" ou "V2")
+        output_dir (Path): Dossier des fichiers _enriched.csv / .json
+        cache (ExplanationCache): Les prompts déjà en cache ne sont pas soumis
+        poll_interval (float): Secondes entre deux interrogations du batch
+        on_poll (callable): Reçoit l'objet batch à chaque interrogation
+        metrics (RunMetrics): Mesures du run (tokens, lignes terminées, coût estimé)
+        question_index (QuestionIndex): Les questions quasi identiques à une question déjà
+            expliquée reprennent son explication sans être soumises
+        incremental (bool): Les explications déjà présentes dans un CSV enrichi (8e champ)
+            sont conservées ; seules les lignes vides ou en erreur sont soumises
+
+    Returns:
+        list: (nom_de_fichier, chemin CSV, chemin JSON) dans l'ordre de `files`
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    parsed = []
+    explanations = {}
+    to_submit = {}
+    keys = {}
+    rows = {}
+    # {custom_id: (numéro du fichier, index de la ligne)} des lignes à soumettre
+    targets = {}
+    # Fichiers dont un run interrompu a déjà soumis les lignes : {numéro: (numéro dans les custom_id, batches)}
+    resumed = {}
+    for file_no, (filename, file_bytes) in enumerate(files):
+        lines = load_question_rows(file_bytes, filename)
+        existing = {}
+        if incremental:
+            existing = {idx: line[7].strip() for idx, line in enumerate(lines) if existing_explanation(line)}
+        lines = [line[:7] for line in lines]
+        journal = batch_journal_path(output_dir, filename)
+        parsed.append((filename, lines, journal))
+        previous = load_batch_journal(journal, file_hash(file_bytes), version)
+        if previous is not None:
+            resumed[file_no] = previous
+        reused = {}
+        if question_index is not None:
+            missing = [idx for idx in range(len(lines)) if idx not in existing]
+            reused = reuse_known_explanations(question_index, lines, missing, version)
+        for idx, line in enumerate(lines):
+            custom_id = make_custom_id(file_no, idx)
+            if idx in existing:
+                explanations[custom_id] = existing[idx]
+                continue
+            if idx in reused:
+                explanations[custom_id] = reused[idx]
+                if metrics is not None:
+                    metrics.record_call(None, outcome="reuse")
+                continue
+            prompt = generate_prompt(line, version)
+            if prompt == "INVALID":
+                explanations[custom_id] = f"[ERREUR - Prompt non généré à la ligne {idx+1}]"
+                continue
+            if cache is not None:
+                keys[custom_id] = cache_key(prompt, MODEL, TEMPERATURE, MAX_TOKENS)
+                cached = cache.get(keys[custom_id])
+                if cached is not None:
+                    explanations[custom_id] = cached
+                    if metrics is not None:
+                        metrics.record_call(None, outcome="cache")
+                    continue
+            to_submit[custom_id] = prompt
+            rows[custom_id] = line
+            targets[custom_id] = (file_no, idx)
+
+    # Les lignes d'un fichier repris ne sont pas resoumises : on relit le batch déjà payé
+    ids = [custom_id for custom_id in to_submit if targets[custom_id][0] not in resumed]
+    new_batch_ids = [
+        submit_batch(client, {custom_id: to_submit[custom_id] for custom_id in ids[i:i + MAX_BATCH_REQUESTS]})
+        for i in range(0, len(ids), MAX_BATCH_REQUESTS)
+    ]
+    # Identifiants écrits avant l'attente (jusqu'à 24 h) : un redémarrage reprend ces batches
+    for file_no in sorted({targets[custom_id][0] for custom_id in ids}):
+        atomic_write_text(parsed[file_no][2], json.dumps({
+            "source_hash": file_hash(files[file_no][1]), "version": version, "file_no": file_no,
+            "batch_ids": new_batch_ids,
+        }))
+
+    batch_results = {}
+    waiting_files = {file_no for file_no, _ in targets.values()}
+    resumed_batch_ids = [batch_id for file_no, (_, batch_ids) in resumed.items() if file_no in waiting_files
+                         for batch_id in batch_ids]
+    for batch_id in dict.fromkeys(new_batch_ids + resumed_batch_ids):
+        wait_for_batch(client, batch_id, poll_interval=poll_interval, on_poll=on_poll)
+        batch_results[batch_id] = collect_results(client, batch_id, metrics)
+
+    for custom_id in to_submit:
+        file_no, idx = targets[custom_id]
+        # Un fichier repris a été soumis sous son numéro du run interrompu
+        source_no, batch_ids = resumed.get(file_no, (file_no, new_batch_ids))
+        source_id = make_custom_id(source_no, idx)
+        found = [batch_results[batch_id][source_id] for batch_id in batch_ids
+                 if source_id in batch_results[batch_id]]
+        explanation = found[0] if found else "[ERREUR - batch : résultat manquant]"
+        explanations[custom_id] = explanation
+        if cache is not None and found and not is_error_explanation(explanation):
+            cache.put(keys[custom_id], explanation)
+        if question_index is not None:
+            remember_explanation(question_index, rows[custom_id], version, explanation)
+
+    outputs = []
+    for file_no, (filename, lines, journal) in enumerate(parsed):
+        enriched = [line + [explanations[make_custom_id(file_no, idx)]] for idx, line in enumerate(lines)]
+        csv_path, json_path = save_enriched(Path(filename).stem, enriched, output_dir)
+        journal.unlink(missing_ok=True)
+        outputs.append((filename, csv_path, json_path))
+        if metrics is not None:
+            metrics.record_rows(len(lines))
+    return outputs
@@ -0,0 +1,151 @@
+"""
+Banc de mesure du débit de génération contre le serveur Anthropic simulé, sans coût ni quota.
+
+Usage :
+    python benchmark.py --concurrency 1 4 8 16 --rows 50 200 --latency 1.5 --latency-dist lognormal
+
+Pour chaque niveau de concurrence et chaque taille de fichier, `process_csv_bytes` enrichit
+un CSV synthétique ; `get_explanation` (comparateur) est mesuré appel par appel. Chaque
+mesure reçoit son propre limiteur, sans cache ni index de questions, et les sorties vont
+dans un dossier temporaire ; les résultats sont écrits dans benchmarks/benchmark_<horodatage>.json.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from client_pool import make_client
+from comparator import get_explanation
+from enrichment import process_csv_bytes
+from generation_engine import MODEL
+from mock_anthropic_server import start_mock_server
+from pipeline import prompt_v2
+from rate_limiter import AdaptiveRateLimiter
+from run_metrics import RunMetrics, percentile
+
+
+BENCHMARK_DIR = Path("benchmarks")
+
+
+def synthetic_csv(rows, parts=5, seed=""):
+    """CSV BIA ($) de `rows` questions distinctes réparties en `parts` parties."""
+    lines = ["question$a$b$c$d$reponse$image"]
+    numbers = {}
+    for n in range(rows):
+        # Parties consécutives, comme dans une vraie annale (les requêtes groupées ne mélangent pas deux parties)
+        part = n * parts // rows + 1
+        number = numbers[part] = numbers.get(part, 0) + 1
+        lines.append(f"{part}.{number} Question de test {seed}{n} sur la portance de l'aile ?"
+                     f"$Réponse A{n}$Réponse B{n}$Réponse C{n}$Réponse D{n}${'ABCD'[n % 4]}$")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def bench_file(client, rows, concurrency, output_dir, limiter, pack_size=1):
+    """Enrichit un fichier synthétique et renvoie le résumé RunMetrics complété du débit en lignes/s."""
+    metrics = RunMetrics(MODEL)
+    start = time.perf_counter()
+    process_csv_bytes(synthetic_csv(rows, seed=f"c{concurrency}p{pack_size}-"), f"bench_{rows}_{concurrency}.csv",
+                      client, "V2", max_in_flight=concurrency, use_cache=False, resume=False, metrics=metrics,
+                      pack_size=pack_size, reuse_similar=False, output_dir=output_dir, limiter=limiter)
+    elapsed = time.perf_counter() - start
+    metrics.finish()
+    summary = metrics.summary()
+    summary["rows_per_s"] = round(rows / elapsed, 2) if elapsed > 0 else None
+    return summary
+
+
+def bench_comparator(client, calls, limiter):
+    """Latences de `get_explanation` sur des questions distinctes (sans cache)."""
+    latencies = []
+    for n in range(calls):
+        start = time.perf_counter()
+        get_explanation(prompt_v2(f"Question de comparaison {n} ?", f"Réponse {n}"), client, limiter,
+                        use_cache=False)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "calls": calls,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+    }
+
+
+def run_benchmark(concurrency_levels, row_counts, pack_size=1, comparator_calls=20, work_dir=None,
+                  **server_options):
+    """Lance le serveur simulé et mesure chaque combinaison ; les sorties vont dans `work_dir` (temporaire par défaut)."""
+    owned = work_dir is None
+    work_dir = Path(tempfile.mkdtemp(prefix="bia-bench-") if owned else work_dir)
+    server, url = start_mock_server(**server_options)
+    # make_client désactive les relances du SDK : les relances mesurées sont celles de rate_limiter
+    client = make_client("test", base_url=url)
+    results = {"server": server_options, "pack_size": pack_size, "runs": []}
+    try:
+        for rows in row_counts:
+            for concurrency in concurrency_levels:
+                # Limiteur neuf par mesure, pour ne pas hériter des pauses d'un run précédent
+                limiter = AdaptiveRateLimiter(server.state.requests_per_minute)
+                before = server.state.snapshot()
+                summary = bench_file(client, rows, concurrency, work_dir, limiter, pack_size)
+                after = server.state.snapshot()
+                run = {
+                    "rows": rows,
+                    "concurrency": concurrency,
+                    "rows_per_s": summary["rows_per_s"],
+                    "latency_p50_s": summary["latency_p50_s"],
+                    "latency_p95_s": summary["latency_p95_s"],
+                    "latency_p99_s": summary["latency_p99_s"],
+                    "retries": summary["retries"],
+                    "errors": summary["errors"],
+                    "server_requests": after["requests"] - before["requests"],
+                    "server_throttled": after["throttled"] - before["throttled"],
+                }
+                results["runs"].append(run)
+                print(f"{rows:>6} lignes × {concurrency:>3} en vol : {run['rows_per_s']} lignes/s, "
+                      f"p50 {run['latency_p50_s']} s, p95 {run['latency_p95_s']} s, "
+                      f"{run['server_throttled']} × 429, {run['errors']} erreur(s)")
+        if comparator_calls:
+            results["comparator"] = bench_comparator(client, comparator_calls,
+                                                     AdaptiveRateLimiter(server.state.requests_per_minute))
+            print(f"Comparateur : p50 {results['comparator']['latency_p50_s']} s, "
+                  f"p95 {results['comparator']['latency_p95_s']} s")
+        results["tokens"] = server.state.snapshot()
+    finally:
+        server.shutdown()
+        if owned:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure du débit de génération contre le serveur simulé")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--pack-size", type=int, default=1)
+    parser.add_argument("--comparator-calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0, help="Latence (médiane) par appel (s)")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-latency", type=float, default=30.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Part de 429 injectées")
+    parser.add_argument("--rpm", type=int, default=4000, help="Quota simulé de requêtes par minute")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        args.concurrency, args.rows, pack_size=args.pack_size, comparator_calls=args.comparator_calls,
+        latency=args.latency, latency_dist=args.latency_dist, latency_sigma=args.latency_sigma,
+        stall_rate=args.stall_rate, stall_latency=args.stall_latency, error_rate=args.error_rate,
+        requests_per_minute=args.rpm, seed=args.seed,
+    )
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    path = BENCHMARK_DIR / f"benchmark_{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Résultats : {path}")
+
+
+if __name__ == "__main__":
+    main()
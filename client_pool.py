@@ -0,0 +1,183 @@
+import re
+import threading
+
+import anthropic
+import httpx
+
+from rate_limiter import (THROTTLE_STATUS, AdaptiveRateLimiter, CircuitBreaker, error_headers, error_status,
+                          parse_retry_after, request_tokens)
+
+
+# Connexions HTTP gardées ouvertes par client (au-delà du nombre maximal de requêtes simultanées de l'UI)
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE = 32
+# Durée de vie d'une connexion inactive (s)
+KEEPALIVE_EXPIRY = 60.0
+# Relances du SDK pour les appels qui ne passent pas par rate_limiter.call_with_retries (Message Batches)
+SDK_MAX_RETRIES = 2
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def parse_api_keys(text):
+    """Liste des clés saisies (séparées par des virgules, espaces ou retours à la ligne), sans doublon."""
+    keys = []
+    for key in re.split(r"[\s,;]+", text or ""):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def make_client(api_key, base_url=None):
+    """
+    Client Anthropic avec un pool de connexions keep-alive dimensionné pour les requêtes parallèles.
+
+    `base_url` permet de viser le serveur simulé (mock_anthropic_server.py). Les relances du SDK
+    sont désactivées : un 429/529 doit remonter jusqu'à `rate_limiter.call_with_retries` (pause
+    globale, isolement de la clé dans ShardedClient, relances comptées dans RunMetrics).
+    """
+    http_client = anthropic.DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                            keepalive_expiry=KEEPALIVE_EXPIRY)
+    )
+    return anthropic.Anthropic(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+
+
+def with_sdk_retries(client):
+    """
+    Même client (mêmes connexions) avec les relances du SDK réactivées.
+
+    Pour les appels hors de `call_with_retries` : sans elles, un 429/529 transitoire
+    y serait une erreur définitive.
+    """
+    return client.with_options(max_retries=SDK_MAX_RETRIES)
+
+
+def warm_up(client):
+    """Ouvre une connexion (DNS + TLS) en arrière-plan avec une requête gratuite, sans attendre la réponse."""
+    def ping():
+        try:
+            client.models.list(limit=1)
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=ping, daemon=True)
+    thread.start()
+    return thread
+
+
+def get_client(api_key):
+    """
+    Client partagé par tout le processus pour cette clé (créé et préchauffé au premier appel).
+
+    Chaque clé a son propre limiteur (`client.limiter`, utilisé par le moteur de génération) :
+    un 429 ou les en-têtes de débit d'une clé ne ralentissent pas les autres.
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = make_client(api_key)
+            client.limiter = AdaptiveRateLimiter()
+            warm_up(client)
+        return client
+
+
+def get_pooled_client(api_keys):
+    """
+    Client partagé pour une ou plusieurs clés : au-delà d'une clé, les requêtes sont réparties entre elles.
+
+    Lève ValueError si aucune clé n'est fournie (saisie vide ou faite uniquement de séparateurs).
+    """
+    if isinstance(api_keys, str):
+        api_keys = parse_api_keys(api_keys)
+    if not api_keys:
+        raise ValueError("❌ Aucune clé API dans la saisie.")
+    if len(api_keys) == 1:
+        return get_client(api_keys[0])
+    with _clients_lock:
+        client = _clients.get(tuple(api_keys))
+    if client is None:
+        client = ShardedClient([get_client(key) for key in api_keys])
+        with _clients_lock:
+            client = _clients.setdefault(tuple(api_keys), client)
+    return client
+
+
+class _ShardLimiter(AdaptiveRateLimiter):
+    """
+    Limiteur d'un client multi-clés : le débit est géré clé par clé dans ShardedClient,
+    il ne garde donc que le disjoncteur et le calcul du backoff.
+    """
+
+    def __init__(self, shards, breaker=None):
+        super().__init__(breaker=breaker)
+        self._shards = shards
+
+    def acquire(self, input_tokens=0, output_tokens=0):
+        pass
+
+    def pause(self, seconds):
+        pass
+
+    def update_from_headers(self, headers):
+        pass
+
+    def observed_rpm(self):
+        """Somme des limites des clés, None tant qu'aucune clé n'a reçu de réponse."""
+        limits = [limiter.observed_rpm() for _, limiter in self._shards]
+        if all(limit is None for limit in limits):
+            return None
+        return sum(limit or limiter.capacity for limit, (_, limiter) in zip(limits, self._shards))
+
+
+class ShardedClient:
+    """
+    Plusieurs clés API derrière un seul client.
+
+    Chaque requête Messages part sur la clé qui a le plus de marge dans son propre seau
+    (recalé sur ses en-têtes `anthropic-ratelimit-*`) ; un 429 ne suspend que la
+    clé concernée. Le moteur de génération utilise `client.limiter` à la place du limiteur
+    partagé. Les Message Batches passent par la première clé.
+    """
+
+    def __init__(self, clients):
+        # Une clé saisie seule ailleurs (onglet, session) garde le même seau
+        self.shards = [(client, getattr(client, "limiter", None) or AdaptiveRateLimiter()) for client in clients]
+        self.limiter = _ShardLimiter(self.shards, breaker=CircuitBreaker())
+        self.messages = _ShardedMessages(self)
+        self.models = clients[0].models
+
+    def pick(self):
+        """(client, limiteur) de la clé qui a le plus de requêtes disponibles."""
+        return max(self.shards, key=lambda shard: shard[1].headroom())
+
+    def create_raw(self, **params):
+        client, limiter = self.pick()
+        limiter.acquire(*request_tokens(params))
+        try:
+            raw = client.messages.with_raw_response.create(**params)
+        except Exception as e:
+            if error_status(e) in THROTTLE_STATUS:
+                limiter.pause(parse_retry_after(error_headers(e)) or limiter.backoff_delay(0))
+            raise
+        limiter.update_from_headers(raw.headers)
+        return raw
+
+
+class _ShardedMessages:
+    def __init__(self, owner):
+        self._owner = owner
+        self.with_raw_response = _ShardedRawMessages(owner)
+        self.batches = with_sdk_retries(owner.shards[0][0]).messages.batches
+
+    def create(self, **params):
+        return self._owner.create_raw(**params).parse()
+
+
+class _ShardedRawMessages:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **params):
+        return self._owner.create_raw(**params)
@@ -0,0 +1,238 @@
+import csv
+import hashlib
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from client_pool import get_pooled_client
+from explanation_cache import get_default_cache
+from generation_engine import call_claude_with_retries, is_error_explanation
+from pipeline import PROMPT_BUILDERS, prompt_template, row_question_answer
+
+
+# Nombre de questions suivantes préparées pendant que l'évaluateur lit la question courante
+PREFETCH_AHEAD = 3
+# Délai commun (secondes) laissé à l'ensemble des prompts d'une question
+COMPARE_TIMEOUT = 60
+# Libellés des explications affichées côte à côte
+VOTE_LETTERS = ["🅰️", "🅱️", "Ⓒ", "Ⓓ", "Ⓔ", "Ⓕ"]
+# Un libellé par prompt affiché : au-delà, la comparaison est refusée
+MAX_COMPARED_PROMPTS = len(VOTE_LETTERS)
+
+
+def get_explanation(prompt, client, limiter=None, use_cache=True):
+    """Explication d'un prompt pour le comparateur (marqueur d'erreur plutôt qu'une exception)."""
+    try:
+        return call_claude_with_retries(client, prompt, limiter, cache=get_default_cache() if use_cache else None)
+    except Exception as e:
+        return f"[Erreur API : {e}]"
+
+
+def check_compared_prompts(prompts):
+    """Lève ValueError si `prompts` ({version: constructeur}) dépasse le nombre de libellés de vote."""
+    if len(prompts) > MAX_COMPARED_PROMPTS:
+        raise ValueError(f"❌ {len(prompts)} prompts à comparer : {MAX_COMPARED_PROMPTS} au maximum "
+                         f"(un libellé de VOTE_LETTERS par prompt).")
+
+
+def votable(explanation):
+    """Une explication en erreur (API, délai dépassé) ne peut pas être choisie."""
+    return not is_error_explanation(explanation)
+
+
+def upload_hash(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class PairPrefetcher:
+    """
+    Mémorise les explications du comparateur par clé (empreinte du fichier, index, version).
+
+    Un rerun Streamlit retrouve l'explication déjà demandée au lieu de la repayer, et les
+    questions suivantes sont générées en arrière-plan par un pool de threads. Une réponse
+    en erreur n'est gardée que jusqu'à `discard_failed` (bouton « Réessayer »).
+    """
+
+    def __init__(self, max_workers=8):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """Lance `fn(*args)` pour `key` si ce n'est pas déjà fait, et renvoie le future associé."""
+        with self._lock:
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(fn, *args)
+            return self._futures[key]
+
+    def discard_failed(self, keys):
+        """Oublie les résultats en erreur de `keys` : le prochain `submit` rappelle l'API."""
+        with self._lock:
+            for key in keys:
+                future = self._futures.get(key)
+                if future is not None and future.done() and not votable(future.result()):
+                    del self._futures[key]
+
+    def shutdown(self):
+        """Abandonne les générations en attente et libère les threads du pool."""
+        with self._lock:
+            self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def collect_variants(futures, timeout=COMPARE_TIMEOUT):
+    """
+    Attend les explications {version: future} lancées en parallèle, avec un délai commun.
+
+    Une version encore en cours à l'échéance est affichée comme expirée ; son future
+    continue de tourner et son résultat sera repris au prochain rerun.
+    """
+    wait(list(futures.values()), timeout=timeout)
+    return {
+        version: future.result() if future.done() else f"[Erreur API : pas de réponse après {timeout} s]"
+        for version, future in futures.items()
+    }
+
+
+def connect(api_key):
+    """Client partagé pour `api_key`, None (avec un message d'erreur) si la saisie est refusée."""
+    if not api_key:
+        return None
+    # Client partagé par clé : la connexion est ouverte dès la saisie, avant le premier appel
+    try:
+        return get_pooled_client(api_key)
+    except ValueError as e:
+        st.error(str(e))
+        return None
+
+
+def reset_comparison():
+    """Repart de la première question et arrête les générations préparées à l'avance."""
+    st.session_state.index = 0
+    st.session_state.lines = []
+    st.session_state.scores = []
+    st.session_state.orders = {}
+    prefetcher = st.session_state.pop("prefetcher", None)
+    if prefetcher is not None:
+        prefetcher.shutdown()
+
+
+def render_comparator(client, uploaded, prompts=PROMPT_BUILDERS, forget_selection=False):
+    """
+    Comparateur à l'aveugle des prompts `prompts` ({version: constructeur}) sur le CSV `uploaded`.
+
+    Les explications de la question courante et des PREFETCH_AHEAD suivantes sont demandées
+    en parallèle ; les votes s'accumulent dans st.session_state et le prompt préféré est
+    écrit dans selected_prompt.txt à la fin de la comparaison. Avec `forget_selection`,
+    « Recommencer » efface aussi ce fichier.
+    """
+    check_compared_prompts(prompts)
+    if "index" not in st.session_state:
+        reset_comparison()
+    if "prefetcher" not in st.session_state:
+        st.session_state.prefetcher = PairPrefetcher()
+        st.session_state.orders = {}
+
+    if not st.session_state.lines:
+        lines = list(csv.reader(uploaded.getvalue().decode("utf-8").splitlines(), delimiter="$"))
+        if lines and "question" in lines[0][0].lower():
+            lines = lines[1:]
+        st.session_state.lines = lines
+
+    lines = st.session_state.lines
+    index = st.session_state.index
+    total = len(lines)
+    prefetcher = st.session_state.prefetcher
+    file_key = upload_hash(uploaded.getvalue())
+
+    def request_pair(i):
+        """Lance (ou retrouve) en parallèle la génération des explications de chaque prompt pour la question i."""
+        qa = row_question_answer(lines[i])
+        if qa is None:
+            return None
+        return {
+            version: prefetcher.submit((file_key, i, version), get_explanation, build(*qa), client)
+            for version, build in prompts.items()
+        }
+
+    # La question courante passe en tête de file, les suivantes sont préparées pendant sa lecture
+    if index < total:
+        request_pair(index)
+    for ahead in range(index + 1, min(total, index + 1 + PREFETCH_AHEAD)):
+        request_pair(ahead)
+
+    if index < total and row_question_answer(lines[index]) is None:
+        st.warning(f"❌ Mauvais format de réponse à la question {index+1}, question ignorée")
+        if st.button("Question suivante ➡️", key=f"skip{index}"):
+            st.session_state.index += 1
+            st.rerun()
+    elif index < total:
+        q_text, answer = row_question_answer(lines[index])
+        futures = request_pair(index)
+        with st.spinner("🧠 Claude génère les explications..."):
+            # Tous les prompts tournent en même temps : l'attente est celle de l'appel le plus lent
+            explanations = collect_variants(futures, timeout=COMPARE_TIMEOUT)
+
+        # Ordre d'affichage tiré une seule fois par question, pour que le vote corresponde à ce qui est affiché
+        if index not in st.session_state.orders:
+            st.session_state.orders[index] = random.sample(list(explanations), len(explanations))
+        pair = [(f"Prompt {version}", explanations[version]) for version in st.session_state.orders[index]]
+
+        st.markdown(f"### Question {index+1}/{total} :")
+        st.markdown(f"**{q_text}**")
+        st.markdown(f"✅ Réponse correcte : **{answer}**")
+        # Pas de vote tant qu'une explication manque : la comparaison serait faussée
+        complete = all(votable(explanation) for _, explanation in pair)
+        for pos, col in enumerate(st.columns(len(pair))):
+            with col:
+                if not votable(pair[pos][1]):
+                    st.error(f"{VOTE_LETTERS[pos]} {pair[pos][1]}")
+                    continue
+                st.markdown(f"{VOTE_LETTERS[pos]} {pair[pos][1]}")
+                if complete and st.button(f"Je préfère {VOTE_LETTERS[pos]}", key=f"vote{pos}_{index}"):
+                    st.session_state.scores.append(pair[pos][0])
+                    st.session_state.index += 1
+                    st.rerun()
+        if not complete:
+            st.warning("⚠️ Une explication n'a pas pu être obtenue : réessaie, ou passe la question (elle ne compte pas dans les votes)")
+            col_retry, col_skip = st.columns(2)
+            if col_retry.button("🔁 Réessayer", key=f"retry{index}"):
+                prefetcher.discard_failed([(file_key, index, version) for version in prompts])
+                st.rerun()
+            if col_skip.button("Question suivante ➡️", key=f"skip_errors{index}"):
+                st.session_state.index += 1
+                st.rerun()
+    else:
+        st.success("🎉 Comparaison terminée ! Résultat :")
+        votes = {version: st.session_state.scores.count(f"Prompt {version}") for version in prompts}
+        for version, count in votes.items():
+            st.markdown(f"{'🧪' if version == 'V1' else '🎓'} Prompt {version} : {count} vote(s)")
+
+        # En cas d'égalité, le premier prompt l'emporte
+        best = max(votes, key=votes.get)
+        if list(votes.values()).count(votes[best]) > 1:
+            st.markdown("🤝 Égalité parfaite")
+        else:
+            st.markdown(f"🏆 **Prompt {best} préféré**")
+
+        # 🔍 Affichage explicite des prompts utilisés
+        with st.expander("🧠 Afficher les formulations des prompts utilisés", expanded=False):
+            for version in prompts:
+                st.markdown(f"### Prompt {version} utilisé :")
+                st.code(prompt_template(version), language="markdown")
+
+        # Sauvegarde
+        with open("selected_prompt.txt", "w", encoding="utf-8") as f:
+            f.write(best)
+
+        st.markdown(f"🔍 Prompt préféré utilisé pour la génération future : **{best}**")
+
+        if st.button("🔄 Recommencer"):
+            reset_comparison()
+            # Réinitialiser le fichier sélection
+            if forget_selection and os.path.exists("selected_prompt.txt"):
+                os.remove("selected_prompt.txt")
+            st.rerun()
@@ -1,157 +1,26 @@
 import streamlit as st
-import csv
-import json
 import os
 import zipfile
-import random
 import io
 from pathlib import Path
-import anthropic
 import shutil
-import time
 import chardet
+from client_pool import get_pooled_client
+from comparator import connect, render_comparator
+from enrichment import output_key, process_csv_bytes, run_enrichment_job  # noqa: F401 (process_csv_bytes réexporté)
+from explanation_cache import get_default_cache
+from generation_engine import DEFAULT_MAX_IN_FLIGHT
+from hedging import HEDGE_BUDGET, HedgePolicy
+from job_runner import JOB_POLL_INTERVAL, get_default_runner
+from pipeline import HTML_TEMPLATE_PATH, OUTPUT_DIR, PROMPT_BUILDERS, get_selected_prompt, render_quiz_html
+from preflight import estimate_run
+from repair import repair_key, run_repair_job, scan_outputs
 
 
 # Chargement du template HTML une seule fois
-HTML_TEMPLATE_PATH = Path("loic.html")
 html_template = HTML_TEMPLATE_PATH.read_text(encoding="utf-8")
 
 
-# ======================== PROMPTS ============================
-def prompt_v1(question, answer):
-    return (
-        f"Explique de manière scientifique et précise, en 2 à 3 phrases adaptées au niveau d'un élève de 3e, "
-        f"pourquoi la réponse suivante est correcte : "
-        f"Question : {question} "
-        f"Réponse correcte : {answer} "
-        f"Ta réponse ne doit contenir que l'explication, sans retour à la ligne ni remarque supplémentaire."
-    )
-
-def prompt_v2(question, answer):
-    return (
-        "Tu es un professeur en aéronautique chargé d'aider un élève de 3e qui prépare le Brevet d’Initiation Aéronautique (BIA). "
-        "Explique en 2 à 3 phrases pourquoi la réponse suivante est scientifiquement correcte, en utilisant les termes techniques vus dans le cadre du BIA "
-        "et adaptés à un jeune public, et en vulgarisant si nécessaire. "
-        "L’explication doit être concise, rigoureuse, sans retour à la ligne ni mention des mauvaises réponses. "
-        f"Voici la question et sa bonne réponse :\n"
-        f"Question : {question}\nBonne réponse : {answer}\n"
-        "Réponds uniquement par l’explication finale à afficher dans un QCM en ligne."
-    )
-
-def get_explanation(prompt, client):
-    try:
-        response = client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=256,
-            temperature=0.3,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.content[0].text.strip().replace("\n", " ")
-    except Exception as e:
-        return f"[Erreur API : {e}]"
-
-# ============ UTILITAIRES CSV/JSON POUR LA GÉNÉRATION ============
-def clean_image(image_field):
-    if isinstance(image_field, str) and image_field.strip().lower() in ["", "none", "null", "nan", "undefined"]:
-        return None
-    return image_field.strip()
-
-def parse_csv_line(line, expected_fields=8):
-    while len(line) < expected_fields:
-        line.append("")
-    return {
-        "question": line[0].strip(),
-        "a": line[1].strip(),
-        "b": line[2].strip(),
-        "c": line[3].strip(),
-        "d": line[4].strip(),
-        "correct": line[5].strip().upper(),
-        "image": clean_image(line[6]),
-        "explanation": line[7].strip()
-    }
-
-def get_selected_prompt():
-    try:
-        with open("selected_prompt.txt", "r", encoding="utf-8") as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        return "V1"  # Valeur par défaut
-
-
-
-def generate_prompt(row, version):
-    correct_letter = row[5].strip().upper()
-    if correct_letter not in ['A', 'B', 'C', 'D']:
-        return "INVALID"
-    answer_text = row["ABCDE".index(correct_letter)+1].strip()
-    question_text = row[0].strip()
-    if not question_text or not answer_text:
-        return "INVALID"
-    return prompt_v1(question_text, answer_text) if version == "V1" else prompt_v2(question_text, answer_text)
-
-import csv
-
-def detect_delimiter(header_line):
-    """Détecte automatiquement le séparateur entre $ et ,"""
-    if header_line.count("$") > 2:
-        return "$"
-    elif header_line.count(",") > 2:
-        return ","
-    else:
-        return None
-
-def process_csv_bytes(file_bytes, filename, client, version):
-    OUTPUT_DIR = Path("out")
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    base_name = Path(filename).stem
-
-    raw_lines = file_bytes.decode("utf-8").splitlines()
-    detected_delimiter = detect_delimiter(raw_lines[0])
-
-    if not detected_delimiter:
-        raise ValueError(f"❌ Impossible de détecter le séparateur dans le fichier {filename}.")
-
-    lines = list(csv.reader(raw_lines, delimiter=detected_delimiter))
-
-    # Enlève l'en-tête si présent
-    if lines and "question" in lines[0][0].lower():
-        lines = lines[1:]
-
-    enriched = []
-    progress_bar = st.progress(0.0, text=f"Génération des explications ({filename})")
-    for idx, line in enumerate(lines):
-        time.sleep(0.5)  # éviter le timeout
-        if len(line) < 7:
-            line += [""] * (7 - len(line))
-        prompt = generate_prompt(line, version)
-        if prompt == "INVALID":
-            explanation = f"[ERREUR - Prompt non généré à la ligne {idx+1}]"
-        else:
-            try:
-                message = client.messages.create(
-                    model="claude-3-7-sonnet-20250219",
-                    max_tokens=256,
-                    temperature=0.3,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                explanation = message.content[0].text.strip().replace("\n", " ")
-            except Exception as e:
-                explanation = f"[ERREUR - {str(e)}]"
-        line.append(explanation)
-        enriched.append(line)
-        progress_bar.progress((idx + 1) / len(lines), text=f"{idx+1}/{len(lines)} explications générées")
-
-    # Sauvegarde
-    csv_path = OUTPUT_DIR / f"{base_name}_enriched.csv"
-    json_path = OUTPUT_DIR / f"{base_name}.json"
-    with open(csv_path, "w", encoding="utf-8", newline="") as f_out:
-        csv.writer(f_out, delimiter="$").writerows(enriched)
-    with open(json_path, "w", encoding="utf-8") as f_json:
-        json.dump([parse_csv_line(row) for row in enriched], f_json, ensure_ascii=False, indent=2)
-
-    return csv_path, json_path
-
-
 # ====================== INTERFACE ======================
 st.set_page_config(page_title="🧠 BIA Claude", layout="wide")
 tab1, tab2 = st.tabs(["🔬 Comparer deux prompts", "📄 Générer des fichiers enrichis"])
@@ -162,125 +31,37 @@ with tab1:
     st.title("🔬 Comparateur de prompts BIA")
     api_key = st.text_input("🔑 Clé API Claude", type="password", key="api1")
     uploaded = st.file_uploader("📄 Fichier CSV BIA (séparateur $)", type="csv", key="file1")
+    client = connect(api_key)
 
-    if api_key and uploaded:
-        client = anthropic.Anthropic(api_key=api_key)
-        if "index" not in st.session_state:
-            st.session_state.index = 0
-            st.session_state.lines = []
-            st.session_state.scores = []
-
-        if not st.session_state.lines:
-            reader = csv.reader(uploaded.read().decode("utf-8").splitlines(), delimiter="$")
-            lines = list(reader)
-            if lines and "question" in lines[0][0].lower():
-                lines = lines[1:]
-            st.session_state.lines = lines
-
-        lines = st.session_state.lines
-        index = st.session_state.index
-        total = len(lines)
-
-        if index < total:
-            row = lines[index]
-            while len(row) < 7:
-                row.append("")
-            q_text = row[0].strip()
-            correct = row[5].strip().upper()
-            answer = row["ABCDE".index(correct)].strip()
-            with st.spinner("🧠 Claude génère les deux explications..."):
-                exp1 = get_explanation(prompt_v1(q_text, answer), client)
-                exp2 = get_explanation(prompt_v2(q_text, answer), client)
-
-            pair = [("Prompt V1", exp1), ("Prompt V2", exp2)]
-            random.shuffle(pair)
-
-            st.markdown(f"### Question {index+1}/{total} :")
-            st.markdown(f"**{q_text}**")
-            st.markdown(f"✅ Réponse correcte : **{answer}**")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.markdown(f"🅰️ {pair[0][1]}")
-                if st.button("Je préfère 🅰️", key=f"a{index}"):
-                    st.session_state.scores.append(pair[0][0])
-                    st.session_state.index += 1
-                    st.rerun()
-            with col2:
-                st.markdown(f"🅱️ {pair[1][1]}")
-                if st.button("Je préfère 🅱️", key=f"b{index}"):
-                    st.session_state.scores.append(pair[1][0])
-                    st.session_state.index += 1
-                    st.rerun()
-        else:
-    
-            st.success("🎉 Comparaison terminée ! Résultat :")
-            v1 = st.session_state.scores.count("Prompt V1")
-            v2 = st.session_state.scores.count("Prompt V2")
-
-            st.markdown(f"🧪 Prompt V1 : {v1} vote(s)")
-            st.markdown(f"🎓 Prompt V2 : {v2} vote(s)")
-
-            if v1 > v2:
-                st.markdown("🏆 **Prompt V1 préféré**")
-            elif v2 > v1:
-                st.markdown("🏆 **Prompt V2 préféré**")
-            else:
-                st.markdown("🤝 Égalité parfaite")
-
-            # 🔍 Affichage explicite des prompts utilisés
-            with st.expander("🧠 Afficher les formulations des deux prompts utilisés", expanded=False):
-                st.markdown("### ✏️ Prompt V1 utilisé :")
-                st.markdown("""
-                **Explique de manière scientifique et précise, en 2 à 3 phrases adaptées au niveau d'un élève de 3e,**  
-                pourquoi la réponse suivante est correcte.  
-                **Question :** [texte]  
-                **Réponse correcte :** [texte]  
-                Ta réponse ne doit contenir que l’explication, sans retour à la ligne ni remarque supplémentaire.
-                """)
-
-
-                st.markdown("### 🧑‍🏫 Prompt V2 utilisé :")
-                st.markdown("""
-                **Tu es un expert en aéronautique chargé d'aider un élève de 3e qui prépare le BIA (Brevet d’Initiation Aéronautique).**  
-                Explique en 2 à 3 phrases pourquoi la réponse suivante est scientifiquement correcte, en utilisant des termes techniques adaptés à un jeune public, et en vulgarisant si nécessaire.  
-                L’explication doit être concise, rigoureuse, sans retour à la ligne, sans reformuler la question ni mentionner les mauvaises réponses.  
-                **Voici la question et sa bonne réponse :**  
-                Question : ...  
-                Bonne réponse : ...  
-                Réponds uniquement par l’explication finale à afficher dans un QCM en ligne.
-                """)
-
-
-            # Sauvegarde
-            with open("selected_prompt.txt", "w", encoding="utf-8") as f:
-                f.write("V1" if v1 >= v2 else "V2")
-
-            st.markdown("🔍 Prompt préféré utilisé pour la génération future : **" + ("V1" if v1 >= v2 else "V2") + "**")
-
-            if st.button("🔄 Recommencer"):
-                st.session_state.index = 0
-                st.session_state.lines = []
-                st.session_state.scores = []
+    if client and uploaded:
+        render_comparator(client, uploaded, PROMPT_BUILDERS)
 
 # ---------------- Onglet 2 : Générateur ----------------
 with tab2:
     st.title("📄 Générateur de fichiers enrichis BIA")
 
-    api_key2 = st.text_input("🔑 Clé API Claude", type="password", key="api2")
+    api_key2 = st.text_input(
+        "🔑 Clé(s) API Claude",
+        type="password",
+        key="api2",
+        help="Plusieurs clés séparées par des virgules : les requêtes sont réparties selon la marge de débit restante de chaque clé"
+    )
+    if api_key2 and connect(api_key2) is None:
+        api_key2 = ""
     uploaded_files = st.file_uploader("📂 Charge un ou plusieurs fichiers CSV", type="csv", accept_multiple_files=True, key="file2")
     
     # Lecture du prompt sélectionné (si fichier existe)
     PROMPT_FILE = Path("selected_prompt.txt")
     if PROMPT_FILE.exists():
         previous = PROMPT_FILE.read_text().strip()
-        default_index = 0 if previous == "V1" else 1
+        default_index = list(PROMPT_BUILDERS).index(previous) if previous in PROMPT_BUILDERS else 0
     else:
         default_index = 0
 
     # Menu déroulant pour choisir manuellement le prompt
     prompt_choice = st.selectbox(
         "🧠 Choisis le prompt à utiliser pour générer les explications :",
-        options=["V1", "V2"],
+        options=list(PROMPT_BUILDERS),
         index=default_index,
         help="V1 : neutre et synthétique • V2 : contextualisé BIA, plus pédagogique"
     )
@@ -291,36 +72,214 @@ with tab2:
     # Sauvegarde dans le fichier pour persistance
     PROMPT_FILE.write_text(prompt_choice)
 
+    max_in_flight = st.number_input(
+        "⚡ Requêtes simultanées maximum",
+        min_value=1,
+        max_value=50,
+        value=DEFAULT_MAX_IN_FLIGHT,
+        help="Nombre d'appels à Claude envoyés en parallèle (l'ordre des lignes est conservé)"
+    )
+    pack_size = st.number_input(
+        "📦 Questions par requête",
+        min_value=1,
+        max_value=20,
+        value=1,
+        help="Au-delà de 1, plusieurs questions d'une même partie sont expliquées en un seul appel (réponse JSON) ; "
+             "une question mal découpée repasse en appel individuel"
+    )
+    use_cache = st.checkbox(
+        "♻️ Réutiliser les explications déjà générées (cache local)",
+        value=True,
+        help="Une question déjà traitée avec le même prompt et les mêmes paramètres ne repasse pas par l'API"
+    )
+    reuse_similar = st.checkbox(
+        "🔁 Réutiliser l'explication des questions quasi identiques d'autres annales",
+        value=True,
+        help="Comparaison du texte normalisé de la question et de la bonne réponse (accents, ponctuation et numérotation ignorés)"
+    )
+    incremental = st.checkbox(
+        "📄 Compléter uniquement les explications manquantes",
+        value=True,
+        help="Pour un CSV déjà enrichi : les explications présentes sont conservées, seules les lignes vides ou en erreur sont générées"
+    )
+    resume = st.checkbox(
+        "⏯️ Reprendre les générations interrompues",
+        value=True,
+        help="Repart du journal out/<fichier>.journal.jsonl au lieu de tout régénérer"
+    )
+    use_hedge = st.checkbox(
+        "🏁 Doubler les requêtes anormalement lentes (hedging)",
+        value=False,
+        help="Une requête sans réponse au-delà du p95 des latences observées est relancée en parallèle ; "
+             "la première réponse est gardée"
+    )
+    hedge_budget = st.slider(
+        "Part maximale de requêtes doublées",
+        min_value=0.0,
+        max_value=0.5,
+        value=HEDGE_BUDGET,
+        step=0.05,
+        disabled=not use_hedge
+    )
+    use_batch = st.checkbox(
+        "📨 Mode batch (Message Batches API)",
+        value=False,
+        help="Toutes les lignes de tous les fichiers partent en un seul batch : moins cher, mais résultats différés (jusqu'à 24 h)"
+    )
+
     if "results" not in st.session_state:
         st.session_state.results = []
-
-    PROMPT_FILE = Path("selected_prompt.txt")
-
-    # Lecture de la version précédente si existante
-    if PROMPT_FILE.exists():
-        previous = PROMPT_FILE.read_text().strip()
-        default_index = 0 if previous == "V1" else 1
-    else:
-        default_index = 0
+    # L'historique des latences du hedging est conservé d'un run à l'autre
+    if "hedge_policy" not in st.session_state:
+        st.session_state.hedge_policy = HedgePolicy()
+    # Travaux soumis par cette session : le JobRunner est commun à tout le processus
+    if "job_ids" not in st.session_state:
+        st.session_state.job_ids = []
+        st.session_state.collected_jobs = set()
+
+    # 🧮 Estimation à blanc : aucun appel à l'API, quelques millisecondes
+    if uploaded_files and st.button("🧮 Estimer le run"):
+        files = [(file.name, file.getvalue()) for file in uploaded_files]
+        estimate = estimate_run(files, get_selected_prompt(), max_in_flight, pack_size=1 if use_batch else pack_size,
+                                cache=get_default_cache() if use_cache else None, batch=use_batch,
+                                incremental=incremental,
+                                limiter=get_pooled_client(api_key2).limiter if api_key2 else None)
+        totals = estimate["totals"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Appels API", totals["calls"])
+        col2.metric("Tokens entrée / sortie", f"{totals['input_tokens']} / {totals['output_tokens']}")
+        col3.metric("Durée estimée (s)", "différée (batch)" if use_batch else totals["wall_time_s"])
+        col4.metric("Coût estimé ($)", totals["estimated_cost_usd"])
+        calibration = estimate["calibration"]
+        st.caption(f"{totals['rows']} ligne(s), dont {totals['kept_rows']} déjà expliquée(s) dans le fichier et "
+                   f"{totals['cached_rows']} déjà en cache — calibration sur "
+                   f"{calibration['runs']} run(s) : {calibration['chars_per_token']:.2f} caractères/token, "
+                   f"{calibration['output_tokens_per_row']:.0f} tokens de sortie/ligne, "
+                   f"latence {calibration['latency_s']:.2f} s par question, "
+                   f"{totals['requests_per_minute']:.0f} requêtes/min")
+        for file_estimate in estimate["files"]:
+            if file_estimate["error"]:
+                st.error(file_estimate["error"])
+            elif file_estimate["invalid_rows"]:
+                st.warning(f"{file_estimate['file']} : {len(file_estimate['invalid_rows'])} ligne(s) INVALID "
+                           f"(lignes {', '.join(map(str, file_estimate['invalid_rows']))})")
 
     if api_key2 and uploaded_files:
-        client = anthropic.Anthropic(api_key=api_key2)
+        client = get_pooled_client(api_key2)
         if st.button("🧠 Lancer la génération"):
             version = get_selected_prompt()
-            for file in uploaded_files:
-                file_bytes = file.read()
-                with st.spinner(f"Traitement de {file.name}..."):
-                    csv_path, json_path = process_csv_bytes(file_bytes, file.name, client, version)
-                    st.session_state.results.append((file.name, csv_path, json_path))
+            files = [(file.name, file.read()) for file in uploaded_files]
+            options = {}
+            if not use_batch:
+                hedge = st.session_state.hedge_policy if use_hedge else None
+                if hedge is not None:
+                    hedge.budget = hedge_budget
+                options = {"max_in_flight": max_in_flight, "resume": resume, "pack_size": pack_size, "hedge": hedge}
+            # La génération tourne en arrière-plan : elle survit aux reruns et aux reconnexions
+            # Deux travaux sur un même nom de fichier partageraient journal et sorties : ils passent l'un après l'autre
+            job_id = get_default_runner().submit(run_enrichment_job, files, client, version, use_batch=use_batch,
+                                                 use_cache=use_cache, reuse_similar=reuse_similar,
+                                                 incremental=incremental, label=", ".join(name for name, _ in files),
+                                                 keys=[output_key(OUTPUT_DIR, name) for name, _ in files], **options)
+            st.session_state.job_ids.append(job_id)
+
+    # 🩹 Réparation : seules les lignes restées en erreur dans out/ repartent à l'API
+    damaged = scan_outputs(OUTPUT_DIR)
+    if damaged:
+        st.warning(f"🩹 {sum(errors for _, errors in damaged)} ligne(s) en erreur dans {len(damaged)} sortie(s) : "
+                   + ", ".join(f"{csv_path.name} ({errors})" for csv_path, errors in damaged))
+        if api_key2 and st.button("🩹 Réparer les lignes en erreur"):
+            runner = get_default_runner()
+            busy = [csv_path.name for csv_path, _ in damaged if repair_key(csv_path) in runner.busy_keys()]
+            if busy:
+                st.error(f"Une génération écrit encore {', '.join(busy)} : réparation refusée, réessaie à la fin du travail.")
+            else:
+                csv_paths = [csv_path for csv_path, _ in damaged]
+                job_id = runner.submit(run_repair_job, get_pooled_client(api_key2), get_selected_prompt(),
+                                       use_cache=use_cache, reuse_similar=reuse_similar, max_in_flight=max_in_flight,
+                                       pack_size=pack_size, csv_paths=csv_paths, label="Réparation des sorties en erreur",
+                                       keys=[repair_key(csv_path) for csv_path in csv_paths])
+                st.session_state.job_ids.append(job_id)
+
+    # ⚙️ Travaux de génération de la session : la page ne fait que relire leur état
+    runner = get_default_runner()
+
+    def session_jobs():
+        """État des travaux de la session, du plus récent au plus ancien (les travaux oubliés sont retirés)."""
+        snapshots = []
+        for job_id in list(st.session_state.job_ids):
+            try:
+                snapshots.append(runner.status(job_id))
+            except KeyError:
+                st.session_state.job_ids.remove(job_id)
+                st.session_state.collected_jobs.discard(job_id)
+        return snapshots[::-1]
+
+    def is_active(job):
+        return job["status"] in ("queued", "running")
+
+    def to_collect(job):
+        return job["status"] == "done" and job["id"] not in st.session_state.collected_jobs
+
+    for job in session_jobs():
+        if to_collect(job):
+            result = runner.result(job["id"])
+            # Une réparation réécrit des sorties déjà listées : pas de doublon
+            known = {str(csv_path) for _, csv_path, _ in st.session_state.results}
+            st.session_state.results.extend(output for output in result["outputs"] if str(output[1]) not in known)
+            st.session_state.run_report = (result["report"], result["report_path"])
+            st.session_state.collected_jobs.add(job["id"])
+    polling = any(is_active(job) for job in session_jobs())
+
+    # Tant qu'un travail tourne, seul ce bloc est réexécuté pour suivre son avancement ;
+    # le reste de la page n'est relancé qu'à la fin d'un travail, pour afficher ses sorties
+    @st.fragment(run_every=JOB_POLL_INTERVAL if polling else None)
+    def show_jobs():
+        jobs = session_jobs()
+        if jobs:
+            st.subheader("⚙️ Travaux de génération")
+        for job in jobs:
+            icon = {"queued": "⏳", "running": "🔄", "done": "✅", "failed": "❌"}[job["status"]]
+            st.progress(job["progress"], text=f"{icon} {job['label']} — {job['message'] or job['status']}")
+            for message in job["messages"]:
+                st.caption(message)
+            if job["status"] == "failed":
+                st.error(f"Échec du travail {job['id']} : {job['error'].splitlines()[0]}")
+        if any(to_collect(job) for job in jobs) or (polling and not any(is_active(job) for job in jobs)):
+            st.rerun()
+
+    show_jobs()
+
+    # 📊 Rapport du dernier run
+    if st.session_state.get("run_report"):
+        report, report_path = st.session_state.run_report
+        with st.expander("📊 Rapport du dernier run", expanded=False):
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Lignes / min", report["rows_per_min"])
+            col2.metric("Latence p50 / p95 (s)", f"{report['latency_p50_s']} / {report['latency_p95_s']}")
+            col3.metric("Tokens sortie / s", report["output_tokens_per_s"])
+            col4.metric("Coût estimé ($)", report["estimated_cost_usd"])
+            st.caption(f"🧾 Tokens d'entrée : {report['cached_input_tokens']} lus en cache, "
+                       f"{report['cache_write_input_tokens']} écrits en cache, "
+                       f"{report['uncached_input_tokens']} non cachés "
+                       f"({report['cached_ratio']:.0%} en cache) — sortie : {report['output_tokens']}")
+            if report["hedged_calls"]:
+                st.caption(f"🏁 Requêtes doublées : {report['hedged_calls']} "
+                           f"({report['hedge_rate']:.0%} des appels), dont {report['hedge_wins']} gagnée(s) "
+                           f"par la requête de secours")
+            st.caption(f"🔁 Questions quasi identiques réutilisées : {report['reused_rows']} "
+                       f"({report['reuse_rate']:.0%} des lignes)")
+            st.json(report)
+            st.caption(f"Rapport enregistré dans {report_path}")
 
     if st.session_state.results:
-        for fname, csv_path, json_path in st.session_state.results:
+        for n, (fname, csv_path, json_path) in enumerate(st.session_state.results):
             with st.expander(f"📁 Résultat pour {fname}", expanded=False):
                 st.info(f"📌 Prompt utilisé pour la génération : **{get_selected_prompt()}**")
                 with open(csv_path, "rb") as f_csv:
-                    st.download_button("⬇ Télécharger CSV", f_csv.read(), file_name=csv_path.name, mime="text/csv", key=f"csv-{fname}")
+                    st.download_button("⬇ Télécharger CSV", f_csv.read(), file_name=csv_path.name, mime="text/csv", key=f"csv-{n}-{fname}")
                 with open(json_path, "rb") as f_json:
-                    st.download_button("⬇ Télécharger JSON", f_json.read(), file_name=json_path.name, mime="application/json", key=f"json-{fname}")
+                    st.download_button("⬇ Télécharger JSON", f_json.read(), file_name=json_path.name, mime="application/json", key=f"json-{n}-{fname}")
 
         # ZIP global
         zip_buffer = io.BytesIO()
@@ -340,7 +299,7 @@ with tab2:
                     folder = f"{base}/"
 
                     # Création HTML avec nom de JSON correspondant
-                    html_code = template_html.replace("BIA_Annales_2016.json", json_path.name)
+                    html_code = render_quiz_html(template_html, json_path.name)
                     html_path = json_path.with_suffix(".html")
                     html_path.write_text(html_code, encoding="utf-8")
 
@@ -360,3 +319,4 @@ with tab2:
             mime="application/zip",
             key="zip-html"
         )
+
@@ -0,0 +1,97 @@
+import threading
+import zipfile
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+from rate_limiter import AdaptiveRateLimiter
+
+
+class FakeRaw:
+    def __init__(self, message, headers):
+        self._message = message
+        self.headers = headers
+
+    def parse(self):
+        return self._message
+
+
+class FakeClient:
+    """
+    Client Anthropic hors ligne : `reply(params)` renvoie le texte de la réponse ou lève une erreur.
+
+    Les paramètres de chaque appel sont conservés dans `calls`. Le client apporte son propre
+    limiteur, assez large pour ne jamais attendre (le moteur l'utilise à la place du limiteur
+    partagé, comme pour client_pool.ShardedClient).
+    """
+
+    def __init__(self, reply, headers=None):
+        self.reply = reply
+        self.limiter = AdaptiveRateLimiter(requests_per_minute=60_000)
+        self.headers = headers or {}
+        self.calls = []
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create), batches=None)
+        self.models = SimpleNamespace()
+
+    def with_options(self, **options):
+        return self
+
+    def _create(self, **params):
+        with self._lock:
+            self.calls.append(params)
+        text = self.reply(params)
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5, cache_creation_input_tokens=0,
+                                cache_read_input_tokens=0)
+        return FakeRaw(SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage), self.headers)
+
+
+def user_text(params):
+    return params["messages"][0]["content"]
+
+
+class FakeStatusError(Exception):
+    """Erreur HTTP du SDK réduite à ce que lit rate_limiter (status_code, response.headers)."""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml"'
+    ' ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml"'
+    ' Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+
+def paragraph_xml(line):
+    """Paragraphe WordprocessingML d'une ligne de texte (les tabulations deviennent des <w:tab/>)."""
+    runs = "<w:r><w:tab/></w:r>".join(f'<w:r><w:t xml:space="preserve">{escape(part)}</w:t></w:r>'
+                                      for part in line.split("\t"))
+    return f"<w:p>{runs}</w:p>"
+
+
+def write_docx(path, body):
+    """Écrit un .docx minimal dont le corps est `body` (XML) ou une liste de lignes (un paragraphe chacune)."""
+    if not isinstance(body, str):
+        body = "".join(paragraph_xml(line) for line in body)
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f"<w:body>{body}</w:body></w:document>")
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", DOCX_RELS)
+        archive.writestr("word/document.xml", document)
+    return path
@@ -0,0 +1,222 @@
+"""
+Pipeline complet sans navigateur : CSV bruts → CSV enrichis → JSON → dossiers quiz (JSON + HTML).
+
+Usage :
+    ANTHROPIC_API_KEY=sk-... python enrich_folder.py questions_csv_raw --output out --bundles quiz_structures
+
+Plusieurs fichiers sont traités en même temps, mais toutes leurs requêtes partagent un seul
+budget de requêtes en vol (--max-in-flight). Plusieurs clés peuvent être passées, séparées
+par des virgules. ANTHROPIC_BASE_URL permet de viser le serveur simulé.
+
+Code de sortie : 0 si tout est enrichi, 1 si un fichier a échoué, 2 si des lignes portent
+encore un marqueur d'erreur qu'une relance peut corriger (mêmes lignes que --repair : les
+lignes INVALID n'en font pas partie). Avec --dry-run, rien n'est envoyé : appels, tokens, durée et
+lignes INVALID sont estimés (code 1 si un fichier est illisible, 2 si des lignes sont INVALID).
+Avec --repair, seules les lignes en erreur des sorties déjà écrites dans --output sont
+régénérées, et les fichiers corrigés en place (code 2 s'il en reste).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from batch_backend import run_batch_enrichment
+from client_pool import get_pooled_client, parse_api_keys
+from enrichment import process_csv_file
+from explanation_cache import get_default_cache
+from generation_engine import DEFAULT_MAX_IN_FLIGHT, MODEL
+from pipeline import HTML_TEMPLATE_PATH, OUTPUT_DIR, PROMPT_BUILDERS, get_selected_prompt, write_quiz_bundle
+from preflight import estimate_run
+from repair import count_repairable, repair_outputs, scan_outputs, version_note
+from question_index import get_default_index
+from run_metrics import RunMetrics
+
+
+# Nombre de fichiers traités en même temps
+DEFAULT_PARALLEL_FILES = 4
+
+
+def enrich_folder(input_dir, client, version, output_dir=OUTPUT_DIR, bundle_dir=None, template_html=None,
+                  max_in_flight=DEFAULT_MAX_IN_FLIGHT, parallel_files=DEFAULT_PARALLEL_FILES, use_batch=False,
+                  use_cache=True, reuse_similar=True, resume=True, pack_size=1, incremental=True, metrics=None,
+                  log=print):
+    """
+    Enrichit tous les CSV de `input_dir` et renvoie [(nom, chemin CSV, chemin JSON, erreur ou None)].
+
+    Sans `bundle_dir`, aucun dossier quiz n'est écrit.
+    """
+    paths = sorted(Path(input_dir).glob("*.csv"))
+    log(f"🔍 {len(paths)} fichier(s) trouvé(s) dans {input_dir}")
+    cache = get_default_cache() if use_cache else None
+    question_index = get_default_index() if reuse_similar else None
+    results = []
+
+    if use_batch:
+        files = [(path.name, path.read_bytes()) for path in paths]
+        outputs = run_batch_enrichment(files, client, version, output_dir=output_dir, cache=cache, metrics=metrics,
+                                       on_poll=lambda batch: log(f"📨 Batch {batch.id} : {batch.processing_status}"),
+                                       question_index=question_index, incremental=incremental)
+        results = [(name, csv_path, json_path, None) for name, csv_path, json_path in outputs]
+    else:
+        # Un seul pool pour les requêtes de tous les fichiers : c'est le budget global de requêtes en vol
+        with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as requests_pool, \
+                ThreadPoolExecutor(max_workers=max(1, parallel_files)) as files_pool:
+            def enrich(path):
+                return process_csv_file(path, client, version, use_cache=use_cache, resume=resume,
+                                        metrics=metrics, pack_size=pack_size, reuse_similar=reuse_similar,
+                                        incremental=incremental,
+                                        output_dir=output_dir, on_message=lambda text: log(f"{path.name} : {text}"),
+                                        executor=requests_pool)
+
+            futures = {files_pool.submit(enrich, path): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    csv_path, json_path = future.result()
+                except Exception as e:
+                    log(f"❌ {path.name} : {e}")
+                    results.append((path.name, None, None, str(e)))
+                    continue
+                results.append((path.name, csv_path, json_path, None))
+        order = {path.name: n for n, path in enumerate(paths)}
+        results.sort(key=lambda result: order[result[0]])
+
+    for name, csv_path, json_path, error in results:
+        if error is not None:
+            continue
+        if bundle_dir is not None:
+            write_quiz_bundle(json_path, template_html, bundle_dir)
+        errors = count_repairable(csv_path)
+        log(f"{'⚠️' if errors else '✅'} {name} → {csv_path.name}, {json_path.name}"
+            + (f" ({errors} ligne(s) en erreur)" if errors else ""))
+    return results
+
+
+def dry_run(args):
+    """Estimation à blanc de `main` : code de sortie 1 si un fichier est illisible, 2 si des lignes sont INVALID."""
+    if args.repair:
+        scanned = scan_outputs(args.output)
+        for csv_path, errors in scanned:
+            print(f"⚠️ {csv_path.name} : {errors} ligne(s) en erreur")
+        print(f"🧮 {sum(errors for _, errors in scanned)} ligne(s) à réparer dans {len(scanned)} fichier(s)")
+        return 2 if scanned else 0
+    files = [(path.name, path.read_bytes()) for path in sorted(args.input_dir.glob("*.csv"))]
+    estimate = estimate_run(files, args.version or get_selected_prompt(), args.max_in_flight,
+                            pack_size=1 if args.batch else args.pack_size,
+                            cache=None if args.no_cache else get_default_cache(), batch=args.batch,
+                            incremental=not args.no_incremental)
+    for file_estimate in estimate["files"]:
+        if file_estimate["error"]:
+            print(file_estimate["error"])
+            continue
+        invalid = file_estimate["invalid_rows"]
+        print(f"{'⚠️' if invalid else '✅'} {file_estimate['file']} : {file_estimate['rows']} ligne(s), "
+              f"{file_estimate['kept_rows']} déjà expliquée(s), {file_estimate['cached_rows']} en cache, "
+              f"{file_estimate['calls']} appel(s)"
+              + (f", INVALID aux lignes {', '.join(map(str, invalid))}" if invalid else ""))
+    totals, calibration = estimate["totals"], estimate["calibration"]
+    print(f"🧮 {totals['calls']} appel(s), ~{totals['input_tokens']} tokens en entrée, "
+          f"~{totals['output_tokens']} en sortie, ~{totals['wall_time_s']} s, "
+          f"~{totals['estimated_cost_usd']} $ (calibration sur {calibration['runs']} run(s))")
+    if totals["files_in_error"]:
+        return 1
+    if totals["invalid_rows"]:
+        return 2
+    return 0
+
+
+def repair(args, client, template_html):
+    """Passe de réparation de `main` : code de sortie 2 si des lignes restent en erreur."""
+    metrics = RunMetrics(MODEL)
+    start = time.time()
+
+    version = args.version or get_selected_prompt()
+
+    def on_result(report):
+        print(f"{'⚠️' if report['remaining'] else '✅'} {report['file']} : "
+              f"{report['recovered']}/{report['errors']} ligne(s) récupérée(s)" + version_note(report, version))
+        if report["recovered"] and not args.no_bundles:
+            write_quiz_bundle(report["json_path"], template_html, args.bundles)
+
+    reports = repair_outputs(client, version, output_dir=args.output,
+                             use_cache=not args.no_cache, reuse_similar=not args.no_reuse,
+                             max_in_flight=args.max_in_flight, pack_size=args.pack_size, metrics=metrics,
+                             on_result=on_result)
+    metrics.finish()
+    report_path = metrics.save(args.output)
+    recovered = sum(report["recovered"] for report in reports)
+    remaining = sum(report["remaining"] for report in reports)
+    print(f"🩹 {recovered} ligne(s) récupérée(s), {remaining} toujours en erreur, dans {len(reports)} fichier(s) "
+          f"en {time.time() - start:.1f} s — rapport : {report_path}")
+    return 2 if remaining else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Enrichit un dossier de CSV BIA et prépare les quiz HTML")
+    parser.add_argument("input_dir", type=Path, nargs="?", help="Dossier des CSV bruts (séparateur $ ou ,)")
+    parser.add_argument("--output", type=Path, default=OUTPUT_DIR, help="Dossier des CSV enrichis et JSON")
+    parser.add_argument("--bundles", type=Path, default=Path("quiz_structures"),
+                        help="Dossier des quiz (un sous-dossier JSON + HTML par fichier)")
+    parser.add_argument("--no-bundles", action="store_true", help="Ne pas écrire les dossiers quiz")
+    parser.add_argument("--template", type=Path, default=HTML_TEMPLATE_PATH, help="Gabarit HTML du quiz")
+    parser.add_argument("--version", choices=list(PROMPT_BUILDERS), default=None,
+                        help="Version du prompt (par défaut : celle de selected_prompt.txt)")
+    parser.add_argument("--api-key", default=os.environ.get("ANTHROPIC_API_KEY", ""),
+                        help="Clé(s) API séparées par des virgules (par défaut : $ANTHROPIC_API_KEY)")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="Requêtes simultanées, tous fichiers confondus")
+    parser.add_argument("--parallel-files", type=int, default=DEFAULT_PARALLEL_FILES,
+                        help="Fichiers traités en même temps")
+    parser.add_argument("--pack-size", type=int, default=1, help="Questions par requête")
+    parser.add_argument("--batch", action="store_true", help="Passer par l'API Message Batches")
+    parser.add_argument("--no-cache", action="store_true", help="Ignorer le cache des explications")
+    parser.add_argument("--no-reuse", action="store_true", help="Ne pas réutiliser les questions quasi identiques")
+    parser.add_argument("--no-resume", action="store_true", help="Ignorer les journaux de reprise")
+    parser.add_argument("--no-incremental", action="store_true",
+                        help="Régénérer aussi les explications déjà présentes dans un CSV enrichi")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Estimer appels, tokens, durée et lignes INVALID sans appeler l'API")
+    parser.add_argument("--repair", action="store_true",
+                        help="Régénérer seulement les lignes en erreur des sorties de --output (input_dir inutile)")
+    args = parser.parse_args(argv)
+
+    if not args.repair and (args.input_dir is None or not args.input_dir.is_dir()):
+        parser.error(f"dossier introuvable : {args.input_dir}")
+    if args.dry_run:
+        return dry_run(args)
+    if not parse_api_keys(args.api_key):
+        parser.error("aucune clé API (--api-key ou ANTHROPIC_API_KEY)")
+    template_html = None
+    if not args.no_bundles:
+        template_html = args.template.read_text(encoding="utf-8")
+
+    client = get_pooled_client(args.api_key)
+    if args.repair:
+        return repair(args, client, template_html)
+    metrics = RunMetrics(MODEL, batch=args.batch)
+    start = time.time()
+    results = enrich_folder(
+        args.input_dir, client, args.version or get_selected_prompt(), output_dir=args.output,
+        bundle_dir=None if args.no_bundles else args.bundles, template_html=template_html,
+        max_in_flight=args.max_in_flight, parallel_files=args.parallel_files, use_batch=args.batch,
+        use_cache=not args.no_cache, reuse_similar=not args.no_reuse, resume=not args.no_resume,
+        pack_size=args.pack_size, incremental=not args.no_incremental, metrics=metrics,
+    )
+    metrics.finish()
+    report_path = metrics.save(args.output)
+
+    failed = [name for name, _, _, error in results if error is not None]
+    error_rows = sum(count_repairable(csv_path) for _, csv_path, _, error in results if error is None)
+    print(f"🎉 {len(results) - len(failed)}/{len(results)} fichier(s) enrichi(s) en {time.time() - start:.1f} s, "
+          f"{error_rows} ligne(s) en erreur — rapport : {report_path}")
+    if failed:
+        return 1
+    if error_rows:
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import io
+from pathlib import Path
+
+from batch_backend import run_batch_enrichment
+from explanation_cache import get_default_cache
+from generation_engine import (DEFAULT_MAX_IN_FLIGHT, MODEL, existing_explanation, is_error_explanation,
+                               stream_explanations)
+from pipeline import OUTPUT_DIR, EnrichedWriter, generate_prompt, iter_question_rows, question_part
+from question_index import get_default_index, known_explanation, remember_explanation
+from run_journal import RunJournal, file_hash, path_hash
+from run_metrics import RunMetrics
+
+
+def output_key(output_dir, filename):
+    """Clé des sorties d'un fichier (<dossier>/<base>), pour ne jamais lancer deux travaux qui les écrivent ensemble."""
+    return str((Path(output_dir) / Path(filename).stem).resolve())
+
+
+def process_csv_bytes(file_bytes, filename, client, version, **options):
+    """Enrichit un CSV reçu en mémoire (upload Streamlit) ; options : voir `process_csv_stream`."""
+    return process_csv_stream(lambda: io.BytesIO(file_bytes), file_hash(file_bytes), filename, client, version,
+                              **options)
+
+
+def process_csv_file(path, client, version, **options):
+    """Enrichit un CSV lu directement sur disque, sans le charger en mémoire."""
+    path = Path(path)
+    return process_csv_stream(lambda: open(path, "rb"), path_hash(path), path.name, client, version, **options)
+
+
+def process_csv_stream(open_source, source_hash, filename, client, version, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                       use_cache=True, resume=True, metrics=None, pack_size=1, reuse_similar=True, hedge=None,
+                       incremental=True, on_progress=None, on_message=None, output_dir=OUTPUT_DIR, executor=None,
+                       limiter=None):
+    """
+    Enrichit un fichier CSV ligne à ligne et renvoie les chemins (CSV, JSON) écrits dans `output_dir`.
+
+    `open_source()` ouvre un flux binaire sur le CSV. Il est appelé deux fois et le fichier est
+    donc lu deux fois : une passe de comptage (total du journal et de la progression), puis la
+    lecture. Les lignes sont lues, expliquées et écrites au fil de l'eau et les premières arrivent
+    sur disque tout de suite ; seule une reprise garde en mémoire les explications du journal
+    (`RunJournal.load`), proportionnelles au nombre de lignes déjà traitées.
+
+    Un CSV déjà enrichi (8e champ explication) n'est pas rallongé d'une colonne : en mode
+    `incremental`, les explications présentes sont conservées et seules les lignes vides ou
+    en erreur partent à l'API ; sinon toutes les lignes sont régénérées.
+
+    Aucun appel à Streamlit : l'avancement passe par `on_progress(terminées, total)` et les
+    informations ponctuelles (reprise, réutilisation) par `on_message(texte)`. Sans `limiter`,
+    le limiteur du client ou celui du processus est utilisé.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    base_name = Path(filename).stem
+    with open_source() as source:
+        total = sum(1 for _ in iter_question_rows(source, filename))
+
+    # Journal de reprise : chaque explication est écrite sur disque dès son arrivée
+    journal = RunJournal(output_dir / f"{base_name}.journal.jsonl", source_hash, version)
+    # Questions quasi identiques déjà expliquées (autres annales, autres fichiers)
+    question_index = get_default_index() if reuse_similar else None
+    cache = get_default_cache() if use_cache else None
+    reused = kept = 0
+
+    with journal, open_source() as source, EnrichedWriter(base_name, output_dir) as writer:
+        done = journal.start(total, resume=resume)
+        resumed = sum(1 for explanation in done.values() if not is_error_explanation(explanation))
+        if resumed and on_message:
+            on_message(f"⏯️ Reprise : {resumed}/{total} explications déjà présentes dans le journal")
+        if on_progress:
+            on_progress(0, total)
+
+        def items():
+            nonlocal reused, kept
+            for idx, row in enumerate(iter_question_rows(source, filename)):
+                known = existing_explanation(row) if incremental else None
+                row = row[:7]
+                if known is not None:
+                    kept += 1
+                else:
+                    known = done.pop(idx, None)
+                # Les lignes en erreur lors du run précédent sont retentées
+                if known is not None and is_error_explanation(known):
+                    known = None
+                if known is None and question_index is not None:
+                    known = known_explanation(question_index, row, version)
+                    if known is not None:
+                        reused += 1
+                        journal.append(idx, known)
+                        if metrics is not None:
+                            metrics.record_call(None, outcome="reuse")
+                            metrics.record_rows()
+                prompt = generate_prompt(row, version) if known is None else None
+                yield idx, row, prompt, question_part(row[0]), known
+
+        # Les requêtes partent en parallèle (éventuellement groupées par partie), les lignes sont écrites dans l'ordre
+        count = 0
+        for idx, row, explanation, generated in stream_explanations(
+                items(), client, max_in_flight=max_in_flight, limiter=limiter, cache=cache, metrics=metrics,
+                pack_size=pack_size, hedge=hedge, executor=executor):
+            if generated:
+                journal.append(idx, explanation)
+                if question_index is not None:
+                    remember_explanation(question_index, row, version, explanation)
+            writer.write(row + [explanation])
+            count += 1
+            if on_progress:
+                on_progress(count, total)
+
+    if kept and on_message:
+        on_message(f"📄 {kept} explication(s) déjà présente(s) dans le fichier : conservée(s)")
+    if reused and on_message:
+        on_message(f"🔁 {reused} question(s) quasi identique(s) à des questions déjà expliquées : "
+                   f"explication réutilisée")
+    return writer.csv_path, writer.json_path
+
+
+def run_enrichment_job(job, files, client, version, use_batch=False, use_cache=True, reuse_similar=True,
+                       incremental=True, output_dir=OUTPUT_DIR, **options):
+    """
+    Tâche de fond (JobRunner) : enrichit une liste de fichiers (nom, contenu en bytes).
+
+    Les autres options sont transmises à `process_csv_bytes`. Le résultat est un dict avec
+    les sorties [(nom, chemin CSV, chemin JSON)], le rapport du run et son chemin.
+    """
+    cache = get_default_cache()
+    # Le cache est partagé par tous les travaux : on ne mesure que l'écart pendant celui-ci
+    before = cache.stats()
+    metrics = RunMetrics(MODEL, batch=use_batch)
+    outputs = []
+    if use_batch:
+        def on_poll(batch):
+            counts = batch.request_counts
+            total = counts.succeeded + counts.errored + counts.processing
+            job.update(progress=(counts.succeeded + counts.errored) / total if total else 0.0,
+                       message=f"📨 Batch {batch.id} : {batch.processing_status} — "
+                               f"{counts.succeeded} réussie(s), {counts.errored} en erreur, "
+                               f"{counts.processing} en cours")
+
+        outputs = run_batch_enrichment(files, client, version, output_dir=output_dir,
+                                       cache=cache if use_cache else None, poll_interval=30, on_poll=on_poll,
+                                       metrics=metrics, incremental=incremental,
+                                       question_index=get_default_index() if reuse_similar else None)
+    else:
+        for file_no, (filename, file_bytes) in enumerate(files):
+            def on_progress(count, total, file_no=file_no, filename=filename):
+                share = count / total if total else 1.0
+                job.update(progress=(file_no + share) / len(files),
+                           message=f"{filename} : {count}/{total} explications générées")
+
+            csv_path, json_path = process_csv_bytes(file_bytes, filename, client, version, use_cache=use_cache,
+                                                    metrics=metrics, reuse_similar=reuse_similar,
+                                                    incremental=incremental,
+                                                    on_progress=on_progress, on_message=job.log,
+                                                    output_dir=output_dir, **options)
+            outputs.append((filename, csv_path, json_path))
+    if use_cache:
+        stats = cache.stats()
+        job.log(f"♻️ Cache : {stats['hits'] - before['hits']} explication(s) réutilisée(s), "
+                f"{stats['misses'] - before['misses']} générée(s) ({stats['entries']} en cache)")
+    metrics.finish()
+    return {"outputs": outputs, "report": metrics.summary(), "report_path": metrics.save(output_dir)}
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+# Cache local des explications déjà payées
+CACHE_PATH = Path(".cache") / "explanations.sqlite"
+# Au-delà, les entrées les moins récemment utilisées sont supprimées
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+def cache_key(prompt, model, temperature, max_tokens):
+    """Empreinte SHA-256 du prompt rendu et des paramètres d'appel."""
+    payload = json.dumps(
+        {"prompt": prompt, "model": model, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExplanationCache:
+    """
+    Cache SQLite adressé par contenu, partagé entre les threads de génération.
+
+    Les entrées sont évincées par ordre d'utilisation (LRU) quand le cache dépasse
+    `max_entries`. Les compteurs `hits` / `misses` couvrent la vie de l'objet.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS explanations ("
+            " key TEXT PRIMARY KEY,"
+            " explanation TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON explanations(last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT explanation FROM explanations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE explanations SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def __contains__(self, key):
+        """Présence d'une entrée, sans toucher aux compteurs ni à l'ordre LRU (estimations à blanc)."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM explanations WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key, explanation):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO explanations (key, explanation, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, explanation, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM explanations WHERE key IN "
+                "(SELECT key FROM explanations ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Cache du processus, ouvert à la première utilisation."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ExplanationCache()
+        return _default_cache
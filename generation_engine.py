@@ -0,0 +1,350 @@
+import json
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from explanation_cache import cache_key
+from rate_limiter import AdaptiveRateLimiter, call_with_retries, request_tokens
+
+
+# ===================== PARAMÈTRES DE L'API ======================
+MODEL = "claude-3-7-sonnet-20250219"
+MAX_TOKENS = 256
+TEMPERATURE = 0.3
+
+# Nombre maximal de requêtes envoyées simultanément à l'API
+DEFAULT_MAX_IN_FLIGHT = 8
+# Nombre de nouvelles tentatives sur une erreur transitoire (429, 529, 5xx, réseau)
+MAX_RETRIES = 5
+
+# L'API ne met en cache qu'un préfixe d'au moins 1024 tokens (Sonnet). En dessous, le marqueur
+# cache_control est sans effet : il n'est posé qu'au-delà de ce seuil, compté à 3 caractères
+# par token (estimation basse, un marqueur inutile ne coûte rien). Les prompts livrés
+# (pipeline.SYSTEM_V1/V2, 250 à 520 caractères, moins de 800 avec PACK_INSTRUCTIONS) en sont
+# loin : pour eux le cache de prompt est inactif et le bloc système est facturé à chaque appel
+MIN_CACHEABLE_TOKENS = 1024
+MIN_CACHEABLE_CHARS = MIN_CACHEABLE_TOKENS * 3
+
+# Limiteur de repli, pour un client sans limiteur propre (client_pool.get_client en donne un par clé)
+SHARED_LIMITER = AdaptiveRateLimiter()
+
+# Consigne ajoutée au bloc système quand plusieurs questions partent dans la même requête
+PACK_INSTRUCTIONS = (
+    "Tu vas recevoir plusieurs questions numérotées [1], [2], etc. Rédige l'explication demandée pour chacune. "
+    "Réponds uniquement par un objet JSON dont les clés sont les numéros des questions (\"1\", \"2\", ...) "
+    "et les valeurs les explications, sans aucun texte autour."
+)
+
+# Préfixes des marqueurs d'erreur écrits à la place d'une explication
+ERROR_PREFIXES = ("[ERREUR", "[Erreur API")
+
+
+def is_error_explanation(text):
+    """Vrai si le champ explication est un marqueur d'erreur plutôt qu'une vraie explication."""
+    return text.strip().startswith(ERROR_PREFIXES)
+
+
+def existing_explanation(row):
+    """Explication déjà présente dans le 8e champ d'une ligne (CSV déjà enrichi), None si vide ou en erreur."""
+    if len(row) < 8 or not row[7].strip() or is_error_explanation(row[7]):
+        return None
+    return row[7].strip()
+
+
+def build_message_params(prompt):
+    """
+    Paramètres d'un appel Messages (partagés par l'appel direct et les Message Batches).
+
+    `prompt` est soit un texte brut, soit un dict {"system", "user"} : le bloc système,
+    identique pour toutes les questions, n'est marqué pour le prompt caching que s'il est
+    assez long pour être mis en cache (MIN_CACHEABLE_TOKENS), ce qui n'est le cas d'aucun
+    des prompts livrés.
+    """
+    params = {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+    if isinstance(prompt, dict):
+        params["max_tokens"] = prompt.get("max_tokens", MAX_TOKENS)
+        system = {"type": "text", "text": prompt["system"]}
+        if len(prompt["system"]) >= MIN_CACHEABLE_CHARS:
+            system["cache_control"] = {"type": "ephemeral"}
+        params["system"] = [system]
+        params["messages"] = [{"role": "user", "content": prompt["user"]}]
+    else:
+        params["messages"] = [{"role": "user", "content": prompt}]
+    return params
+
+
+def prompt_chars(prompt):
+    """Nombre de caractères envoyés pour un prompt (texte brut ou dict {"system", "user"})."""
+    if isinstance(prompt, dict):
+        return len(prompt["system"]) + len(prompt["user"])
+    return len(prompt)
+
+
+def message_text(message):
+    """Texte de la réponse sur une seule ligne."""
+    return message.content[0].text.strip().replace("\n", " ")
+
+
+def call_claude(client, prompt, limiter=None, call_info=None):
+    """
+    Appelle l'API Claude pour un prompt et renvoie l'explication sur une seule ligne.
+
+    Si `call_info` (dict) est fourni, il reçoit l'objet `usage` de la réponse.
+    """
+    raw = client.messages.with_raw_response.create(**build_message_params(prompt))
+    if limiter is not None:
+        limiter.update_from_headers(raw.headers)
+    message = raw.parse()
+    if call_info is not None:
+        call_info["usage"] = getattr(message, "usage", None)
+    return message_text(message)
+
+
+def request_explanation(client, prompt, limiter=None, metrics=None, hedge=None):
+    """
+    Appel limité en débit, relancé avec backoff sur les erreurs transitoires.
+
+    Si `metrics` (RunMetrics) est fourni, l'appel y est enregistré : latence totale
+    relances comprises, tokens consommés, nombre de relances et issue.
+    Si `hedge` (HedgePolicy) est fourni, une tentative trop lente est doublée.
+    """
+    # Les clients de client_pool apportent le limiteur de leur clé (ou de leurs clés : ShardedClient)
+    limiter = limiter or getattr(client, "limiter", None) or SHARED_LIMITER
+    call_info = {"attempts": 0}
+    cost = request_tokens(build_message_params(prompt))
+
+    def record_extra(info):
+        # Tentative doublée perdante : sa réponse est ignorée mais ses tokens sont facturés
+        if metrics is not None:
+            metrics.record_call(None, info.get("usage"), outcome="hedge")
+
+    def attempt(lim):
+        call_info["attempts"] += 1
+        if hedge is not None:
+            return hedge.call(lambda info: call_claude(client, prompt, lim, info), lim, call_info, record_extra,
+                              cost=cost)
+        return call_claude(client, prompt, lim, call_info)
+
+    start = time.perf_counter()
+    try:
+        explanation = call_with_retries(attempt, limiter, max_retries=MAX_RETRIES, cost=cost)
+    except Exception:
+        if metrics is not None:
+            metrics.record_call(time.perf_counter() - start, retries=max(0, call_info["attempts"] - 1),
+                                outcome="error", hedged=call_info.get("hedged", False),
+                                hedge_won=call_info.get("hedge_won", False))
+        raise
+    if metrics is not None:
+        metrics.note_rate_limit(limiter.observed_rpm())
+        metrics.record_call(time.perf_counter() - start, call_info.get("usage"), call_info["attempts"] - 1,
+                            hedged=call_info.get("hedged", False), hedge_won=call_info.get("hedge_won", False),
+                            prompt_chars=prompt_chars(prompt))
+    return explanation
+
+
+def call_claude_with_retries(client, prompt, limiter=None, cache=None, metrics=None, hedge=None):
+    """
+    Appel limité en débit, relancé avec backoff sur les erreurs transitoires.
+
+    Si un `cache` est fourni, une explication déjà générée pour le même prompt et les
+    mêmes paramètres est renvoyée sans appel à l'API.
+    """
+    key = None
+    if cache is not None:
+        key = cache_key(prompt, MODEL, TEMPERATURE, MAX_TOKENS)
+        cached = cache.get(key)
+        if cached is not None:
+            if metrics is not None:
+                metrics.record_call(None, outcome="cache")
+            return cached
+    explanation = request_explanation(client, prompt, limiter, metrics, hedge)
+    if cache is not None:
+        cache.put(key, explanation)
+    return explanation
+
+
+def explain_row(idx, prompt, client, limiter=None, cache=None, metrics=None, hedge=None):
+    """Renvoie l'explication d'une ligne, ou un marqueur d'erreur à écrire dans la sortie."""
+    if prompt == "INVALID":
+        return f"[ERREUR - Prompt non généré à la ligne {idx+1}]"
+    try:
+        return call_claude_with_retries(client, prompt, limiter, cache, metrics, hedge)
+    except Exception as e:
+        return f"[ERREUR - {str(e)}]"
+
+
+def pack_prompts(prompts):
+    """Regroupe plusieurs prompts {"system", "user"} en une seule requête à réponse JSON."""
+    user = "\n\n".join(f"[{n}]\n{prompt['user']}" for n, prompt in enumerate(prompts, start=1))
+    return {
+        "system": prompts[0]["system"] + " " + PACK_INSTRUCTIONS,
+        "user": user,
+        "max_tokens": MAX_TOKENS * len(prompts),
+    }
+
+
+def parse_packed_response(text, count):
+    """Renvoie {position (0..count-1): explication} pour les entrées lisibles de la réponse JSON."""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    parsed = {}
+    for key, value in data.items():
+        try:
+            position = int(str(key).strip("[] ")) - 1
+        except ValueError:
+            continue
+        if 0 <= position < count and isinstance(value, str) and value.strip():
+            parsed[position] = value.strip().replace("\n", " ")
+    return parsed
+
+
+def explain_pack(indices, prompts, client, limiter=None, cache=None, metrics=None, hedge=None):
+    """
+    Explique un groupe de lignes en une seule requête.
+
+    Les lignes déjà en cache sont écartées avant la constitution des groupes
+    (`stream_explanations`) ; toute ligne absente ou illisible dans la réponse JSON
+    (ou un échec de l'appel groupé) repasse par un appel individuel.
+
+    Returns:
+        dict: {index: explication ou marqueur d'erreur}
+    """
+    results = {}
+    todo = list(indices)
+
+    if len(todo) > 1:
+        packed = pack_prompts([prompts[idx] for idx in todo])
+        try:
+            text = request_explanation(client, packed, limiter, metrics, hedge)
+            parsed = parse_packed_response(text, len(todo))
+        except Exception:
+            parsed = {}
+        for position, idx in enumerate(todo):
+            if position in parsed:
+                results[idx] = parsed[position]
+                if cache is not None:
+                    cache.put(cache_key(prompts[idx], MODEL, TEMPERATURE, MAX_TOKENS), parsed[position])
+
+    # Repli question par question
+    for idx in todo:
+        if idx not in results:
+            results[idx] = explain_row(idx, prompts[idx], client, limiter, cache, metrics, hedge)
+    return results
+
+
+def make_packs(indices, pack_size, parts=None):
+    """Découpe les index en groupes d'au plus `pack_size` lignes consécutives d'une même partie."""
+    packs = []
+    for idx in indices:
+        if (packs and len(packs[-1]) < pack_size
+                and (parts is None or parts[packs[-1][-1]] == parts[idx])):
+            packs[-1].append(idx)
+        else:
+            packs.append([idx])
+    return packs
+
+
+def stream_explanations(items, client, max_in_flight=DEFAULT_MAX_IN_FLIGHT, limiter=None, cache=None, metrics=None,
+                        pack_size=1, hedge=None, executor=None, window=None):
+    """
+    Explique un flux de lignes et rend les résultats au fil de l'eau, dans l'ordre d'entrée.
+
+    `items` produit des tuples (index, ligne, prompt, partie, explication_connue) ; une ligne
+    dont l'explication est déjà connue (journal, question quasi identique) ne part pas à
+    l'API. Avec `pack_size` > 1, les lignes en cache sont écartées puis les autres groupées
+    comme dans `make_packs`. Au plus `window` lignes (par défaut 4 × max_in_flight × pack_size) sont lues
+    d'avance : la mémoire ne dépend pas de la taille du fichier.
+
+    Yields:
+        tuple: (index, ligne, explication, générée) ; `générée` est faux pour une explication connue
+    """
+    window = window or 4 * max(1, int(max_in_flight)) * max(1, pack_size)
+    own_pool = executor is None
+    pool = ThreadPoolExecutor(max_workers=max(1, int(max_in_flight))) if own_pool else executor
+    # Lignes lues et pas encore rendues : [index, ligne, explication | future | None, générée]
+    pending = deque()
+    # Groupe en formation : [(entrée, prompt)] et partie de chaque index
+    pack = []
+    pack_parts = {}
+
+    def explain_single(idx, prompt):
+        return {idx: explain_row(idx, prompt, client, limiter, cache, metrics, hedge)}
+
+    def submit_pack():
+        if not pack:
+            return
+        future = pool.submit(explain_pack, [entry[0] for entry, _ in pack],
+                             {entry[0]: prompt for entry, prompt in pack}, client, limiter, cache, metrics, hedge)
+        for entry, _ in pack:
+            entry[2] = future
+        pack.clear()
+        pack_parts.clear()
+
+    def add_to_pack(entry, prompt, part):
+        """Même découpage que `make_packs` (et donc que l'estimation de preflight), au fil du flux."""
+        members = [member[0] for member, _ in pack] + [entry[0]]
+        if len(make_packs(members, pack_size, {**pack_parts, entry[0]: part})) > 1:
+            submit_pack()
+        pack.append((entry, prompt))
+        pack_parts[entry[0]] = part
+        if len(pack) >= pack_size:
+            submit_pack()
+
+    def cached_explanation(prompt):
+        if cache is None:
+            return None
+        cached = cache.get(cache_key(prompt, MODEL, TEMPERATURE, MAX_TOKENS))
+        if cached is not None and metrics is not None:
+            metrics.record_call(None, outcome="cache")
+        return cached
+
+    def drain(limit):
+        """Rend les lignes prêtes en tête de file, en attendant tant qu'il y en a plus de `limit`."""
+        while pending:
+            entry = pending[0]
+            must_wait = len(pending) > limit
+            if entry[2] is None:
+                # Groupe encore en formation
+                if not must_wait:
+                    return
+                submit_pack()
+            value = entry[2]
+            if isinstance(value, Future):
+                if not must_wait and not value.done():
+                    return
+                value = value.result()[entry[0]]
+            pending.popleft()
+            if entry[3] and metrics is not None:
+                metrics.record_rows()
+            yield entry[0], entry[1], value, entry[3]
+
+    try:
+        for idx, row, prompt, part, known in items:
+            if known is not None:
+                entry = [idx, row, known, False]
+            elif pack_size > 1 and prompt != "INVALID":
+                # Une ligne en cache ne prend pas de place dans un groupe
+                cached = cached_explanation(prompt)
+                entry = [idx, row, cached, True]
+                if cached is None:
+                    add_to_pack(entry, prompt, part)
+            else:
+                entry = [idx, row, pool.submit(explain_single, idx, prompt), True]
+            pending.append(entry)
+            yield from drain(window)
+        submit_pack()
+        yield from drain(0)
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from run_metrics import percentile
+
+
+# Percentile de latence au-delà duquel une requête est doublée
+HEDGE_PERCENTILE = 95
+# Part maximale de requêtes supplémentaires (0.1 = au plus une requête doublée sur dix)
+HEDGE_BUDGET = 0.1
+# Nombre de latences observées avant d'autoriser le premier doublement
+HEDGE_MIN_SAMPLES = 20
+# Nombre de latences récentes conservées pour le calcul du seuil
+HEDGE_WINDOW = 200
+# Threads du pool commun à toutes les politiques : deux tentatives par requête en vol,
+# pour quelques travaux simultanés au maximum de l'interface (50 en vol). Les threads
+# ne sont créés qu'à la demande.
+HEDGE_MAX_WORKERS = 200
+
+_shared_executor = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_executor():
+    """Pool de threads commun à toutes les HedgePolicy du processus."""
+    global _shared_executor
+    with _shared_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return _shared_executor
+
+
+class HedgePolicy:
+    """
+    Doublement des requêtes lentes : si une requête n'a pas répondu au p95 des latences
+    observées, une seconde requête identique part, et la première réponse arrivée est gardée.
+
+    Le nombre de requêtes doublées reste sous `budget` × requêtes primaires. La requête
+    perdante n'est pas interrompue côté HTTP : sa réponse est ignorée, mais ses tokens
+    sont facturés et remontés par `on_extra`. Les tentatives tournent dans le pool commun
+    (`get_shared_executor`) sauf si `executor` est fourni.
+    """
+
+    def __init__(self, pct=HEDGE_PERCENTILE, budget=HEDGE_BUDGET, min_samples=HEDGE_MIN_SAMPLES,
+                 window=HEDGE_WINDOW, executor=None):
+        self.pct = pct
+        self.budget = budget
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._executor = executor or get_shared_executor()
+        self._lock = threading.Lock()
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self):
+        """Seuil de doublement en secondes, ou None tant que l'historique est trop court."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return percentile(list(self._latencies), self.pct)
+
+    def _try_spend(self):
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.primaries:
+                return False
+            self.hedges += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {"primaries": self.primaries, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+    def call(self, fn, limiter=None, call_info=None, on_extra=None, cost=(0, 0)):
+        """
+        Exécute `fn(info)` avec doublement éventuel et renvoie le premier résultat obtenu.
+
+        Chaque tentative reçoit son propre dict `info`. Celui de la tentative retenue est
+        recopié dans `call_info` (dict, facultatif), avec "hedged" (une seconde requête est
+        partie) et "hedge_won" (c'est elle qui a répondu la première). Celui de la tentative
+        perdante est passé à `on_extra(info)` quand elle aboutit, éventuellement après le retour.
+        La requête doublée prélève `cost` (voir `AdaptiveRateLimiter.acquire`) comme la primaire.
+        """
+        with self._lock:
+            self.primaries += 1
+        threshold = self.delay()
+
+        def timed():
+            info = {}
+            start = time.perf_counter()
+            result = fn(info)
+            return result, time.perf_counter() - start, info
+
+        started = time.perf_counter()
+        primary = self._executor.submit(timed)
+        if threshold is None or wait([primary], timeout=threshold).done or not self._try_spend():
+            result, latency, info = primary.result()
+            self.observe(latency)
+            if call_info is not None:
+                call_info.update(info)
+            return result
+
+        def duplicate():
+            # Le jeton du limiteur n'est pris que si la requête primaire n'a pas répondu entre-temps
+            if limiter is not None:
+                limiter.acquire(*cost)
+            if primary.done():
+                raise _PrimaryFinished()
+            return timed()
+
+        def report_loser(future):
+            if on_extra is None or future.cancelled() or future.exception() is not None:
+                return
+            on_extra(future.result()[2])
+
+        if call_info is not None:
+            call_info["hedged"] = True
+        hedge = self._executor.submit(duplicate)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, latency, info = future.result()
+                except _PrimaryFinished:
+                    continue
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                for other in (primary, hedge):
+                    if other is not future:
+                        other.cancel()
+                        other.add_done_callback(report_loser)
+                if call_info is not None:
+                    call_info.update(info)
+                if future is hedge:
+                    with self._lock:
+                        self.hedge_wins += 1
+                    if call_info is not None:
+                        call_info["hedge_won"] = True
+                    # Latence de la primaire au moins égale au temps écoulé : le seuil ne dérive pas vers le bas
+                    latency = time.perf_counter() - started
+                self.observe(latency)
+                return result
+        raise first_error
+
+
+class _PrimaryFinished(Exception):
+    """Requête doublée abandonnée avant l'envoi : la primaire a déjà répondu."""
@@ -0,0 +1,160 @@
+"""
+Conversion d'un dossier d'annales Word (.docx) en CSV bruts prêts pour le pipeline.
+
+Usage :
+    python ingest_annales.py annales_docx --output questions_csv_raw --workers 8
+
+Chaque document est découpé dans un processus séparé (un cœur par document) et donne
+<nom>.csv, séparateur $, dans le dossier de sortie. Avec --shard (compilation géante,
+éventuellement passée seule en argument), les documents sont lus l'un après l'autre et
+ce sont leurs parties qui se répartissent sur les cœurs (la lecture du XML reste séquentielle,
+le gain plafonne vers ×2,5 : voir `parse_qcm_sharded`). Un bilan par fichier indique les
+questions exportées, rejetées (découpage trop incertain) et à relire (confiance faible).
+
+Les annales ne donnent pas les bonnes réponses : la colonne "Correct Answer" des CSV est
+vide, et le pipeline marque INVALID toute ligne sans lettre A-D. Elle est à compléter
+(corrigé de l'épreuve) avant la génération des explications.
+
+Code de sortie : 0 si tout est converti, 1 si un document n'a pas pu être lu, 2 si des
+questions ont été rejetées.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from operator import itemgetter
+from pathlib import Path
+
+from run_journal import atomic_write_text
+from word_to_csv import (MIN_CONFIDENCE, REVIEW_CONFIDENCE, iter_docx_lines, parse_qcm_lines, parse_qcm_sharded,
+                         remove_duplicates, write_questions_csv)
+
+
+DEFAULT_OUTPUT_DIR = Path("questions_csv_raw")
+# Numéros de questions à relire affichés par fichier
+MAX_LISTED = 20
+# Rappel affiché en fin de conversion : sans réponse, le pipeline ne génère rien
+ANSWER_KEY_NOTE = ("ℹ️ Colonne « Correct Answer » vide dans les CSV : renseigne la lettre de la bonne réponse "
+                   "(A-D, corrigé de l'épreuve) avant la génération, sinon toutes les lignes seront INVALID.")
+
+
+def find_documents(input_dir):
+    """Documents .docx du dossier (ou le document lui-même), sans les fichiers verrous de Word (~$...)."""
+    if Path(input_dir).is_file():
+        return [Path(input_dir)]
+    return sorted(path for path in Path(input_dir).glob("*.docx") if not path.name.startswith("~$"))
+
+
+def ingest_document(path, output_dir=DEFAULT_OUTPUT_DIR, executor=None, workers=1):
+    """
+    Découpe un document et écrit son CSV ; exécuté dans un processus du pool.
+
+    Avec `executor` (pool de `workers` processus), le document est lu dans le processus
+    appelant et ses parties sont découpées en parallèle dans le pool.
+
+    Returns:
+        dict: {"file", "csv_path", "questions", "rejected", "low_confidence", "duplicates",
+        "to_review" (numéros des questions à relire), "error"}
+    """
+    path = Path(path)
+    summary = {"file": path.name, "csv_path": None, "questions": 0, "rejected": 0, "low_confidence": 0,
+               "duplicates": 0, "to_review": [], "error": None}
+    # (ligne, à relire)
+    kept = []
+    try:
+        if executor is None:
+            scored = parse_qcm_lines(iter_docx_lines(path))
+        else:
+            scored = parse_qcm_sharded(iter_docx_lines(path), executor, window=2 * workers)
+        for row, confidence in scored:
+            if confidence < MIN_CONFIDENCE:
+                summary["rejected"] += 1
+                continue
+            kept.append((row, confidence < REVIEW_CONFIDENCE))
+    except (OSError, zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        summary["error"] = f"{type(e).__name__} : {e}"
+        return summary
+
+    unique = remove_duplicates(kept, row_of=itemgetter(0))
+    summary["duplicates"] = len(kept) - len(unique)
+    summary["questions"] = len(unique)
+    summary["to_review"] = [row[0].split(" ", 1)[0] for row, review in unique if review]
+    summary["low_confidence"] = len(summary["to_review"])
+    buffer = io.StringIO()
+    write_questions_csv(buffer, [row for row, _ in unique])
+    csv_path = Path(output_dir) / f"{path.stem}.csv"
+    csv_path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(csv_path, buffer.getvalue())
+    summary["csv_path"] = str(csv_path)
+    return summary
+
+
+def ingest_folder(input_dir, output_dir=DEFAULT_OUTPUT_DIR, workers=None, shard=False, log=print):
+    """
+    Convertit tous les .docx de `input_dir` en parallèle et renvoie les bilans dans l'ordre des fichiers.
+
+    Par défaut, un document par processus ; avec `shard`, un document à la fois, découpé
+    partie par partie sur tous les processus.
+    """
+    paths = find_documents(input_dir)
+    log(f"🔍 {len(paths)} document(s) trouvé(s) dans {input_dir}")
+    workers = workers or os.cpu_count()
+    summaries = []
+
+    def report(summary):
+        summaries.append(summary)
+        if summary["error"]:
+            log(f"❌ {summary['file']} : {summary['error']}")
+            return
+        log(f"{'⚠️' if summary['rejected'] or summary['low_confidence'] else '✅'} {summary['file']} : "
+            f"{summary['questions']} question(s), {summary['rejected']} rejetée(s), "
+            f"{summary['low_confidence']} à relire"
+            + (f" ({', '.join(summary['to_review'][:MAX_LISTED])}"
+               f"{', …' if len(summary['to_review']) > MAX_LISTED else ''})" if summary["to_review"] else ""))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if shard:
+            for path in paths:
+                report(ingest_document(path, output_dir, executor=pool, workers=workers))
+        else:
+            futures = [pool.submit(ingest_document, path, output_dir) for path in paths]
+            for future in as_completed(futures):
+                report(future.result())
+    order = {path.name: n for n, path in enumerate(paths)}
+    summaries.sort(key=lambda summary: order[summary["file"]])
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convertit un dossier d'annales Word en CSV bruts ($)")
+    parser.add_argument("input_dir", type=Path, help="Dossier des annales .docx (ou un seul document)")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT_DIR, help="Dossier des CSV bruts")
+    parser.add_argument("--workers", type=int, default=None, help="Processus en parallèle (par défaut : un par cœur)")
+    parser.add_argument("--shard", action="store_true",
+                        help="Répartir les parties de chaque document sur les processus (compilation géante)")
+    args = parser.parse_args(argv)
+
+    if not args.input_dir.exists():
+        parser.error(f"dossier introuvable : {args.input_dir}")
+
+    start = time.time()
+    summaries = ingest_folder(args.input_dir, args.output, workers=args.workers, shard=args.shard)
+    failed = [summary for summary in summaries if summary["error"]]
+    print(f"🎉 {len(summaries) - len(failed)}/{len(summaries)} document(s) converti(s) en {time.time() - start:.1f} s : "
+          f"{sum(s['questions'] for s in summaries)} question(s), {sum(s['rejected'] for s in summaries)} rejetée(s), "
+          f"{sum(s['low_confidence'] for s in summaries)} à relire → {args.output}")
+    if any(summary["questions"] for summary in summaries):
+        print(ANSWER_KEY_NOTE)
+    if failed:
+        return 1
+    if any(summary["rejected"] for summary in summaries):
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
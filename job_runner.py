@@ -0,0 +1,171 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Nombre de travaux exécutés en même temps (les autres attendent leur tour)
+DEFAULT_MAX_JOBS = 2
+# Durée (s) pendant laquelle un travail terminé reste consultable avant d'être oublié
+FINISHED_JOB_TTL = 3600
+# Intervalle (s) entre deux relectures de l'état des travaux par l'interface
+JOB_POLL_INTERVAL = 1
+
+
+class Job:
+    """État d'un travail de fond, mis à jour par la tâche et lu par l'interface."""
+
+    def __init__(self, job_id, label="", keys=()):
+        self.id = job_id
+        self.label = label
+        self.keys = tuple(sorted(set(keys)))
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def update(self, progress=None, message=None):
+        """Avancement (0 à 1) et message courant ; appelé depuis le thread de la tâche."""
+        with self._lock:
+            if progress is not None:
+                self.progress = min(1.0, max(0.0, progress))
+            if message is not None:
+                self.message = message
+
+    def log(self, message):
+        """Ajoute une information durable au journal du travail."""
+        with self._lock:
+            self.messages.append(message)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "label": self.label,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "messages": list(self.messages),
+                "error": self.error,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+            }
+
+
+class JobRunner:
+    """
+    Exécute les générations dans des threads du processus, hors du thread du script Streamlit.
+
+    Un travail survit donc aux reruns et aux reconnexions du navigateur : l'interface ne
+    fait que relire son état par son identifiant.
+
+    Les travaux qui déclarent une même clé (les sorties qu'ils écrivent, voir
+    `enrichment.output_key`) s'exécutent l'un après l'autre, jamais en même temps.
+
+    L'exécuteur est commun au processus : chaque session ne relit que les identifiants
+    qu'elle a soumis. Un travail terminé est oublié `finished_ttl` secondes après sa fin.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_JOBS, finished_ttl=FINISHED_JOB_TTL):
+        self.finished_ttl = finished_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, label="", keys=(), **kwargs):
+        """Programme `fn(job, *args, **kwargs)` et renvoie l'identifiant du travail."""
+        job = Job(uuid.uuid4().hex[:12], label, keys)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            locks = [self._key_locks.setdefault(key, threading.Lock()) for key in job.keys]
+        self._executor.submit(self._run, job, fn, args, kwargs, locks)
+        return job.id
+
+    def _prune(self):
+        """Oublie les travaux terminés depuis plus de `finished_ttl` secondes (verrou pris)."""
+        limit = time.time() - self.finished_ttl
+        for job_id, job in list(self._jobs.items()):
+            with job._lock:
+                expired = job.finished is not None and job.finished < limit
+            if expired:
+                del self._jobs[job_id]
+
+    def _run(self, job, fn, args, kwargs, locks):
+        # Clés prises dans l'ordre trié : deux travaux ne peuvent pas s'attendre mutuellement
+        held = []
+        try:
+            for lock in locks:
+                if not lock.acquire(blocking=False):
+                    job.update(message="⏳ En attente d'un autre travail qui écrit les mêmes sorties")
+                    lock.acquire()
+                held.append(lock)
+            self._execute(job, fn, args, kwargs)
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+    def _execute(self, job, fn, args, kwargs):
+        with job._lock:
+            job.status = "running"
+            job.started = time.time()
+            job.message = ""
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            with job._lock:
+                job.status = "failed"
+                job.error = f"{e}\n{traceback.format_exc()}"
+                job.finished = time.time()
+            return
+        with job._lock:
+            job.result = result
+            job.status = "done"
+            job.progress = 1.0
+            job.finished = time.time()
+
+    def status(self, job_id):
+        """Instantané de l'état du travail (KeyError si l'identifiant est inconnu ou déjà oublié)."""
+        with self._lock:
+            job = self._jobs[job_id]
+        return job.snapshot()
+
+    def result(self, job_id):
+        """Résultat d'un travail terminé, None tant qu'il tourne ou s'il a échoué."""
+        with self._lock:
+            job = self._jobs[job_id]
+        with job._lock:
+            return job.result if job.status == "done" else None
+
+    def busy_keys(self):
+        """Clés déclarées par les travaux en attente ou en cours."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        busy = set()
+        for job in jobs:
+            with job._lock:
+                if job.status in ("queued", "running"):
+                    busy.update(job.keys)
+        return busy
+
+
+_default_runner = None
+_default_lock = threading.Lock()
+
+
+def get_default_runner():
+    """Exécuteur de travaux du processus, partagé par toutes les sessions Streamlit."""
+    global _default_runner
+    with _default_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner()
+        return _default_runner
@@ -0,0 +1,306 @@
+"""
+Serveur local imitant l'API Anthropic (Messages et Message Batches), sans coût ni quota.
+
+Usage :
+    python mock_anthropic_server.py --port 8765 --latency 2 --latency-dist lognormal --error-rate 0.05
+puis, côté client :
+    anthropic.Anthropic(api_key="test", base_url="http://127.0.0.1:8765")
+
+La latence suit une loi fixe, uniforme ou log-normale (médiane --latency), avec en option
+une petite part d'appels bloqués (--stall-rate, --stall-latency). Les 429 viennent soit d'un
+tirage (--error-rate), soit du dépassement de --rpm sur une fenêtre glissante d'une minute.
+Une part des requêtes d'un batch peut revenir en erreur (--batch-error-rate).
+GET /mock/stats renvoie les compteurs (requêtes, 429, appels bloqués, requêtes de batch, tokens facturés).
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _now_iso(delta=0):
+    return (datetime.now(timezone.utc) + timedelta(seconds=delta)).isoformat().replace("+00:00", "Z")
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _text(content):
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content)
+    return content or ""
+
+
+def fake_message(params):
+    """Réponse Messages déterministe construite à partir du prompt (JSON numéroté pour une requête groupée)."""
+    prompt = _text(params["messages"][-1]["content"])
+    numbers = re.findall(r"^\[(\d+)\]", prompt, re.M)
+    if numbers:
+        text = json.dumps({n: f"Explication simulée n°{n}" for n in numbers}, ensure_ascii=False)
+    else:
+        text = f"Explication simulée : {prompt[-80:].strip()}"
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "mock"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(text)},
+    }
+
+
+class MockAnthropicState:
+    """État partagé du serveur : batches en cours, paramètres de simulation et compteurs."""
+
+    def __init__(self, latency=0.0, batch_duration=1.0, requests_per_minute=1000, latency_dist="fixed",
+                 latency_sigma=0.5, stall_rate=0.0, stall_latency=30.0, error_rate=0.0, retry_after=1,
+                 batch_error_rate=0.0, seed=None):
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.batch_duration = batch_duration
+        self.batch_error_rate = batch_error_rate
+        self.requests_per_minute = requests_per_minute
+        self.random = random.Random(seed)
+        self.batches = {}
+        self.system_prompts = set()
+        self.recent = deque()
+        self.stats = {"requests": 0, "throttled": 0, "stalled": 0, "batch_requests": 0, "input_tokens": 0, "cache_creation_input_tokens": 0,
+                      "cache_read_input_tokens": 0, "output_tokens": 0}
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        """Latence d'un appel Messages selon la loi configurée."""
+        with self.lock:
+            if self.stall_rate and self.random.random() < self.stall_rate:
+                self.stats["stalled"] += 1
+                return self.stall_latency
+            if not self.latency:
+                return 0.0
+            if self.latency_dist == "uniform":
+                return self.random.uniform(0, 2 * self.latency)
+            if self.latency_dist == "lognormal":
+                return self.random.lognormvariate(math.log(self.latency), self.latency_sigma)
+            return self.latency
+
+    def admit(self):
+        """
+        Enregistre une requête Messages et renvoie (accepté, requêtes restantes sur la minute).
+
+        Une requête est refusée (429) au-delà du quota par minute, ou par tirage selon `error_rate`.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= 60:
+                self.recent.popleft()
+            self.stats["requests"] += 1
+            injected = self.error_rate and self.random.random() < self.error_rate
+            if injected or len(self.recent) >= self.requests_per_minute:
+                self.stats["throttled"] += 1
+                return False, max(0, self.requests_per_minute - len(self.recent))
+            self.recent.append(now)
+            return True, self.requests_per_minute - len(self.recent)
+
+    def account(self, params, message):
+        """Compte les tokens facturés ; un bloc système marqué cache_control déjà vu est lu en cache."""
+        usage = message["usage"]
+        system = params.get("system")
+        with self.lock:
+            if isinstance(system, list):
+                text = _text(system)
+                tokens = estimate_tokens(text)
+                if any(block.get("cache_control") for block in system):
+                    field = "cache_read_input_tokens" if text in self.system_prompts else "cache_creation_input_tokens"
+                    self.system_prompts.add(text)
+                    usage[field] = tokens
+                else:
+                    usage["input_tokens"] += tokens
+            elif system:
+                usage["input_tokens"] += estimate_tokens(system)
+            for field in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens"):
+                self.stats[field] += usage.get(field, 0)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def create_batch(self, requests, base_url):
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        with self.lock:
+            self.stats["batch_requests"] += len(requests)
+            self.batches[batch_id] = {
+                "requests": requests,
+                # Requêtes en erreur, tirées à la soumission
+                "errored": {req["custom_id"] for req in requests
+                            if self.batch_error_rate and self.random.random() < self.batch_error_rate},
+                "created": time.time(),
+                "created_at": _now_iso(),
+                "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results",
+            }
+        return self.batch_view(batch_id)
+
+    def batch_view(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+        ended = time.time() - batch["created"] >= self.batch_duration
+        errored = len(batch["errored"])
+        count = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count - errored if ended else 0,
+                "errored": errored if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": batch["created_at"],
+            "expires_at": _now_iso(24 * 3600),
+            "ended_at": _now_iso() if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": batch["results_url"] if ended else None,
+        }
+
+    def batch_results(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+        results = []
+        for req in batch["requests"]:
+            if req["custom_id"] in batch["errored"]:
+                results.append({"custom_id": req["custom_id"], "result": {"type": "errored", "error": {
+                    "type": "error", "error": {"type": "api_error", "message": "Erreur de batch simulée"}}}})
+                continue
+            message = fake_message(req["params"])
+            self.account(req["params"], message)
+            results.append({"custom_id": req["custom_id"], "result": {"type": "succeeded", "message": message}})
+        return results
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            payload = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("request-id", f"req_{uuid.uuid4().hex[:24]}")
+            for name, value in (headers or {}).items():
+                self.send_header(name, str(value))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def _base_url(self):
+            host, port = self.server.server_address[:2]
+            return f"http://{host}:{port}"
+
+        def _not_found(self):
+            self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+        def do_POST(self):
+            path = self.path.split("?")[0]
+            if path == "/v1/messages":
+                params = self._read_json()
+                accepted, remaining = state.admit()
+                headers = {
+                    "anthropic-ratelimit-requests-limit": state.requests_per_minute,
+                    "anthropic-ratelimit-requests-remaining": remaining,
+                }
+                if not accepted:
+                    headers["retry-after"] = state.retry_after
+                    self._send(429, {"type": "error", "error": {"type": "rate_limit_error",
+                                                                "message": "Limite de requêtes simulée atteinte"}},
+                               headers=headers)
+                    return
+                latency = state.sample_latency()
+                if latency:
+                    time.sleep(latency)
+                message = fake_message(params)
+                state.account(params, message)
+                self._send(200, message, headers=headers)
+            elif path == "/v1/messages/batches":
+                body = self._read_json()
+                self._send(200, state.create_batch(body["requests"], self._base_url()))
+            else:
+                self._not_found()
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/mock/stats":
+                self._send(200, state.snapshot())
+                return
+            parts = self.path.split("?")[0].strip("/").split("/")
+            # v1 / messages / batches / {id} [/ results]
+            if len(parts) >= 4 and parts[:3] == ["v1", "messages", "batches"] and parts[3] in state.batches:
+                if len(parts) == 4:
+                    self._send(200, state.batch_view(parts[3]))
+                    return
+                if len(parts) == 5 and parts[4] == "results":
+                    lines = "\n".join(json.dumps(r) for r in state.batch_results(parts[3]))
+                    self._send(200, lines.encode("utf-8"), content_type="application/binary")
+                    return
+            self._not_found()
+
+    return Handler
+
+
+def start_mock_server(host="127.0.0.1", port=0, **state_kwargs):
+    """Démarre le serveur dans un thread et renvoie (serveur, base_url). Port 0 : port libre."""
+    state = MockAnthropicState(**state_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API Anthropic")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latence (médiane) par appel Messages (s)")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="fixed",
+                        help="Loi de la latence")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Dispersion de la loi log-normale")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Part d'appels bloqués")
+    parser.add_argument("--stall-latency", type=float, default=30.0, help="Durée d'un appel bloqué (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Part de réponses 429 tirées au hasard")
+    parser.add_argument("--rpm", type=int, default=1000, help="Quota de requêtes par minute")
+    parser.add_argument("--batch-duration", type=float, default=1.0, help="Durée de traitement d'un batch (s)")
+    parser.add_argument("--batch-error-rate", type=float, default=0.0, help="Part de requêtes de batch en erreur")
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.host, args.port, latency=args.latency, batch_duration=args.batch_duration,
+                                    requests_per_minute=args.rpm, latency_dist=args.latency_dist,
+                                    latency_sigma=args.latency_sigma, stall_rate=args.stall_rate,
+                                    stall_latency=args.stall_latency, error_rate=args.error_rate,
+                                    batch_error_rate=args.batch_error_rate)
+    print(f"Serveur Anthropic simulé sur {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
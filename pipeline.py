@@ -0,0 +1,232 @@
+import csv
+import io
+import itertools
+import json
+import os
+import re
+from pathlib import Path
+
+from run_journal import atomic_write_text
+
+
+OUTPUT_DIR = Path("out")
+# Gabarit HTML du quiz et nom du JSON d'exemple qu'il référence
+HTML_TEMPLATE_PATH = Path("loic.html")
+TEMPLATE_JSON_NAME = "BIA_Annales_2016.json"
+
+
+# ======================== PROMPTS ============================
+# Les consignes pédagogiques sont fixes : elles partent dans un bloc système identique
+# d'un appel à l'autre, seule la question change dans le message. Elles restent sous le
+# minimum du cache de prompt (1024 tokens, voir generation_engine.MIN_CACHEABLE_TOKENS) :
+# elles sont facturées à chaque appel tant qu'elles ne sont pas plus longues.
+SYSTEM_V1 = (
+    "Explique de manière scientifique et précise, en 2 à 3 phrases adaptées au niveau d'un élève de 3e, "
+    "pourquoi la réponse correcte fournie est correcte. "
+    "Ta réponse ne doit contenir que l'explication, sans retour à la ligne ni remarque supplémentaire."
+)
+
+SYSTEM_V2 = (
+    "Tu es un professeur en aéronautique chargé d'aider un élève de 3e qui prépare le Brevet d’Initiation Aéronautique (BIA). "
+    "Explique en 2 à 3 phrases pourquoi la bonne réponse fournie est scientifiquement correcte, en utilisant les termes techniques vus dans le cadre du BIA "
+    "et adaptés à un jeune public, et en vulgarisant si nécessaire. "
+    "L’explication doit être concise, rigoureuse, sans retour à la ligne ni mention des mauvaises réponses. "
+    "Réponds uniquement par l’explication finale à afficher dans un QCM en ligne."
+)
+
+def prompt_v1(question, answer):
+    return {
+        "system": SYSTEM_V1,
+        "user": f"Question : {question}\nRéponse correcte : {answer}",
+    }
+
+def prompt_v2(question, answer):
+    return {
+        "system": SYSTEM_V2,
+        "user": f"Voici la question et sa bonne réponse :\nQuestion : {question}\nBonne réponse : {answer}",
+    }
+
+# Prompts disponibles, dans l'ordre d'affichage : ajouter une version ici l'ajoute au comparateur
+PROMPT_BUILDERS = {"V1": prompt_v1, "V2": prompt_v2}
+
+def prompt_template(version):
+    """Texte envoyé pour une version de prompt, question et réponse remplacées par des repères (affichage)."""
+    prompt = PROMPT_BUILDERS[version]("[question]", "[bonne réponse]")
+    return f"Consigne (bloc système) :\n{prompt['system']}\n\nMessage :\n{prompt['user']}"
+
+# ============ UTILITAIRES CSV/JSON POUR LA GÉNÉRATION ============
+def clean_image(image_field):
+    if isinstance(image_field, str) and image_field.strip().lower() in ["", "none", "null", "nan", "undefined"]:
+        return None
+    return image_field.strip()
+
+def parse_csv_line(line, expected_fields=8):
+    while len(line) < expected_fields:
+        line.append("")
+    return {
+        "question": line[0].strip(),
+        "a": line[1].strip(),
+        "b": line[2].strip(),
+        "c": line[3].strip(),
+        "d": line[4].strip(),
+        "correct": line[5].strip().upper(),
+        "image": clean_image(line[6]),
+        "explanation": line[7].strip()
+    }
+
+def get_selected_prompt():
+    try:
+        with open("selected_prompt.txt", "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return "V1"  # Valeur par défaut
+
+
+def is_invalid_row(row):
+    """Vrai si aucun prompt ne peut être construit (lettre de réponse, question ou réponse manquante)."""
+    correct_letter = row[5].strip().upper()
+    if correct_letter not in ['A', 'B', 'C', 'D']:
+        return True
+    return not row[0].strip() or not row["ABCDE".index(correct_letter)+1].strip()
+
+def generate_prompt(row, version):
+    if is_invalid_row(row):
+        return "INVALID"
+    correct_letter = row[5].strip().upper()
+    answer_text = row["ABCDE".index(correct_letter)+1].strip()
+    question_text = row[0].strip()
+    return PROMPT_BUILDERS.get(version, prompt_v2)(question_text, answer_text)
+
+def row_question_answer(row):
+    """Renvoie (question, bonne réponse) d'une ligne CSV, ou None si la lettre de réponse est invalide."""
+    while len(row) < 7:
+        row.append("")
+    correct = row[5].strip().upper()
+    if correct not in ["A", "B", "C", "D"]:
+        return None
+    return row[0].strip(), row["ABCDE".index(correct) + 1].strip()
+
+def question_part(question):
+    """Numéro de partie d'une question numérotée "3.12 ..." (None si la question n'est pas numérotée)."""
+    match = re.match(r"\s*(\d+)\.\d+", question)
+    return match.group(1) if match else None
+
+def detect_delimiter(header_line):
+    """Détecte automatiquement le séparateur entre $ et ,"""
+    if header_line.count("$") > 2:
+        return "$"
+    elif header_line.count(",") > 2:
+        return ","
+    else:
+        return None
+
+
+def iter_question_rows(stream, filename):
+    """
+    Lit un CSV BIA ($ ou ,) ligne à ligne depuis un flux binaire : l'en-tête est retiré
+    et chaque ligne complétée à 7 champs, sans jamais charger tout le fichier.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    first = text.readline()
+    detected_delimiter = detect_delimiter(first)
+
+    if not detected_delimiter:
+        raise ValueError(f"❌ Impossible de détecter le séparateur dans le fichier {filename}.")
+
+    for n, line in enumerate(csv.reader(itertools.chain([first], text), delimiter=detected_delimiter)):
+        # Enlève l'en-tête si présent
+        if n == 0 and line and "question" in line[0].lower():
+            continue
+        if len(line) < 7:
+            line += [""] * (7 - len(line))
+        yield line
+
+
+def load_question_rows(file_bytes, filename):
+    """Décode un CSV BIA ($ ou ,), retire l'en-tête et complète chaque ligne à 7 champs."""
+    return list(iter_question_rows(io.BytesIO(file_bytes), filename))
+
+
+class JsonArrayWriter:
+    """Écrit un tableau JSON élément par élément, avec la mise en forme de `json.dump(..., indent=2)`."""
+
+    def __init__(self, f):
+        self._f = f
+        self.count = 0
+
+    def write(self, item):
+        text = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._f.write(("[\n  " if self.count == 0 else ",\n  ") + text)
+        self.count += 1
+
+    def close(self):
+        self._f.write("\n]" if self.count else "[]")
+
+
+class EnrichedWriter:
+    """
+    Écrit <base>_enriched.csv (séparateur $) et <base>.json au fil des lignes.
+
+    Les lignes arrivent sur disque dès leur écriture, dans des fichiers `.part` renommés à
+    la fermeture : une sortie finale n'est jamais à moitié écrite, et la mémoire utilisée
+    ne dépend pas du nombre de lignes.
+    """
+
+    def __init__(self, base_name, output_dir=OUTPUT_DIR):
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.csv_path = output_dir / f"{base_name}_enriched.csv"
+        self.json_path = output_dir / f"{base_name}.json"
+        self._csv_part = self.csv_path.with_name(self.csv_path.name + ".part")
+        self._json_part = self.json_path.with_name(self.json_path.name + ".part")
+        self._csv_file = open(self._csv_part, "w", encoding="utf-8", newline="")
+        self._json_file = open(self._json_part, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._csv_file, delimiter="$")
+        self._json = JsonArrayWriter(self._json_file)
+
+    def write(self, row):
+        self._csv.writerow(row)
+        self._json.write(parse_csv_line(row))
+        self._csv_file.flush()
+        self._json_file.flush()
+
+    def close(self, commit=True):
+        self._json.close()
+        for f, part, path in ((self._csv_file, self._csv_part, self.csv_path),
+                              (self._json_file, self._json_part, self.json_path)):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            if commit:
+                os.replace(part, path)
+            else:
+                os.remove(part)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(commit=exc_type is None)
+
+
+def save_enriched(base_name, enriched, output_dir=OUTPUT_DIR):
+    """Écrit <base>_enriched.csv (séparateur $) et <base>.json, de façon atomique."""
+    with EnrichedWriter(base_name, output_dir) as writer:
+        for row in enriched:
+            writer.write(row)
+    return writer.csv_path, writer.json_path
+
+
+def render_quiz_html(template_html, json_name):
+    """Page HTML du quiz pointant sur le fichier JSON `json_name`."""
+    return template_html.replace(TEMPLATE_JSON_NAME, json_name)
+
+
+def write_quiz_bundle(json_path, template_html, bundle_dir):
+    """Écrit bundle_dir/<base>/ avec le JSON et sa page HTML ; renvoie le dossier créé."""
+    json_path = Path(json_path)
+    folder = Path(bundle_dir) / json_path.stem
+    folder.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(folder / json_path.name, json_path.read_text(encoding="utf-8"))
+    atomic_write_text(folder / f"{json_path.stem}.html", render_quiz_html(template_html, json_path.name))
+    return folder
@@ -0,0 +1,163 @@
+import io
+import json
+import math
+from pathlib import Path
+
+from explanation_cache import cache_key
+import generation_engine
+from generation_engine import (MAX_TOKENS, MODEL, TEMPERATURE, existing_explanation, make_packs, pack_prompts,
+                               prompt_chars)
+from pipeline import OUTPUT_DIR, generate_prompt, iter_question_rows, question_part
+from run_metrics import estimate_cost
+
+
+# Valeurs par défaut tant qu'aucun run n'a été mesuré
+CHARS_PER_TOKEN = 3.5
+OUTPUT_TOKENS_PER_ROW = 110
+DEFAULT_LATENCY_S = 2.5
+DEFAULT_REQUESTS_PER_MINUTE = 50
+# Part de la latence d'un appel à une question due à la génération de la réponse : c'est
+# elle qui s'allonge avec le nombre de questions d'une requête groupée
+ROW_LATENCY_SHARE = 0.7
+# Nombre de rapports récents utilisés pour la calibration
+CALIBRATION_RUNS = 20
+
+
+def call_latency(latency_s, rows):
+    """Latence estimée d'un appel de `rows` questions, à partir de celle d'un appel à une question."""
+    return latency_s * (1 + (rows - 1) * ROW_LATENCY_SHARE)
+
+
+def load_calibration(report_dir=OUTPUT_DIR, last=CALIBRATION_RUNS):
+    """
+    Calibre l'estimation sur les derniers rapports run_report_*.json (mode interactif).
+
+    La latence médiane d'un rapport est ramenée à celle d'un appel à une question selon le
+    nombre moyen de questions par appel de ce run (requêtes groupées).
+
+    Returns:
+        dict: caractères par token d'entrée, tokens de sortie par ligne, latence d'un appel
+        à une question, limite de requêtes par minute du dernier run qui l'a connue et
+        nombre de rapports exploités
+    """
+    reports = []
+    for path in sorted(Path(report_dir).glob("run_report_*.json"))[-last:]:
+        try:
+            summary = json.loads(path.read_text(encoding="utf-8"))["summary"]
+        except (OSError, ValueError, KeyError):
+            continue
+        if summary.get("mode") == "interactive" and summary.get("api_calls"):
+            reports.append(summary)
+
+    chars = sum(r.get("prompt_chars", 0) for r in reports)
+    input_tokens = sum(r["uncached_input_tokens"] + r["cached_input_tokens"] + r["cache_write_input_tokens"]
+                       for r in reports if r.get("prompt_chars"))
+    generated_rows = sum(max(0, r["rows"] - r.get("reused_rows", 0) - r.get("cache_hits", 0)) for r in reports)
+    output_tokens = sum(r["output_tokens"] for r in reports)
+    latencies = sorted(r["latency_p50_s"] / call_latency(1.0, max(1.0, _rows_per_call(r)))
+                       for r in reports if r.get("latency_p50_s"))
+    limits = [r["rate_limit_rpm"] for r in reports if r.get("rate_limit_rpm")]
+    return {
+        "chars_per_token": chars / input_tokens if chars and input_tokens else CHARS_PER_TOKEN,
+        "output_tokens_per_row": output_tokens / generated_rows if output_tokens and generated_rows
+        else OUTPUT_TOKENS_PER_ROW,
+        "latency_s": latencies[len(latencies) // 2] if latencies else DEFAULT_LATENCY_S,
+        "requests_per_minute": limits[-1] if limits else DEFAULT_REQUESTS_PER_MINUTE,
+        "runs": len(reports),
+    }
+
+
+def _rows_per_call(summary):
+    rows = summary["rows"] - summary.get("reused_rows", 0) - summary.get("cache_hits", 0)
+    return rows / summary["api_calls"]
+
+
+def estimate_file(file_bytes, filename, version, calibration, pack_size=1, cache=None, incremental=True):
+    """
+    Estimation à blanc d'un fichier : lignes, lignes INVALID, lignes déjà expliquées, appels, tokens
+    et temps d'appel cumulé (`latency_work_s`, chaque appel pondéré par son nombre de questions).
+    """
+    estimate = {"file": filename, "rows": 0, "invalid_rows": [], "kept_rows": 0, "cached_rows": 0,
+                "generated_rows": 0, "calls": 0, "input_tokens": 0, "output_tokens": 0, "latency_work_s": 0.0,
+                "error": None}
+    try:
+        rows = list(iter_question_rows(io.BytesIO(file_bytes), filename))
+    except (ValueError, UnicodeDecodeError) as e:
+        estimate["error"] = str(e)
+        return estimate
+
+    prompts, parts, todo = {}, {}, []
+    for idx, row in enumerate(rows):
+        if incremental and existing_explanation(row) is not None:
+            estimate["kept_rows"] += 1
+            continue
+        prompt = generate_prompt(row, version)
+        if prompt == "INVALID":
+            estimate["invalid_rows"].append(idx + 1)
+            continue
+        if cache is not None and cache_key(prompt, MODEL, TEMPERATURE, MAX_TOKENS) in cache:
+            estimate["cached_rows"] += 1
+            continue
+        prompts[idx], parts[idx] = prompt, question_part(row[0])
+        todo.append(idx)
+
+    chars = 0
+    for pack in make_packs(todo, max(1, pack_size), parts):
+        prompt = prompts[pack[0]] if len(pack) == 1 else pack_prompts([prompts[idx] for idx in pack])
+        chars += prompt_chars(prompt)
+        estimate["calls"] += 1
+        estimate["latency_work_s"] += call_latency(calibration["latency_s"], len(pack))
+    estimate["rows"] = len(rows)
+    estimate["generated_rows"] = len(todo)
+    estimate["input_tokens"] = math.ceil(chars / calibration["chars_per_token"])
+    estimate["output_tokens"] = math.ceil(len(todo) * calibration["output_tokens_per_row"])
+    return estimate
+
+
+def estimate_run(files, version, max_in_flight, pack_size=1, cache=None, calibration=None,
+                 requests_per_minute=None, batch=False, incremental=True, limiter=None):
+    """
+    Estimation à blanc d'un run complet, sans aucun appel à l'API.
+
+    La durée est le plus grand de deux planchers : le temps d'appel cumulé réparti sur
+    `max_in_flight` requêtes en vol, et le débit autorisé en requêtes par minute. Une
+    requête groupée dure plus qu'un appel à une question, mais moins que ses questions
+    envoyées une à une (`call_latency`).
+
+    Args:
+        files (list): Liste de (nom_de_fichier, contenu en bytes)
+        cache (ExplanationCache): Les lignes déjà en cache sont comptées comme gratuites
+        requests_per_minute (float): Débit autorisé ; par défaut, la limite annoncée par l'API
+            au `limiter` (celui du client de la clé, à défaut celui du processus), sinon celle du
+            dernier rapport de run
+        incremental (bool): Les explications déjà présentes dans un CSV enrichi sont gratuites
+
+    Returns:
+        dict: {"files": [estimation par fichier], "totals": {...}, "calibration": {...}}
+    """
+    calibration = calibration or load_calibration()
+    limiter = limiter or generation_engine.SHARED_LIMITER
+    requests_per_minute = requests_per_minute or (limiter.observed_rpm()
+                                                 or calibration.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE))
+    estimates = [estimate_file(file_bytes, filename, version, calibration, pack_size, cache, incremental)
+                 for filename, file_bytes in files]
+    calls = sum(e["calls"] for e in estimates)
+    rows_to_generate = sum(e["generated_rows"] for e in estimates)
+    totals = {
+        "rows": sum(e["rows"] for e in estimates),
+        "invalid_rows": sum(len(e["invalid_rows"]) for e in estimates),
+        "kept_rows": sum(e["kept_rows"] for e in estimates),
+        "cached_rows": sum(e["cached_rows"] for e in estimates),
+        "generated_rows": rows_to_generate,
+        "calls": calls,
+        "input_tokens": sum(e["input_tokens"] for e in estimates),
+        "output_tokens": sum(e["output_tokens"] for e in estimates),
+        "files_in_error": sum(1 for e in estimates if e["error"] is not None),
+    }
+    latency_work = sum(e["latency_work_s"] for e in estimates)
+    totals["requests_per_minute"] = requests_per_minute
+    totals["wall_time_s"] = round(max(latency_work / max(1, max_in_flight),
+                                      calls / (requests_per_minute / 60.0) if calls else 0.0), 1)
+    cost = estimate_cost(MODEL, totals, batch)
+    totals["estimated_cost_usd"] = round(cost, 4) if cost is not None else None
+    return {"files": estimates, "totals": totals, "calibration": calibration}
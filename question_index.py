@@ -0,0 +1,191 @@
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+from generation_engine import is_error_explanation
+from pipeline import row_question_answer
+
+
+# Index des questions déjà expliquées, toutes annales confondues
+INDEX_PATH = Path(".cache") / "question_index.sqlite"
+# Similarité de Jaccard minimale entre deux questions (shingles de caractères). Elle ne suffit
+# pas seule : "FL80" et "FL40" diffèrent d'un caractère, les nombres doivent être identiques
+QUESTION_THRESHOLD = 0.9
+# Similarité minimale entre les deux bonnes réponses
+ANSWER_THRESHOLD = 0.9
+SHINGLE_SIZE = 4
+
+_NUMBERING = re.compile(r"^\s*\d+\s*[.)]\s*\d*\s*")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Signe collé à un nombre ("-4 °C", "+ 5 %", moins typographique compris)
+_SIGNED_NUMBER = re.compile(r"([+\-\u2212])\s*(?=\d)")
+
+
+def normalize(text):
+    """
+    Minuscules, accents retirés, numérotation "1.12" de tête et ponctuation supprimées.
+
+    Le signe d'un nombre est conservé sous forme de préfixe ("-4" devient "m4", "+4" "p4") :
+    "+4 °C" et "-4 °C" ne sont pas la même question.
+    """
+    text = _NUMBERING.sub("", text or "")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _SIGNED_NUMBER.sub(lambda m: " p" if m.group(1) == "+" else " m", text)
+    text = text.lower().replace("œ", "oe").replace("æ", "ae")
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def numeric_tokens(normalized):
+    """Mots d'un texte normalisé qui contiennent un chiffre (nombres, signes, "fl80"), dans l'ordre."""
+    return tuple(word for word in normalized.split() if any(ch.isdigit() for ch in word))
+
+
+def shingles(normalized, size=SHINGLE_SIZE):
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+class QuestionIndex:
+    """
+    Empreintes question + bonne réponse des explications déjà générées, par version de prompt.
+
+    Une question quasi identique (même texte à la ponctuation, aux accents et à la
+    numérotation près, ou shingles très proches) avec la même bonne réponse réutilise
+    l'explication déjà payée. Une correspondance approchée n'est retenue que si la question
+    et la réponse portent exactement les mêmes nombres (signes compris) : deux variantes
+    d'une question qui ne diffèrent que par une valeur n'ont pas la même explication.
+    L'index est persistant (SQLite) et chargé en mémoire.
+    """
+
+    def __init__(self, path=INDEX_PATH, question_threshold=QUESTION_THRESHOLD, answer_threshold=ANSWER_THRESHOLD):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.question_threshold = question_threshold
+        self.answer_threshold = answer_threshold
+        self._entries = []
+        self._exact = {}
+        self._postings = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " version TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " explanation TEXT NOT NULL,"
+            " PRIMARY KEY (version, question, answer))"
+        )
+        self._conn.commit()
+        for version, question, answer, explanation in self._conn.execute(
+                "SELECT version, question, answer, explanation FROM questions"):
+            self._index(version, question, answer, explanation)
+
+    def _index(self, version, question_norm, answer_norm, explanation):
+        key = (version, question_norm, answer_norm)
+        if key in self._exact:
+            self._entries[self._exact[key]]["explanation"] = explanation
+            return
+        entry_id = len(self._entries)
+        q_shingles = shingles(question_norm)
+        self._entries.append({
+            "version": version,
+            "question": q_shingles,
+            "answer_norm": answer_norm,
+            "answer": shingles(answer_norm),
+            "numbers": (numeric_tokens(question_norm), numeric_tokens(answer_norm)),
+            "explanation": explanation,
+        })
+        self._exact[key] = entry_id
+        for shingle in q_shingles:
+            self._postings.setdefault((version, shingle), []).append(entry_id)
+
+    def lookup(self, question, answer, version):
+        """Explication d'une question quasi identique déjà vue, ou None."""
+        question_norm, answer_norm = normalize(question), normalize(answer)
+        with self._lock:
+            entry_id = self._exact.get((version, question_norm, answer_norm))
+            if entry_id is not None:
+                return self._entries[entry_id]["explanation"]
+
+            q_shingles = shingles(question_norm)
+            counts = Counter()
+            for shingle in q_shingles:
+                counts.update(self._postings.get((version, shingle), ()))
+            a_shingles = shingles(answer_norm)
+            numbers = (numeric_tokens(question_norm), numeric_tokens(answer_norm))
+            best, best_score = None, 0.0
+            for entry_id, inter in counts.items():
+                entry = self._entries[entry_id]
+                score = inter / (len(q_shingles) + len(entry["question"]) - inter)
+                if score < self.question_threshold or score <= best_score or entry["numbers"] != numbers:
+                    continue
+                if (entry["answer_norm"] != answer_norm
+                        and jaccard(a_shingles, entry["answer"]) < self.answer_threshold):
+                    continue
+                best, best_score = entry, score
+            return best["explanation"] if best else None
+
+    def add(self, question, answer, version, explanation):
+        question_norm, answer_norm = normalize(question), normalize(answer)
+        if not question_norm or not answer_norm:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO questions (version, question, answer, explanation) VALUES (?, ?, ?, ?)",
+                (version, question_norm, answer_norm, explanation),
+            )
+            self._conn.commit()
+            self._index(version, question_norm, answer_norm, explanation)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def known_explanation(index, row, version):
+    """Explication d'une quasi-copie déjà expliquée de cette ligne CSV, ou None."""
+    qa = row_question_answer(row)
+    if qa is None:
+        return None
+    return index.lookup(qa[0], qa[1], version)
+
+
+def reuse_known_explanations(index, lines, indices, version):
+    """Renvoie {ligne: explication} pour les lignes dont une quasi-copie a déjà été expliquée."""
+    reused = {}
+    for idx in indices:
+        explanation = known_explanation(index, lines[idx], version)
+        if explanation is not None:
+            reused[idx] = explanation
+    return reused
+
+
+def remember_explanation(index, row, version, explanation):
+    """Ajoute une explication réussie à l'index (les marqueurs d'erreur sont ignorés)."""
+    qa = row_question_answer(row)
+    if qa is not None and not is_error_explanation(explanation):
+        index.add(qa[0], qa[1], version, explanation)
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_default_index():
+    """Index du processus, ouvert à la première utilisation."""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = QuestionIndex()
+        return _default_index
@@ -0,0 +1,309 @@
+import math
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+
+# Codes HTTP pour lesquels une nouvelle tentative a un sens
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+# Codes qui signalent une saturation de l'API (on ralentit tout le monde)
+THROTTLE_STATUS = {429, 529}
+# Limites en tokens par minute annoncées par l'API (en-têtes anthropic-ratelimit-<nom>-*).
+# "tokens" est la plus restrictive des deux : on lui compte l'entrée et la sortie.
+TOKEN_LIMITS = ("input-tokens", "output-tokens", "tokens")
+# Estimation des tokens d'entrée d'une requête avant l'envoi (même ratio que preflight)
+CHARS_PER_TOKEN = 3.5
+
+
+class CircuitOpenError(Exception):
+    """Levée quand le disjoncteur est ouvert : aucune requête n'est envoyée."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Trop d'erreurs API, pause de {retry_in:.0f} s")
+        self.retry_in = retry_in
+
+
+def _header(headers, name):
+    if not headers:
+        return None
+    try:
+        return headers.get(name)
+    except AttributeError:
+        return None
+
+
+def request_tokens(params):
+    """
+    (tokens d'entrée estimés, tokens de sortie maximum) d'un appel Messages.
+
+    Une requête groupée (make_packs) compte pour toutes ses questions : c'est sa taille,
+    pas le nombre de requêtes, qui épuise les limites en tokens.
+    """
+    chars = 0
+    for block in params.get("system") or []:
+        chars += len(block["text"]) if isinstance(block, dict) else len(block)
+    for message in params.get("messages", []):
+        content = message["content"]
+        chars += len(content) if isinstance(content, str) else sum(len(part.get("text", "")) for part in content)
+    return math.ceil(chars / CHARS_PER_TOKEN), params.get("max_tokens", 0)
+
+
+def _number(value):
+    try:
+        return None if value is None else float(value)
+    except ValueError:
+        return None
+
+
+def parse_retry_after(headers):
+    """Renvoie le délai (en secondes) demandé par l'en-tête Retry-After, ou None."""
+    value = _header(headers, "retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_status(exc):
+    """Code HTTP porté par une exception du SDK Anthropic (None pour une erreur réseau)."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def error_headers(exc):
+    return getattr(getattr(exc, "response", None), "headers", None)
+
+
+def is_retryable(exc):
+    """Erreurs transitoires : saturation, erreurs serveur, coupures réseau, disjoncteur ouvert."""
+    if isinstance(exc, CircuitOpenError):
+        return True
+    status = error_status(exc)
+    if status is None:
+        # Pas de réponse HTTP : timeout ou connexion perdue
+        return "connection" in type(exc).__name__.lower() or "timeout" in type(exc).__name__.lower()
+    return status in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur sur le taux d'erreur des derniers appels.
+
+    Il s'ouvre quand plus de `error_threshold` des `window` derniers appels ont échoué,
+    bloque les requêtes pendant `cooldown` secondes, puis laisse passer un appel test.
+
+    Seuls les 5xx et les délais dépassés sont des échecs (voir `counts_as_failure`) : un
+    429/529 ou une autre erreur 4xx est signalé par `record_inconclusive`, qui ne touche
+    pas à la fenêtre.
+    """
+
+    def __init__(self, window=20, error_threshold=0.5, min_calls=5, cooldown=30.0):
+        self.window = window
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lève CircuitOpenError si le disjoncteur interdit l'appel."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(max(remaining, 1.0))
+            # Demi-ouverture : un seul appel test
+            self._probing = True
+
+    def record(self, success):
+        with self._lock:
+            if self._opened_at is not None and self._probing:
+                self._probing = False
+                if success:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) > self.error_threshold):
+                self._opened_at = time.monotonic()
+
+    def record_inconclusive(self):
+        """Appel refusé pour saturation ou requête invalide : un appel test ne conclut rien, le suivant retestera."""
+        with self._lock:
+            self._probing = False
+
+
+class AdaptiveRateLimiter:
+    """
+    Seau à jetons partagé entre tous les threads de génération.
+
+    Le débit de départ est une estimation prudente ; il est recalé sur les en-têtes
+    `anthropic-ratelimit-requests-*` renvoyés par l'API, et toute réponse 429/529
+    suspend les envois pendant la durée indiquée par Retry-After.
+
+    Dès que l'API annonce aussi ses limites en tokens (`anthropic-ratelimit-tokens-*`,
+    `-input-tokens-*`, `-output-tokens-*`), un seau par limite est tenu à jour et chaque
+    requête y prélève sa taille (voir `request_tokens`).
+    """
+
+    def __init__(self, requests_per_minute=50, breaker=None):
+        self.capacity = float(requests_per_minute)
+        self.rate = requests_per_minute / 60.0
+        self.tokens = self.capacity
+        self.breaker = breaker or CircuitBreaker()
+        # nom de limite -> [capacité, solde], créé au premier en-tête reçu
+        self.token_buckets = {}
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._observed = False
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        for bucket in self.token_buckets.values():
+            bucket[1] = min(bucket[0], bucket[1] + elapsed * bucket[0] / 60.0)
+        self._updated = now
+
+    def acquire(self, input_tokens=0, output_tokens=0):
+        """Bloque jusqu'à ce qu'une requête de cette taille puisse partir."""
+        costs = {"input-tokens": input_tokens, "output-tokens": output_tokens,
+                 "tokens": input_tokens + output_tokens}
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+                    for name, (capacity, balance) in self.token_buckets.items():
+                        # Une requête plus grosse que la limite attend seulement un seau plein
+                        needed = min(costs[name], capacity)
+                        if balance < needed:
+                            wait = max(wait, (needed - balance) * 60.0 / capacity)
+                    if wait <= 0:
+                        self.tokens -= 1
+                        for name, bucket in self.token_buckets.items():
+                            bucket[1] -= costs[name]
+                        return
+            time.sleep(wait)
+
+    def headroom(self):
+        """Nombre de requêtes qui peuvent partir tout de suite (0 pendant une pause ou sans tokens)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._paused_until > now or any(balance <= 0 for _, balance in self.token_buckets.values()):
+                return 0.0
+            return self.tokens
+
+    def pause(self, seconds):
+        """Suspend tous les envois pendant `seconds` secondes."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def update_from_headers(self, headers):
+        """Recale les seaux sur les limites réelles du compte."""
+        with self._lock:
+            self._refill(time.monotonic())
+            limit = _number(_header(headers, "anthropic-ratelimit-requests-limit"))
+            remaining = _number(_header(headers, "anthropic-ratelimit-requests-remaining"))
+            if limit is not None and limit > 0:
+                self.capacity = limit
+                self.rate = self.capacity / 60.0
+                self._observed = True
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+            for name in TOKEN_LIMITS:
+                limit = _number(_header(headers, f"anthropic-ratelimit-{name}-limit"))
+                remaining = _number(_header(headers, f"anthropic-ratelimit-{name}-remaining"))
+                bucket = self.token_buckets.get(name)
+                if limit is not None and limit > 0:
+                    if bucket is None:
+                        bucket = self.token_buckets[name] = [limit, limit]
+                    bucket[0] = limit
+                    bucket[1] = min(bucket[1], limit)
+                if bucket is not None and remaining is not None:
+                    bucket[1] = min(bucket[1], remaining)
+
+    def observed_rpm(self):
+        """Limite de requêtes par minute annoncée par l'API, None tant qu'aucune réponse ne l'a donnée."""
+        with self._lock:
+            return self.capacity if self._observed else None
+
+    def backoff_delay(self, attempt, base=1.0, cap=60.0):
+        """Délai exponentiel avec jitter complet pour la tentative `attempt` (0, 1, 2...)."""
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def counts_as_failure(exc):
+    """
+    Erreur qui compte dans le taux d'échec du disjoncteur : erreur serveur (5xx) ou délai dépassé.
+
+    Un 429/529 signale un débit trop élevé, pas une API en panne : le limiteur le gère
+    déjà (pause globale, retry-after). Le compter ouvrirait le disjoncteur sur quelques
+    saturations au démarrage d'un run et bloquerait tout pendant `cooldown` secondes.
+    Une erreur 4xx (ligne mal formée, clé refusée sur un shard) ne concerne que sa requête
+    et ne doit pas suspendre tout le run. Un refus du disjoncteur lui-même ne compte pas non plus.
+    """
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status = error_status(exc)
+    if status is None:
+        # Pas de réponse HTTP : timeout ou connexion perdue
+        return is_retryable(exc)
+    return status == 408 or (status >= 500 and status not in THROTTLE_STATUS)
+
+
+def call_with_retries(fn, limiter, max_retries=5, base_delay=1.0, cost=(0, 0)):
+    """
+    Exécute `fn(limiter)` en respectant le limiteur, avec backoff sur les erreurs transitoires.
+
+    `cost` (tokens d'entrée, tokens de sortie) est prélevé sur les seaux en tokens à chaque tentative.
+
+    `fn` reçoit le limiteur afin de lui transmettre les en-têtes de la réponse.
+    Les erreurs non transitoires (requête invalide, clé refusée...) sont relevées immédiatement.
+    """
+    attempt = 0
+    while True:
+        try:
+            limiter.breaker.before_call()
+            limiter.acquire(*cost)
+            result = fn(limiter)
+            limiter.breaker.record(True)
+            return result
+        except Exception as e:
+            if counts_as_failure(e):
+                limiter.breaker.record(False)
+            elif not isinstance(e, CircuitOpenError):
+                limiter.breaker.record_inconclusive()
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            if isinstance(e, CircuitOpenError):
+                delay = e.retry_in
+            else:
+                delay = parse_retry_after(error_headers(e))
+                if delay is None:
+                    delay = limiter.backoff_delay(attempt, base=base_delay)
+                if error_status(e) in THROTTLE_STATUS:
+                    limiter.pause(delay)
+            attempt += 1
+            time.sleep(delay)
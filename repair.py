@@ -0,0 +1,207 @@
+import csv
+import os
+import threading
+from pathlib import Path
+
+from enrichment import output_key
+from explanation_cache import get_default_cache
+from generation_engine import DEFAULT_MAX_IN_FLIGHT, MODEL, is_error_explanation, stream_explanations
+from pipeline import OUTPUT_DIR, EnrichedWriter, generate_prompt, is_invalid_row, question_part
+from question_index import get_default_index, remember_explanation
+from run_journal import RunJournal, journal_version
+from run_metrics import RunMetrics
+
+
+# Passes de réparation : une ligne encore en erreur après une passe est retentée à la suivante
+REPAIR_ROUNDS = 2
+ENRICHED_SUFFIX = "_enriched"
+
+# {chemin: ((mtime_ns, taille), lignes réparables)} : un fichier inchangé n'est pas relu
+_scan_cache = {}
+_scan_lock = threading.Lock()
+
+
+def enriched_base_name(csv_path):
+    """Nom de base d'une sortie <base>_enriched.csv (celui de <base>.json)."""
+    stem = Path(csv_path).stem
+    return stem[:-len(ENRICHED_SUFFIX)] if stem.endswith(ENRICHED_SUFFIX) else stem
+
+
+def iter_enriched_rows(csv_path):
+    """
+    Lignes d'un CSV enrichi (séparateur $), complétées à 8 champs.
+
+    Une sortie enrichie n'a pas d'en-tête : aucune ligne n'est retirée, l'index d'une ligne
+    est celui de sa question dans le journal de reprise.
+    """
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="$"):
+            yield row + [""] * (8 - len(row))
+
+
+def is_repairable(row):
+    """Ligne en erreur qu'une relance peut corriger (les lignes INVALID n'ont pas de prompt)."""
+    return is_error_explanation(row[7]) and not is_invalid_row(row)
+
+
+def find_error_rows(csv_path):
+    """Index des lignes d'un CSV enrichi en erreur et réparables."""
+    return [idx for idx, row in enumerate(iter_enriched_rows(csv_path)) if is_repairable(row)]
+
+
+def count_repairable(csv_path):
+    """Nombre de lignes réparables, relu seulement si le fichier a changé (date ou taille)."""
+    stat = os.stat(csv_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _scan_lock:
+        cached = _scan_cache.get(str(csv_path))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    errors = len(find_error_rows(csv_path))
+    with _scan_lock:
+        _scan_cache[str(csv_path)] = (signature, errors)
+    return errors
+
+
+def scan_outputs(output_dir=OUTPUT_DIR):
+    """
+    Renvoie [(chemin CSV, nombre de lignes réparables)] pour les sorties de `output_dir` qui en ont.
+
+    Appelé à chaque rerun Streamlit : seuls les fichiers modifiés depuis le dernier appel sont relus.
+    """
+    found = []
+    for csv_path in sorted(Path(output_dir).glob(f"*{ENRICHED_SUFFIX}.csv")):
+        try:
+            errors = count_repairable(csv_path)
+        except (OSError, ValueError, UnicodeDecodeError, csv.Error):
+            continue
+        if errors:
+            found.append((csv_path, errors))
+    return found
+
+
+def repair_file(csv_path, client, version, max_in_flight=DEFAULT_MAX_IN_FLIGHT, cache=None, metrics=None,
+                pack_size=1, question_index=None, rounds=REPAIR_ROUNDS, executor=None, on_progress=None):
+    """
+    Régénère uniquement les lignes en erreur d'une sortie et réécrit le CSV et le JSON en place.
+
+    Les deux fichiers sont réécrits via des fichiers `.part` renommés : une réparation
+    interrompue laisse la sortie précédente intacte. Les lignes INVALID ne sont ni
+    envoyées ni comptées (aucune relance ne peut les corriger). Les explications
+    récupérées sont aussi ajoutées au journal de reprise <base>.journal.jsonl s'il existe.
+
+    Les lignes sont régénérées avec la version du prompt enregistrée dans ce journal, pour ne
+    pas mêler deux prompts dans une même sortie ; `version` ne sert qu'aux sorties sans journal
+    (mode batch). La version utilisée est renvoyée dans le bilan.
+
+    L'appelant doit s'assurer qu'aucune génération n'écrit la même sortie en même temps
+    (dans l'interface : clés `enrichment.output_key` du JobRunner).
+
+    Returns:
+        dict: {"file", "csv_path", "json_path", "version", "errors", "recovered", "remaining"}
+    """
+    csv_path = Path(csv_path)
+    base_name = enriched_base_name(csv_path)
+    journal_path = csv_path.with_name(f"{base_name}.journal.jsonl")
+    version = journal_version(journal_path) or version
+    rows = {idx: row for idx, row in enumerate(iter_enriched_rows(csv_path)) if is_repairable(row)}
+    fixed = {}
+    prompts = {idx: generate_prompt(row, version) for idx, row in rows.items()}
+    todo = list(rows)
+    for _ in range(max(1, rounds)):
+        if not todo:
+            break
+        items = ((idx, rows[idx][:7], prompts[idx], question_part(rows[idx][0]), None) for idx in todo)
+        for idx, row, explanation, _ in stream_explanations(items, client, max_in_flight=max_in_flight, cache=cache,
+                                                            metrics=metrics, pack_size=pack_size,
+                                                            executor=executor):
+            if is_error_explanation(explanation):
+                continue
+            fixed[idx] = explanation
+            if question_index is not None:
+                remember_explanation(question_index, row, version, explanation)
+            if on_progress:
+                on_progress(len(fixed), len(rows))
+        todo = [idx for idx in todo if idx not in fixed]
+
+    json_path = csv_path.with_name(f"{base_name}.json")
+    if fixed:
+        with EnrichedWriter(base_name, csv_path.parent) as writer:
+            for idx, row in enumerate(iter_enriched_rows(csv_path)):
+                writer.write(row[:7] + [fixed.get(idx, row[7])])
+        json_path = writer.json_path
+        RunJournal(journal_path, None, version).patch(fixed)
+    return {"file": csv_path.name, "csv_path": csv_path, "json_path": json_path, "version": version,
+            "errors": len(rows),
+            "recovered": len(fixed), "remaining": len(rows) - len(fixed)}
+
+
+def version_note(report, version):
+    """Mention à ajouter au bilan quand la sortie a été réparée avec le prompt de son journal plutôt que `version`."""
+    return f" (prompt {report['version']} de la sortie, pas {version})" if report["version"] != version else ""
+
+
+def _allowed_paths(csv_paths):
+    return None if csv_paths is None else {Path(path).resolve() for path in csv_paths}
+
+
+def repair_outputs(client, version, output_dir=OUTPUT_DIR, use_cache=True, reuse_similar=True, metrics=None,
+                   on_result=None, csv_paths=None, **options):
+    """
+    Répare les sorties de `output_dir` (seulement `csv_paths` si fourni) ; options : voir `repair_file`.
+
+    Returns:
+        list: Bilans de `repair_file`, un par sortie réparée
+    """
+    cache = get_default_cache() if use_cache else None
+    question_index = get_default_index() if reuse_similar else None
+    allowed = _allowed_paths(csv_paths)
+    reports = []
+    for csv_path, _ in scan_outputs(output_dir):
+        if allowed is not None and csv_path.resolve() not in allowed:
+            continue
+        report = repair_file(csv_path, client, version, cache=cache, metrics=metrics, question_index=question_index,
+                             **options)
+        reports.append(report)
+        if on_result:
+            on_result(report)
+    return reports
+
+
+def repair_key(csv_path):
+    """Clé JobRunner d'une sortie, identique à celle de la génération qui l'écrit."""
+    csv_path = Path(csv_path)
+    return output_key(csv_path.parent, f"{enriched_base_name(csv_path)}.csv")
+
+
+def run_repair_job(job, client, version, output_dir=OUTPUT_DIR, **options):
+    """
+    Tâche de fond (JobRunner) : répare les sorties de `output_dir` (ou `csv_paths`).
+
+    Le résultat a la même forme que celui de `enrichment.run_enrichment_job`, avec en plus
+    le nombre de lignes récupérées et restées en erreur.
+    """
+    metrics = RunMetrics(MODEL)
+    allowed = _allowed_paths(options.get("csv_paths"))
+    scanned = [(csv_path, errors) for csv_path, errors in scan_outputs(output_dir)
+               if allowed is None or csv_path.resolve() in allowed]
+    total = sum(errors for _, errors in scanned)
+    recovered = 0
+
+    def on_result(report):
+        nonlocal recovered
+        recovered += report["recovered"]
+        job.log(f"🩹 {report['file']} : {report['recovered']}/{report['errors']} ligne(s) récupérée(s)"
+                + version_note(report, version))
+        job.update(progress=recovered / total if total else 1.0,
+                   message=f"{recovered}/{total} ligne(s) récupérée(s)")
+
+    reports = repair_outputs(client, version, output_dir=output_dir, metrics=metrics, on_result=on_result, **options)
+    metrics.finish()
+    return {
+        "outputs": [(report["file"], report["csv_path"], report["json_path"]) for report in reports],
+        "report": metrics.summary(),
+        "report_path": metrics.save(output_dir),
+        "recovered": recovered,
+        "remaining": sum(report["remaining"] for report in reports),
+    }
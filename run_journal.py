@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def file_hash(file_bytes):
+    """Empreinte du fichier source, pour ne reprendre qu'un journal du même fichier."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def path_hash(path, chunk_size=1 << 20):
+    """Même empreinte que `file_hash`, calculée par blocs sans charger le fichier."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def journal_version(path):
+    """Version du prompt enregistrée dans l'en-tête d'un journal, None s'il est absent ou illisible."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline()).get("version")
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return None
+
+
+class RunJournal:
+    """
+    Journal JSONL en ajout seul d'une génération, une ligne par explication reçue.
+
+    La première ligne décrit le run (empreinte du fichier source, version du prompt,
+    nombre de lignes). Chaque explication est écrite et synchronisée sur disque dès
+    son arrivée : après un crash ou un rerun Streamlit, `start(resume=True)` renvoie
+    les lignes déjà obtenues et la génération reprend là où elle s'était arrêtée.
+    """
+
+    def __init__(self, path, source_hash, version):
+        self.path = Path(path)
+        self.source_hash = source_hash
+        self.version = version
+        self._file = None
+
+    def _header(self, total):
+        return {"type": "run", "source_hash": self.source_hash, "version": self.version, "rows": total}
+
+    def load(self):
+        """
+        Renvoie {index: explication} si le journal correspond au même fichier et au même prompt.
+
+        Tout le journal est chargé : la mémoire croît avec le nombre de lignes déjà expliquées
+        (de l'ordre de la taille du CSV enrichi). Une fusion en flux n'est pas possible telle
+        quelle : les lignes réutilisées et les réparations (`patch`) sont écrites hors de l'ordre
+        des index, et la dernière entrée d'un index l'emporte.
+        """
+        if not self.path.exists():
+            return {}
+        entries = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dernière ligne tronquée par un arrêt brutal
+                    continue
+                if n == 0:
+                    if (record.get("type") != "run"
+                            or record.get("source_hash") != self.source_hash
+                            or record.get("version") != self.version):
+                        return {}
+                    continue
+                if "idx" in record:
+                    entries[record["idx"]] = record["explanation"]
+        return entries
+
+    def start(self, total, resume=True):
+        """
+        Ouvre le journal en écriture.
+
+        Returns:
+            dict: Explications déjà journalisées ({} si nouveau run ou journal d'un autre fichier)
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self._matches():
+            entries = self.load()
+            self._open_append()
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write(self._header(total))
+            entries = {}
+        return entries
+
+    def _matches(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+        except (OSError, json.JSONDecodeError):
+            return False
+        return header.get("source_hash") == self.source_hash and header.get("version") == self.version
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, idx, explanation):
+        self._write({"idx": idx, "explanation": explanation})
+
+    def patch(self, entries):
+        """
+        Ajoute {index: explication} à un journal existant du même prompt (passe de réparation).
+
+        Une reprise ultérieure relit alors les explications corrigées au lieu des marqueurs
+        d'erreur. L'empreinte du fichier source n'est pas vérifiée : `source_hash` peut être None.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+        except (OSError, json.JSONDecodeError):
+            return
+        if not entries or header.get("version") != self.version:
+            return
+        self._open_append()
+        try:
+            for idx, explanation in sorted(entries.items()):
+                self.append(idx, explanation)
+        finally:
+            self.close()
+
+    def _open_append(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+        self._file = open(self.path, "a", encoding="utf-8")
+        if torn:
+            # Isole la ligne tronquée par l'arrêt précédent
+            self._file.write("\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def atomic_write_text(path, text):
+    """Écrit un fichier via un fichier temporaire renommé, pour ne jamais laisser de sortie à moitié écrite."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,156 @@
+import json
+import math
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+# Tarifs publics en dollars par million de tokens
+PRICES_PER_MTOK = {
+    "claude-3-7-sonnet-20250219": {"input": 3.0, "cache_write": 3.75, "cache_read": 0.30, "output": 15.0},
+}
+# Les Message Batches sont facturés à moitié prix
+BATCH_DISCOUNT = 0.5
+
+TOKEN_FIELDS = ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "output_tokens")
+
+
+def percentile(values, pct):
+    """Percentile par rang le plus proche (None si aucune valeur)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def estimate_cost(model, totals, batch=False):
+    """Coût en dollars de `totals` ({champ de TOKEN_FIELDS: tokens}), None si le modèle n'a pas de tarif."""
+    prices = PRICES_PER_MTOK.get(model)
+    if prices is None:
+        return None
+    cost = (totals.get("input_tokens", 0) * prices["input"]
+            + totals.get("cache_creation_input_tokens", 0) * prices["cache_write"]
+            + totals.get("cache_read_input_tokens", 0) * prices["cache_read"]
+            + totals.get("output_tokens", 0) * prices["output"]) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+class RunMetrics:
+    """
+    Mesures d'un run de génération : un enregistrement par appel API, plus les lignes terminées.
+
+    Chaque appel garde sa latence totale (relances comprises), le délai avant le premier
+    token quand la réponse est streamée, les tokens de `response.usage`, le nombre de
+    relances et son issue ("ok", "error", "cache", "reuse" pour une question quasi identique
+    déjà expliquée, "batch", "hedge" pour la tentative perdante d'un appel doublé, comptée
+    seulement dans les tokens). Un appel doublé (hedging) note s'il a été doublé et si la
+    seconde requête a répondu la première. `prompt_chars` (taille du prompt envoyé) sert à
+    calibrer l'estimation à blanc des tokens (preflight.py), comme la limite de requêtes
+    par minute annoncée par l'API (`note_rate_limit`) calibre sa durée.
+    """
+
+    def __init__(self, model, batch=False):
+        self.model = model
+        self.batch = batch
+        self.calls = []
+        self.rows = 0
+        self.started = time.time()
+        self.finished = None
+        self.rate_limit_rpm = None
+        self._lock = threading.Lock()
+
+    def record_call(self, latency, usage=None, retries=0, outcome="ok", ttft=None, hedged=False, hedge_won=False,
+                    prompt_chars=0):
+        record = {"latency": latency, "ttft": ttft, "retries": retries, "outcome": outcome,
+                  "hedged": hedged, "hedge_won": hedge_won, "prompt_chars": prompt_chars}
+        for field in TOKEN_FIELDS:
+            record[field] = (getattr(usage, field, None) or 0) if usage is not None else 0
+        with self._lock:
+            self.calls.append(record)
+
+    def note_rate_limit(self, requests_per_minute):
+        """Garde la dernière limite de requêtes par minute connue du limiteur (None : inconnue)."""
+        if requests_per_minute is not None:
+            self.rate_limit_rpm = requests_per_minute
+
+    def record_rows(self, count=1):
+        with self._lock:
+            self.rows += count
+
+    def finish(self):
+        self.finished = time.time()
+
+    def estimated_cost(self, totals):
+        return estimate_cost(self.model, totals, self.batch)
+
+    def summary(self):
+        with self._lock:
+            calls = list(self.calls)
+            rows = self.rows
+        duration = (self.finished or time.time()) - self.started
+        api_calls = [c for c in calls if c["outcome"] in ("ok", "error", "batch")]
+        latencies = [c["latency"] for c in api_calls if c["latency"] is not None]
+        ttfts = [c["ttft"] for c in api_calls if c["ttft"] is not None]
+        totals = {field: sum(c[field] for c in calls) for field in TOKEN_FIELDS}
+        reused = sum(1 for c in calls if c["outcome"] == "reuse")
+        hedged = sum(1 for c in api_calls if c["hedged"])
+        total_input = totals["input_tokens"] + totals["cache_read_input_tokens"] + totals["cache_creation_input_tokens"]
+        cost = self.estimated_cost(totals)
+        return {
+            "model": self.model,
+            "mode": "batch" if self.batch else "interactive",
+            "started_at": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration_s": round(duration, 2),
+            "rows": rows,
+            "rows_per_min": round(rows / duration * 60, 1) if duration > 0 else None,
+            "api_calls": len(api_calls),
+            "errors": sum(1 for c in calls if c["outcome"] == "error"),
+            "cache_hits": sum(1 for c in calls if c["outcome"] == "cache"),
+            "reused_rows": reused,
+            "reuse_rate": round(reused / rows, 3) if rows else 0.0,
+            "retries": sum(c["retries"] for c in calls),
+            "hedged_calls": hedged,
+            "hedge_wins": sum(1 for c in calls if c["hedge_won"]),
+            "hedge_rate": round(hedged / len(api_calls), 3) if api_calls else 0.0,
+            "latency_p50_s": _round(percentile(latencies, 50)),
+            "latency_p95_s": _round(percentile(latencies, 95)),
+            "latency_p99_s": _round(percentile(latencies, 99)),
+            "ttft_p50_s": _round(percentile(ttfts, 50)),
+            "cached_input_tokens": totals["cache_read_input_tokens"],
+            "cache_write_input_tokens": totals["cache_creation_input_tokens"],
+            "uncached_input_tokens": totals["input_tokens"],
+            "cached_ratio": round(totals["cache_read_input_tokens"] / total_input, 3) if total_input else 0.0,
+            "output_tokens": totals["output_tokens"],
+            "prompt_chars": sum(c["prompt_chars"] for c in api_calls if c["outcome"] == "ok"),
+            "output_tokens_per_s": round(totals["output_tokens"] / duration, 1) if duration > 0 else None,
+            "estimated_cost_usd": round(cost, 4) if cost is not None else None,
+            "rate_limit_rpm": self.rate_limit_rpm,
+        }
+
+    def save(self, output_dir):
+        """
+        Écrit le rapport du run dans output_dir/run_report_<horodatage>.json et renvoie son chemin.
+
+        L'horodatage va jusqu'à la microseconde et le fichier est créé en mode exclusif : deux
+        runs démarrés au même instant (travaux simultanés, génération puis --repair) ne
+        s'écrasent pas, le second reçoit un suffixe -1, -2...
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started).strftime("%Y%m%d-%H%M%S-%f")
+        report = json.dumps({"summary": self.summary(), "calls": list(self.calls)}, ensure_ascii=False, indent=2)
+        suffix = 0
+        while True:
+            path = output_dir / f"run_report_{stamp}{f'-{suffix}' if suffix else ''}.json"
+            try:
+                with open(path, "x", encoding="utf-8") as f:
+                    f.write(report)
+                return path
+            except FileExistsError:
+                suffix += 1
+
+
+def _round(value, digits=3):
+    return round(value, digits) if value is not None else None
@@ -0,0 +1,85 @@
+import pytest
+
+from batch_backend import batch_journal_path, make_custom_id, run_batch_enrichment
+from client_pool import make_client
+from explanation_cache import ExplanationCache
+from mock_anthropic_server import start_mock_server
+from repair import iter_enriched_rows
+
+
+def make_csv(name, rows):
+    lines = ["question$a$b$c$d$correct$image"]
+    lines += [f"1.{n} Question {name} {n} ?$a$réponse {name} n°{n}$c$d$B$" for n in range(rows)]
+    lines.append("1.99 Sans bonne réponse ?$a$b$c$d$$")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+FILES = [("annale_a.csv", make_csv("a", 8)), ("annale_b.csv", make_csv("b", 5))]
+
+
+@pytest.fixture
+def mock_api():
+    servers = []
+
+    def start(**options):
+        server, url = start_mock_server(batch_duration=0, **options)
+        servers.append(server)
+        return server, make_client("test", base_url=url)
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_results_map_back_to_rows_and_errors_become_markers(tmp_path, mock_api):
+    server, client = mock_api(batch_error_rate=0.3, seed=3)
+    outputs = run_batch_enrichment(FILES, client, "V1", output_dir=tmp_path, poll_interval=0)
+
+    batch, = server.state.batches.values()
+    assert len(batch["requests"]) == 13
+    assert 0 < len(batch["errored"]) < 13
+    for file_no, (filename, csv_path, _) in enumerate(outputs):
+        name = filename[len("annale_"):-len(".csv")]
+        rows = list(iter_enriched_rows(csv_path))
+        for idx, row in enumerate(rows[:-1]):
+            if make_custom_id(file_no, idx) in batch["errored"]:
+                assert row[7].startswith("[ERREUR - batch")
+            else:
+                assert row[7].endswith(f"réponse {name} n°{idx}")
+        assert rows[-1][7].startswith("[ERREUR - Prompt non généré")
+        assert not batch_journal_path(tmp_path, filename).exists()
+
+
+def test_cached_rerun_submits_nothing(tmp_path, mock_api):
+    server, client = mock_api()
+    cache = ExplanationCache(tmp_path / "cache.sqlite")
+    run_batch_enrichment(FILES, client, "V1", output_dir=tmp_path, cache=cache, poll_interval=0)
+    submitted = server.state.snapshot()["batch_requests"]
+    assert submitted == 13
+
+    outputs = run_batch_enrichment(FILES, client, "V1", output_dir=tmp_path, cache=cache, poll_interval=0)
+    assert server.state.snapshot()["batch_requests"] == submitted
+    assert len(server.state.batches) == 1
+    assert list(iter_enriched_rows(outputs[1][1]))[0][7].endswith("réponse b n°0")
+
+
+class Crash(BaseException):
+    """Arrêt du processus pendant l'attente du batch."""
+
+
+def test_restart_during_the_wait_resumes_the_submitted_batch(tmp_path, mock_api):
+    server, client = mock_api()
+
+    def crash(batch):
+        raise Crash()
+
+    with pytest.raises(Crash):
+        run_batch_enrichment(FILES, client, "V1", output_dir=tmp_path, poll_interval=0, on_poll=crash)
+    assert all(batch_journal_path(tmp_path, name).exists() for name, _ in FILES)
+
+    # Fichiers dans un autre ordre : les lignes sont retrouvées par le numéro du run interrompu
+    outputs = run_batch_enrichment(FILES[::-1], client, "V1", output_dir=tmp_path, poll_interval=0)
+    assert server.state.snapshot()["batch_requests"] == 13
+    assert len(server.state.batches) == 1
+    assert list(iter_enriched_rows(outputs[0][1]))[3][7].endswith("réponse b n°3")
+    assert not any(batch_journal_path(tmp_path, name).exists() for name, _ in FILES)
@@ -0,0 +1,18 @@
+from benchmark import run_benchmark
+
+
+def test_benchmark_counts_injected_throttling_and_stalls(tmp_path):
+    # Une seule requête en vol : les tirages du serveur (graine fixe) sont reproductibles
+    results = run_benchmark([1], [30], comparator_calls=3, work_dir=tmp_path, latency=0.0, error_rate=0.2,
+                            retry_after=0, stall_rate=0.2, stall_latency=0.02, seed=7)
+
+    run, = results["runs"]
+    server = results["tokens"]
+    assert run["errors"] == 0
+    assert run["server_throttled"] > 0
+    # Chaque 429 injecté est relancé une fois par rate_limiter, et compté comme tel dans le rapport
+    assert run["retries"] == run["server_throttled"]
+    assert run["server_requests"] == 30 + run["server_throttled"]
+    assert server["throttled"] >= run["server_throttled"]
+    assert server["stalled"] > 0
+    assert server["requests"] == server["throttled"] + 30 + 3
@@ -0,0 +1,36 @@
+import pytest
+
+from client_pool import ShardedClient
+from conftest import FakeClient, FakeStatusError
+
+
+def named(name):
+    return FakeClient(lambda params: name)
+
+
+def test_pick_prefers_the_key_with_the_most_headroom():
+    low, high = named("low"), named("high")
+    low.limiter.update_from_headers({"anthropic-ratelimit-requests-remaining": "1"})
+    client = ShardedClient([low, high])
+    assert client.pick()[0] is high
+    assert client.messages.create(messages=[]).content[0].text == "high"
+
+
+def test_pick_skips_a_paused_key():
+    paused, free = named("paused"), named("free")
+    paused.limiter.pause(60)
+    assert ShardedClient([paused, free]).pick()[0] is free
+
+
+def test_a_throttled_key_pauses_only_itself():
+    def throttled(params):
+        raise FakeStatusError(429, {"retry-after": "30"})
+
+    first, second = FakeClient(throttled), named("second")
+    second.limiter.update_from_headers({"anthropic-ratelimit-requests-remaining": "10"})
+    client = ShardedClient([first, second])
+    with pytest.raises(FakeStatusError):
+        client.messages.create(messages=[])
+    assert first.limiter.headroom() == 0
+    assert second.limiter.headroom() >= 9
+    assert client.messages.create(messages=[]).content[0].text == "second"
@@ -0,0 +1,80 @@
+import pytest
+
+from conftest import FakeClient, user_text
+from enrichment import process_csv_bytes
+from repair import iter_enriched_rows
+
+
+OPTIONS = {"use_cache": False, "reuse_similar": False, "max_in_flight": 1}
+
+
+def make_csv(rows):
+    lines = ["question$a$b$c$d$correct$image"] + ["$".join(row) for row in rows]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def question_of(params):
+    return user_text(params).split("\n")[0].removeprefix("Question : ")
+
+
+def explain(params):
+    return f"Explication de {question_of(params)}"
+
+
+class Crash(BaseException):
+    """Arrêt brutal du processus : n'est pas transformé en marqueur d'erreur par le moteur."""
+
+
+ROWS = [[f"1.{n} Question {n} ?", "a", "b", "c", "d", "A", ""] for n in range(6)]
+
+
+def test_resume_after_a_crash_only_requests_missing_rows(tmp_path):
+    source = make_csv(ROWS)
+
+    def crash_on_row_3(params):
+        if question_of(params) == "1.3 Question 3 ?":
+            raise Crash()
+        return explain(params)
+
+    with pytest.raises(Crash):
+        process_csv_bytes(source, "annale.csv", FakeClient(crash_on_row_3), "V1", output_dir=tmp_path, **OPTIONS)
+    assert not (tmp_path / "annale_enriched.csv").exists()
+
+    client = FakeClient(explain)
+    csv_path, _ = process_csv_bytes(source, "annale.csv", client, "V1", output_dir=tmp_path, **OPTIONS)
+    assert sorted(question_of(params) for params in client.calls) == [f"1.{n} Question {n} ?" for n in range(3, 6)]
+    assert [row[7] for row in iter_enriched_rows(csv_path)] == [f"Explication de {row[0]}" for row in ROWS]
+
+
+def test_resume_ignores_a_journal_of_another_prompt(tmp_path):
+    source = make_csv(ROWS[:2])
+    process_csv_bytes(source, "annale.csv", FakeClient(explain), "V1", output_dir=tmp_path, **OPTIONS)
+    client = FakeClient(lambda params: "V2")
+    process_csv_bytes(source, "annale.csv", client, "V2", output_dir=tmp_path, **OPTIONS)
+    assert len(client.calls) == 2
+
+
+ENRICHED = [
+    ["1.1 Déjà expliquée ?", "a", "b", "c", "d", "A", "", "Explication existante."],
+    ["1.2 Sans explication ?", "a", "b", "c", "d", "B", "", ""],
+    ["1.3 En erreur ?", "a", "b", "c", "d", "C", "", "[ERREUR - timeout]"],
+]
+
+
+def test_incremental_mode_only_fills_missing_explanations(tmp_path):
+    client = FakeClient(explain)
+    csv_path, _ = process_csv_bytes(make_csv(ENRICHED), "annale.csv", client, "V1", output_dir=tmp_path,
+                                    resume=False, **OPTIONS)
+    assert sorted(question_of(params) for params in client.calls) == ["1.2 Sans explication ?", "1.3 En erreur ?"]
+    rows = list(iter_enriched_rows(csv_path))
+    assert [len(row) for row in rows] == [8, 8, 8]
+    assert [row[7] for row in rows] == ["Explication existante.", "Explication de 1.2 Sans explication ?",
+                                        "Explication de 1.3 En erreur ?"]
+
+
+def test_non_incremental_mode_regenerates_every_row(tmp_path):
+    client = FakeClient(explain)
+    csv_path, _ = process_csv_bytes(make_csv(ENRICHED), "annale.csv", client, "V1", output_dir=tmp_path,
+                                    resume=False, incremental=False, **OPTIONS)
+    assert len(client.calls) == 3
+    assert list(iter_enriched_rows(csv_path))[0][7] == "Explication de 1.1 Déjà expliquée ?"
@@ -0,0 +1,38 @@
+import time
+
+from explanation_cache import ExplanationCache, cache_key
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ExplanationCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.put("a", "A")
+    time.sleep(0.01)
+    cache.put("b", "B")
+    time.sleep(0.01)
+    # "a" relu : c'est "b" qui devient le plus ancien
+    assert cache.get("a") == "A"
+    time.sleep(0.01)
+    cache.put("c", "C")
+    assert len(cache) == 2
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = ExplanationCache(tmp_path / "cache.sqlite")
+    assert cache.get("absente") is None
+    cache.put("k", "explication")
+    assert cache.get("k") == "explication"
+    assert cache.get("k") == "explication"
+    # Le test de présence ne compte ni comme succès ni comme échec
+    assert "k" in cache
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_rate": 2 / 3, "entries": 1}
+
+
+def test_key_depends_on_call_parameters():
+    prompt = {"system": "Tu es instructeur BIA.", "user": "Question : Qu'est-ce que la portance ?"}
+    base = cache_key(prompt, "claude", 0.7, 256)
+    assert cache_key(dict(prompt), "claude", 0.7, 256) == base
+    assert cache_key(prompt, "claude", 0.7, 512) != base
+    assert cache_key(prompt, "claude", 0.2, 256) != base
+    assert cache_key(prompt, "autre-modele", 0.7, 256) != base
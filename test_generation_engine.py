@@ -0,0 +1,96 @@
+import json
+import random
+import time
+
+from conftest import FakeClient, user_text
+from explanation_cache import ExplanationCache, cache_key
+from generation_engine import (MAX_TOKENS, MODEL, TEMPERATURE, explain_pack, make_packs, pack_prompts,
+                               parse_packed_response, stream_explanations)
+from pipeline import prompt_v1
+
+
+def prompt(n):
+    return prompt_v1(f"{n // 10}.{n % 10} Question {n} ?", f"réponse {n}")
+
+
+def explain_each(params):
+    """Réponse à un prompt simple, ou JSON {"1": ..., "2": ...} pour un prompt groupé."""
+    text = user_text(params)
+    questions = [line.split("Question : ")[1] for line in text.splitlines() if line.startswith("Question : ")]
+    if len(questions) == 1 and not text.startswith("[1]"):
+        return f"Explication de {questions[0]}"
+    return json.dumps({str(n): f"Explication de {q}" for n, q in enumerate(questions, start=1)})
+
+
+def test_stream_keeps_input_order_under_concurrency():
+    def slow_reply(params):
+        time.sleep(random.uniform(0, 0.02))
+        return explain_each(params)
+
+    items = ((n, [str(n)], prompt(n), None, None) for n in range(40))
+    results = list(stream_explanations(items, FakeClient(slow_reply), max_in_flight=8))
+    assert [idx for idx, *_ in results] == list(range(40))
+    assert all(explanation == f"Explication de {n // 10}.{n % 10} Question {n} ?"
+               for n, (_, _, explanation, generated) in enumerate(results) if generated)
+
+
+def test_known_explanations_are_not_sent():
+    client = FakeClient(explain_each)
+    items = [(n, [], prompt(n), None, "connue" if n % 2 else None) for n in range(6)]
+    results = list(stream_explanations(items, client, max_in_flight=2))
+    assert [(explanation == "connue", generated) for _, _, explanation, generated in results] == [
+        (n % 2 == 1, n % 2 == 0) for n in range(6)]
+    assert len(client.calls) == 3
+
+
+def test_pack_round_trip():
+    prompts = [prompt(n) for n in range(3)]
+    packed = pack_prompts(prompts)
+    assert packed["max_tokens"] == 3 * MAX_TOKENS
+    reply = explain_each({"messages": [{"content": packed["user"]}]})
+    assert parse_packed_response("Voici : " + reply + " fin", 3) == {
+        0: "Explication de 0.0 Question 0 ?",
+        1: "Explication de 0.1 Question 1 ?",
+        2: "Explication de 0.2 Question 2 ?",
+    }
+
+
+def test_parse_packed_response_keeps_only_readable_entries():
+    assert parse_packed_response("pas de JSON", 2) == {}
+    assert parse_packed_response('{"1": "a", ', 2) == {}
+    assert parse_packed_response('["a", "b"]', 2) == {}
+    assert parse_packed_response('{"[1]": "a\\nb", "2": "", "3": "hors plage", "x": "c"}', 2) == {0: "a b"}
+
+
+def test_unreadable_pack_entries_fall_back_to_single_calls():
+    def partial_reply(params):
+        reply = explain_each(params)
+        if user_text(params).startswith("[1]"):
+            data = json.loads(reply)
+            del data["2"]
+            return json.dumps(data)
+        return reply
+
+    client = FakeClient(partial_reply)
+    prompts = {n: prompt(n) for n in range(3)}
+    results = explain_pack(list(prompts), prompts, client)
+    assert results == {n: f"Explication de 0.{n} Question {n} ?" for n in range(3)}
+    assert len(client.calls) == 2
+
+
+def test_cached_rows_do_not_take_pack_slots(tmp_path):
+    cache = ExplanationCache(tmp_path / "cache.sqlite")
+    for n in (1, 2, 5):
+        cache.put(cache_key(prompt(n), MODEL, TEMPERATURE, MAX_TOKENS), f"en cache {n}")
+    client = FakeClient(explain_each)
+    items = [(n, [], prompt(n), "1", None) for n in range(8)]
+    results = list(stream_explanations(items, client, max_in_flight=2, cache=cache, pack_size=3))
+
+    uncached = [n for n in range(8) if n not in (1, 2, 5)]
+    assert len(client.calls) == len(make_packs(uncached, 3, {n: "1" for n in uncached})) == 2
+    assert [explanation for _, _, explanation, _ in results][1:3] == ["en cache 1", "en cache 2"]
+    assert [idx for idx, *_ in results] == list(range(8))
+
+
+def test_packs_do_not_mix_parts():
+    assert make_packs([0, 1, 2, 3, 4], 2, {0: "1", 1: "1", 2: "1", 3: "2", 4: "2"}) == [[0, 1], [2], [3, 4]]
@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import FakeClient
+from generation_engine import MODEL, request_explanation
+from hedging import HedgePolicy
+from run_metrics import RunMetrics, estimate_cost
+
+
+def policy(**kwargs):
+    return HedgePolicy(executor=ThreadPoolExecutor(max_workers=4), **kwargs)
+
+
+def counted(delays):
+    """Fonction de tentative qui dort `delays[n]` à sa n-ième exécution et renvoie n."""
+    calls = []
+    lock = threading.Lock()
+
+    def fn(info):
+        with lock:
+            n = len(calls)
+            calls.append(n)
+        time.sleep(delays[n] if n < len(delays) else 0)
+        return n
+    return fn, calls
+
+
+def test_no_hedge_before_min_samples():
+    hedge = policy(min_samples=5, budget=1.0)
+    for _ in range(4):
+        hedge.observe(0.001)
+    fn, calls = counted([0.05])
+    assert hedge.call(fn) == 0
+    assert calls == [0]
+    assert hedge.stats() == {"primaries": 1, "hedges": 0, "hedge_wins": 0}
+
+
+def test_hedges_stay_within_budget():
+    hedge = policy(min_samples=3, budget=0.5, window=1000)
+    # Historique assez long pour que les appels lents du test ne relèvent pas le p95
+    for _ in range(1000):
+        hedge.observe(0.001)
+    fn, calls = counted([0.03] * 40)
+    for _ in range(10):
+        hedge.call(fn)
+    assert hedge.stats()["primaries"] == 10
+    assert hedge.stats()["hedges"] == 5
+    assert len(calls) == 15
+
+
+def test_the_winning_attempt_is_counted():
+    hedge = policy(min_samples=3, budget=1.0)
+    for _ in range(3):
+        hedge.observe(0.01)
+    # La primaire traîne, la requête doublée répond tout de suite
+    fn, calls = counted([0.5, 0.0])
+    call_info = {}
+    assert hedge.call(fn, call_info=call_info) == 1
+    assert call_info == {"hedged": True, "hedge_won": True}
+    assert hedge.stats() == {"primaries": 1, "hedges": 1, "hedge_wins": 1}
+
+
+def test_losing_attempt_tokens_are_billed():
+    delays = [0.3, 0.0]
+    lock = threading.Lock()
+
+    def reply(params):
+        with lock:
+            delay = delays.pop(0) if delays else 0.0
+        time.sleep(delay)
+        return "Explication"
+
+    hedge = policy(min_samples=3, budget=1.0)
+    for _ in range(3):
+        hedge.observe(0.01)
+    metrics = RunMetrics(MODEL)
+    assert request_explanation(FakeClient(reply), "prompt", metrics=metrics, hedge=hedge) == "Explication"
+    # La primaire perdante aboutit après le retour : ses tokens arrivent ensuite
+    time.sleep(0.4)
+    summary = metrics.summary()
+    assert summary["api_calls"] == 1
+    assert summary["hedged_calls"] == 1 and summary["hedge_wins"] == 1
+    assert summary["uncached_input_tokens"] == 20 and summary["output_tokens"] == 10
+    totals = {"input_tokens": 20, "output_tokens": 10, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    assert summary["estimated_cost_usd"] == round(estimate_cost(MODEL, totals), 4)
@@ -0,0 +1,34 @@
+import csv
+
+from conftest import write_docx
+from ingest_annales import ANSWER_KEY_NOTE, find_documents, main
+
+QUESTION = ["1.1 Quel instrument indique l'altitude ?", "A. L'altimètre", "B. Le variomètre",
+            "C. L'anémomètre", "D. Le compas"]
+
+
+def test_lock_files_are_skipped_and_unreadable_documents_fail(tmp_path, capsys):
+    annales = tmp_path / "annales"
+    annales.mkdir()
+    write_docx(annales / "bia_2024.docx", QUESTION)
+    # Fichier verrou de Word ouvert : pas un .docx lisible, il ne doit même pas être tenté
+    (annales / "~$bia_2024.docx").write_bytes(b"verrou")
+    (annales / "corrompu.docx").write_bytes(b"pas une archive zip")
+    assert [path.name for path in find_documents(annales)] == ["bia_2024.docx", "corrompu.docx"]
+
+    output = tmp_path / "csv"
+    assert main([str(annales), "--output", str(output), "--workers", "1"]) == 1
+    out = capsys.readouterr().out
+    assert "corrompu.docx : BadZipFile" in out
+    assert "~$" not in out
+    assert ANSWER_KEY_NOTE in out
+    with open(output / "bia_2024.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f, delimiter="$"))
+    assert rows[1][:6] == ["1.1 Quel instrument indique l'altitude ?", "L'altimètre", "Le variomètre",
+                           "L'anémomètre", "Le compas", ""]
+    assert not (output / "corrompu.csv").exists()
+
+
+def test_clean_folder_exits_zero(tmp_path):
+    write_docx(tmp_path / "bia_2024.docx", QUESTION)
+    assert main([str(tmp_path), "--output", str(tmp_path / "csv"), "--workers", "1"]) == 0
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from job_runner import JobRunner
+
+
+def wait_done(runner, job_ids, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(runner.status(job_id)["status"] in ("done", "failed") for job_id in job_ids):
+            return
+        time.sleep(0.01)
+    raise AssertionError("travaux non terminés")
+
+
+def tracking_task():
+    """Tâche qui note le nombre de travaux en cours en même temps qu'elle."""
+    state = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def task(job, duration):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(duration)
+        with lock:
+            state["running"] -= 1
+        return job.id
+    return task, state
+
+
+def test_jobs_on_the_same_key_run_one_after_the_other():
+    runner = JobRunner(max_workers=2)
+    task, state = tracking_task()
+    first = runner.submit(task, 0.2, keys=["out/a.csv"])
+    second = runner.submit(task, 0.2, keys=["out/a.csv"])
+    time.sleep(0.1)
+    assert runner.status(second)["status"] == "queued"
+    assert "out/a.csv" in runner.busy_keys()
+    wait_done(runner, [first, second])
+    assert state["peak"] == 1
+    assert runner.result(second) == second
+    assert runner.busy_keys() == set()
+
+
+def test_jobs_on_different_keys_run_concurrently():
+    runner = JobRunner(max_workers=2)
+    task, state = tracking_task()
+    jobs = [runner.submit(task, 0.2, keys=[key]) for key in ("out/a.csv", "out/b.csv")]
+    wait_done(runner, jobs)
+    assert state["peak"] == 2
+
+
+def test_finished_jobs_are_forgotten_after_ttl():
+    runner = JobRunner(max_workers=1, finished_ttl=0.1)
+    task, _ = tracking_task()
+    old = runner.submit(task, 0)
+    wait_done(runner, [old])
+    time.sleep(0.2)
+    # L'oubli a lieu à la soumission suivante
+    recent = runner.submit(task, 0)
+    with pytest.raises(KeyError):
+        runner.status(old)
+    wait_done(runner, [recent])
+    assert runner.result(recent) == recent
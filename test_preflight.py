@@ -0,0 +1,48 @@
+import math
+
+from generation_engine import MODEL, prompt_chars
+from pipeline import generate_prompt
+from preflight import call_latency, estimate_run
+from run_metrics import estimate_cost
+
+ROWS = [
+    ["1.1 Qu'est-ce que la portance ?", "Une force", "Un angle", "Une vitesse", "Une masse", "A", ""],
+    ["1.2 Que mesure l'altimètre ?", "La vitesse", "L'altitude", "Le cap", "La pression", "B", ""],
+    ["2.1 Que signifie METAR ?", "Un message", "Une carte", "Une balise", "Un avion", "A", ""],
+    ["2.2 Ligne sans réponse", "Oui", "Non", "Peut-être", "Jamais", "", ""],
+]
+CALIBRATION = {"chars_per_token": 4.0, "output_tokens_per_row": 100, "latency_s": 2.0,
+               "requests_per_minute": 600, "runs": 0}
+
+
+def csv_bytes():
+    lines = ["Question$A$B$C$D$Correct Answer$Explication"] + ["$".join(row) for row in ROWS]
+    return "\n".join(lines).encode("utf-8")
+
+
+def test_estimate_run_totals():
+    estimate = estimate_run([("quiz.csv", csv_bytes())], "V2", max_in_flight=2, calibration=CALIBRATION,
+                            requests_per_minute=600)
+    totals = estimate["totals"]
+    chars = sum(prompt_chars(generate_prompt(list(row), "V2")) for row in ROWS[:3])
+    assert totals["rows"] == 4
+    assert totals["invalid_rows"] == 1
+    assert estimate["files"][0]["invalid_rows"] == [4]
+    assert totals["calls"] == totals["generated_rows"] == 3
+    assert totals["input_tokens"] == math.ceil(chars / 4.0)
+    assert totals["output_tokens"] == 300
+    assert totals["estimated_cost_usd"] == round(estimate_cost(MODEL, totals), 4)
+    # Trois appels de 2 s sur deux requêtes en vol
+    assert totals["wall_time_s"] == 3.0
+
+
+def test_wall_time_floors():
+    files = [("quiz.csv", csv_bytes())]
+    # Débit limité à 6 requêtes par minute : 3 appels prennent 30 s quelle que soit la concurrence
+    slow = estimate_run(files, "V2", max_in_flight=8, calibration=CALIBRATION, requests_per_minute=6)
+    assert slow["totals"]["wall_time_s"] == 30.0
+    # Requêtes groupées par partie : 2 appels, dont un de deux questions
+    packed = estimate_run(files, "V2", max_in_flight=1, pack_size=2, calibration=CALIBRATION,
+                          requests_per_minute=600)
+    assert packed["totals"]["calls"] == 2
+    assert packed["totals"]["wall_time_s"] == round(call_latency(2.0, 2) + call_latency(2.0, 1), 1)
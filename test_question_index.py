@@ -0,0 +1,26 @@
+from question_index import QuestionIndex, normalize
+
+
+def make_index(tmp_path):
+    index = QuestionIndex(tmp_path / "index.sqlite")
+    index.add("1.4 Au niveau de vol FL80, la pression standard vaut environ :", "750 hPa", "V1", "Au FL80...")
+    index.add("2.3 Par une température de +4 °C au sol, l'air est :", "stable", "V1", "À +4 °C...")
+    return index
+
+
+def test_signs_are_kept_by_normalization():
+    assert normalize("+4 °C") != normalize("-4 °C")
+    assert normalize("−4 °C") == normalize("-4 °C")
+
+
+def test_near_match_is_reused(tmp_path):
+    index = make_index(tmp_path)
+    assert index.lookup("3.9 Au niveau de vol FL80 , la pression standard vaut environ?", "750 hPa.",
+                        "V1") == "Au FL80..."
+
+
+def test_near_match_with_other_numbers_is_rejected(tmp_path):
+    index = make_index(tmp_path)
+    assert index.lookup("1.4 Au niveau de vol FL40, la pression standard vaut environ :", "750 hPa", "V1") is None
+    assert index.lookup("1.4 Au niveau de vol FL80, la pression standard vaut environ :", "850 hPa", "V1") is None
+    assert index.lookup("2.3 Par une température de -4 °C au sol, l'air est :", "stable", "V1") is None
@@ -0,0 +1,114 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from conftest import FakeStatusError
+from rate_limiter import (AdaptiveRateLimiter, CircuitBreaker, CircuitOpenError, call_with_retries,
+                          counts_as_failure, parse_retry_after, request_tokens)
+
+
+class RecordingLimiter(AdaptiveRateLimiter):
+    def __init__(self, **kwargs):
+        super().__init__(requests_per_minute=60_000, **kwargs)
+        self.pauses = []
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+        super().pause(seconds)
+
+
+def failing(errors, result="ok"):
+    """Fonction qui lève successivement `errors`, puis renvoie `result` ; compte ses appels."""
+    errors = list(errors)
+    calls = []
+
+    def fn(limiter):
+        calls.append(limiter)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after": "-1"}) == 0.0
+    assert 8 <= parse_retry_after({"retry-after": formatdate(time.time() + 10, usegmt=True)}) <= 10
+    assert parse_retry_after({"retry-after": "bientôt"}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_throttled_call_waits_for_retry_after_then_succeeds():
+    limiter = RecordingLimiter()
+    fn, calls = failing([FakeStatusError(429, {"retry-after": "0.2"})])
+    start = time.monotonic()
+    assert call_with_retries(fn, limiter) == "ok"
+    assert time.monotonic() - start >= 0.2
+    assert len(calls) == 2
+    assert limiter.pauses == [0.2]
+
+
+def test_client_errors_are_raised_at_once_and_leave_the_breaker_closed():
+    limiter = RecordingLimiter(breaker=CircuitBreaker(min_calls=1))
+    fn, calls = failing([FakeStatusError(400)] * 3)
+    for _ in range(3):
+        with pytest.raises(FakeStatusError):
+            call_with_retries(fn, limiter)
+    assert len(calls) == 3
+    limiter.breaker.before_call()
+
+
+def test_server_errors_open_the_breaker():
+    breaker = CircuitBreaker(min_calls=2, cooldown=60)
+    limiter = RecordingLimiter(breaker=breaker)
+    fn, calls = failing([FakeStatusError(503)] * 2)
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(fn, limiter, max_retries=2, base_delay=0)
+    assert len(calls) == 2
+
+
+def test_only_server_errors_and_timeouts_count_as_failures():
+    class APITimeoutError(Exception):
+        pass
+
+    assert counts_as_failure(FakeStatusError(500))
+    assert counts_as_failure(FakeStatusError(408))
+    assert counts_as_failure(APITimeoutError())
+    assert not counts_as_failure(FakeStatusError(429))
+    assert not counts_as_failure(FakeStatusError(529))
+    assert not counts_as_failure(FakeStatusError(401))
+    assert not counts_as_failure(CircuitOpenError(1))
+
+
+def test_limiter_follows_rate_limit_headers():
+    limiter = AdaptiveRateLimiter(requests_per_minute=50)
+    assert limiter.observed_rpm() is None
+    limiter.update_from_headers({"anthropic-ratelimit-requests-limit": "4000",
+                                 "anthropic-ratelimit-requests-remaining": "0"})
+    assert limiter.observed_rpm() == 4000
+    assert limiter.headroom() < 1
+
+
+def test_request_size_is_paced_on_token_limit_headers():
+    from generation_engine import build_message_params, pack_prompts
+
+    prompt = {"system": "s" * 350, "user": "u" * 350}
+    single = request_tokens(build_message_params(prompt))
+    packed = request_tokens(build_message_params(pack_prompts([prompt] * 4)))
+    assert single == (200, 256)
+    # Le bloc système n'est envoyé qu'une fois, les questions le sont toutes
+    assert packed[0] > 2 * single[0] and packed[1] == 4 * single[1]
+
+    limiter = AdaptiveRateLimiter(requests_per_minute=60_000)
+    limiter.update_from_headers({"anthropic-ratelimit-input-tokens-limit": "60000",
+                                 "anthropic-ratelimit-input-tokens-remaining": "0",
+                                 "anthropic-ratelimit-output-tokens-limit": "600000",
+                                 "anthropic-ratelimit-output-tokens-remaining": "600000"})
+    # 60 000 tokens d'entrée par minute : 300 tokens se rechargent en 0,3 s
+    start = time.monotonic()
+    limiter.acquire(300, 256)
+    assert time.monotonic() - start >= 0.25
+    assert limiter.token_buckets["output-tokens"][1] <= 600000 - 256
+    # Sans en-tête "tokens", aucune limite combinée n'est appliquée
+    assert "tokens" not in limiter.token_buckets
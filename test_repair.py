@@ -0,0 +1,79 @@
+from conftest import FakeClient, user_text
+from pipeline import SYSTEM_V1, EnrichedWriter
+from repair import find_error_rows, iter_enriched_rows, repair_file
+from run_journal import RunJournal
+
+
+ROWS = [
+    ["1.1 Question numero un ?", "a", "b", "c", "d", "A", "", "[ERREUR - timeout]"],
+    ["1.2 Deuxième ligne ?", "a", "b", "c", "d", "B", "", "Déjà expliquée."],
+    ["1.3 Troisième ligne ?", "a", "b", "c", "d", "C", "", "[Erreur API 500]"],
+]
+
+
+def answer_question(params):
+    return "Explication de " + user_text(params).split("\n")[0].removeprefix("Question : ")
+
+
+def test_repair_keeps_a_first_row_containing_question(tmp_path):
+    with EnrichedWriter("annale", tmp_path) as writer:
+        for row in ROWS:
+            writer.write(list(row))
+    journal = RunJournal(tmp_path / "annale.journal.jsonl", "hash", "V1")
+    with journal:
+        journal.start(len(ROWS), resume=False)
+        for idx, row in enumerate(ROWS):
+            journal.append(idx, row[7])
+
+    assert find_error_rows(writer.csv_path) == [0, 2]
+    report = repair_file(writer.csv_path, FakeClient(answer_question), "V1", max_in_flight=2)
+
+    rows = list(iter_enriched_rows(writer.csv_path))
+    assert len(rows) == 3
+    assert [row[7] for row in rows] == [
+        "Explication de 1.1 Question numero un ?",
+        "Déjà expliquée.",
+        "Explication de 1.3 Troisième ligne ?",
+    ]
+    assert (report["errors"], report["recovered"], report["remaining"]) == (2, 2, 0)
+    assert journal.load() == {idx: row[7] for idx, row in enumerate(rows)}
+
+
+def test_repair_leaves_invalid_rows_and_counts_rows_still_in_error(tmp_path):
+    rows = [
+        ["2.1 Toujours en erreur ?", "a", "b", "c", "d", "A", "", "[ERREUR - timeout]"],
+        ["2.2 Sans bonne réponse ?", "a", "b", "c", "d", "", "", "[ERREUR - Prompt non généré à la ligne 2]"],
+        ["2.3 Récupérable ?", "a", "b", "c", "d", "B", "", "[ERREUR - timeout]"],
+    ]
+    with EnrichedWriter("annale", tmp_path) as writer:
+        for row in rows:
+            writer.write(list(row))
+
+    def still_failing(params):
+        if "Toujours" in user_text(params):
+            raise RuntimeError("panne")
+        return answer_question(params)
+
+    client = FakeClient(still_failing)
+    report = repair_file(writer.csv_path, client, "V1", max_in_flight=1, rounds=2)
+
+    assert (report["errors"], report["recovered"], report["remaining"]) == (2, 1, 1)
+    assert sum("Toujours" in user_text(params) for params in client.calls) == 2
+    assert [row[7] for row in iter_enriched_rows(writer.csv_path)] == [
+        rows[0][7], rows[1][7], "Explication de 2.3 Récupérable ?"]
+
+
+def test_repair_uses_the_prompt_version_of_the_output_journal(tmp_path):
+    with EnrichedWriter("annale", tmp_path) as writer:
+        for row in ROWS:
+            writer.write(list(row))
+    journal = RunJournal(tmp_path / "annale.journal.jsonl", "hash", "V1")
+    with journal:
+        journal.start(len(ROWS), resume=False)
+
+    client = FakeClient(answer_question)
+    report = repair_file(writer.csv_path, client, "V2", max_in_flight=1)
+
+    assert report["version"] == "V1"
+    assert all(params["system"][0]["text"] == SYSTEM_V1 for params in client.calls)
+    assert sorted(journal.load()) == [0, 2]
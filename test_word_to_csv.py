@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conftest import paragraph_xml, write_docx
+from ingest_annales import ingest_document
+from word_to_csv import (REVIEW_CONFIDENCE, is_valid_question, iter_docx_lines, iter_part_shards, parse_qcm_lines,
+                         parse_qcm_sharded, parse_qcm_text)
+
+
+def parse(text):
+    return list(parse_qcm_lines(text.strip().splitlines()))
+
+
+def test_ocr_letters_map_to_expected_options():
+    (row, confidence), = parse("""
+3.7 En aéromodélisme, un avion « deux axes » se pilote autour des axes de :
+A. roulis et lacet.
+8. roulis uniquement.
+C. tangage et roulis.
+O. tangage et lacet.
+""")
+    assert row[1:5] == ["roulis et lacet.", "roulis uniquement.", "tangage et roulis.", "tangage et lacet."]
+    assert confidence == 1.0
+
+
+def test_ocr_digit_followed_by_number_is_continuation():
+    (row, _), = parse("""
+1.1 À quelle altitude se trouve l'isotherme 0 °C en été ?
+A. une altitude de
+8 000 pieds environ.
+B. 2 000 pieds.
+C. 4 000 pieds.
+D. 6 000 pieds.
+""")
+    assert row[1] == "une altitude de 8 000 pieds environ."
+    assert row[2] == "2 000 pieds."
+
+
+def test_inline_option_a_is_split_from_question():
+    (row, confidence), = parse("""
+1.3 La transformation de l'eau de l'état gazeux à l'état liquide s'appelle : A la fusion.
+B. la sublimation.
+C. l'évaporation.
+D. la condensation.
+""")
+    assert row[0] == "1.3 La transformation de l'eau de l'état gazeux à l'état liquide s'appelle :"
+    assert row[1] == "la fusion."
+    assert confidence == 1.0
+
+
+def test_skipped_letter_leaves_option_empty_and_lowers_confidence():
+    (row, confidence), = parse("""
+2.4 Le facteur de charge d'un avion en virage à plat sous 60° d'inclinaison vaut :
+A. 1.
+B. 1,5.
+D. 2.
+""")
+    assert row[3] == ""
+    assert row[4] == "2."
+    assert confidence < 0.6
+
+
+def test_duplicate_letter_is_counted_as_issue():
+    (row, confidence), = parse("""
+2.5 Le nombre de pales de l'hélice représentée dans la figure est de :
+A. une.
+B. deux.
+B. deux bis.
+C. trois.
+D. quatre.
+""")
+    assert row[2] == "deux. B. deux bis."
+    assert confidence < 1.0
+
+
+def test_lines_after_option_d_are_trailing_and_lower_confidence():
+    scored = parse("""
+1.10 Une ligne qui joint les points d'égale pression est nommée :
+A. une isotherme.
+B. une isocline.
+C. une isohypse.
+D. une isobare.
+Légende de la figure 3
+1.11 Le principal danger induit par le brouillard est :
+A. le givrage.
+B. la turbulence.
+C. la diminution de la visibilité.
+D. la foudre.
+""")
+    assert [row[0].split(" ", 1)[0] for row, _ in scored] == ["1.10", "1.11"]
+    assert scored[0][0][4] == "une isobare."
+    assert scored[0][1] < REVIEW_CONFIDENCE
+    assert scored[1][1] == 1.0
+
+
+def test_wrapped_option_d_keeps_its_continuation():
+    scored = parse("""
+1.12 La finesse maximale d'un planeur est obtenue :
+A. à la vitesse maximale.
+B. à la vitesse minimale.
+C. à l'incidence de décrochage.
+D. à l'incidence pour laquelle le rapport portance sur traînée
+est le plus grand.
+1.13 Le variomètre indique :
+A. la vitesse verticale.
+B. l'altitude.
+C. la vitesse propre.
+D. le cap.
+""")
+    assert scored[0][0][4] == "à l'incidence pour laquelle le rapport portance sur traînée est le plus grand."
+    assert scored[0][1] == 1.0
+    assert scored[1][0][0].startswith("1.13")
+
+
+def test_docx_reader_streams_paragraphs_breaks_tabs_and_table_cells(tmp_path):
+    body = (paragraph_xml("1.1\tQuelle est la couleur du feu de navigation droit ?")
+            + '<w:p><w:r><w:t>A. Rouge</w:t><w:br/><w:t>B. Vert</w:t></w:r></w:p>'
+            + "<w:tbl><w:tr>"
+            + "<w:tc>" + paragraph_xml("C. Blanc") + "</w:tc>"
+            + "<w:tc>" + paragraph_xml("D. Bleu") + "</w:tc>"
+            + "</w:tr></w:tbl>"
+            + paragraph_xml("Fin"))
+    path = write_docx(tmp_path / "annale.docx", body)
+    lines = list(iter_docx_lines(path))
+    assert lines == ["1.1\tQuelle est la couleur du feu de navigation droit ?", "A. Rouge", "B. Vert",
+                     "C. Blanc", "D. Bleu", "Fin"]
+    rows = [row for row, _ in parse_qcm_lines(lines)]
+    assert rows == [["1.1 Quelle est la couleur du feu de navigation droit ?", "Rouge", "Vert", "Blanc", "Bleu", ""]]
+
+    # Hors tableaux, mêmes lignes que l'ancienne lecture python-docx
+    docx = pytest.importorskip("docx")
+    old = "".join(paragraph.text + "\n" for paragraph in docx.Document(str(path)).paragraphs)
+    assert old.splitlines() == [line for line in lines if line not in ("C. Blanc", "D. Bleu")]
+
+
+def multi_part_lines(parts=4, per_part=5):
+    lines = []
+    for part in range(1, parts + 1):
+        for n in range(1, per_part + 1):
+            lines += [f"{part}.{n} Question {n} de la partie {part} en vol ?", "A. Première réponse",
+                      "B. Deuxième réponse", "C. Troisième réponse", "D. Quatrième réponse"]
+        # Ligne de bruit en fin de partie : la question précédente reste à relire
+        lines.append("Fin de la partie")
+    # Même question dans deux parties : le doublon est retiré après le découpage
+    lines += ["1.1 Question 1 de la partie 1 en vol ?", "A. Autre", "B. Autre", "C. Autre", "D. Autre"]
+    return lines
+
+
+def test_sharded_parse_matches_sequential_parse(tmp_path):
+    lines = multi_part_lines()
+    assert len(list(iter_part_shards(lines, min_lines=10))) == 5
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        assert list(parse_qcm_sharded(lines, pool, min_lines=10, window=2)) == list(parse_qcm_lines(lines))
+
+        path = write_docx(tmp_path / "compilation.docx", lines)
+        sequential = ingest_document(path, tmp_path / "seq")
+        sharded = ingest_document(path, tmp_path / "shard", executor=pool, workers=2)
+    assert sequential["duplicates"] == sharded["duplicates"] == 1
+    assert {**sequential, "csv_path": None} == {**sharded, "csv_path": None}
+    assert (tmp_path / "seq" / "compilation.csv").read_text(encoding="utf-8") == \
+        (tmp_path / "shard" / "compilation.csv").read_text(encoding="utf-8")
+
+
+def test_layout_words_lower_confidence_instead_of_rejecting():
+    text = """
+1.1 Une information sur une carte stipule l'ISO 0°C au FL80. Quelle est la bonne affirmation ?
+A. Le vol se fera à +4 °C.
+B. Le vol se fera à -4 °C.
+C. Le vol se fera à -2 °C.
+D. Le vol se fera à +2 °C.
+"""
+    # is_valid_question rejetait toute question contenant « sur » ; elle est désormais exportée
+    assert not is_valid_question("Une information sur une carte", "a" * 5, "b" * 5, "c" * 5, "d" * 5)
+    assert parse(text)[0][1] == 0.8
+    assert [row[0][:3] for row in parse_qcm_text(text)] == ["1.1"]